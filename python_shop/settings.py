@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 
+import django
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'shop.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'python_shop.urls'
@@ -62,12 +65,14 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.csrf',
+                'shop.context_processors.user_groups',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'python_shop.wsgi.application'
+ASGI_APPLICATION = 'python_shop.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -75,8 +80,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Wait for a competing writer instead of failing at once.
+            'timeout': 20,
+        },
     }
 }
+if django.VERSION >= (5, 1):
+    # Checkout reads products and then updates stock in one transaction. With
+    # the default DEFERRED mode two concurrent checkouts both hold read locks,
+    # and the upgrade to a write fails with "database is locked" without
+    # waiting. IMMEDIATE takes the write lock at BEGIN, so the second checkout
+    # waits on the busy timeout instead (option added in Django 5.1).
+    DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -110,6 +126,29 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Shop settings
+# Keyset (cursor) pagination for the product list instead of page numbers.
+SHOP_KEYSET_PAGINATION = False
+# Unix socket of the recommender process (python manage.py run_recommender).
+# None keeps the model inside every web worker.
+SHOP_RECOMMENDER_SOCKET = None
+# Seconds to wait for the recommender process before scoring in-process.
+SHOP_RECOMMENDER_TIMEOUT = 0.5
+# Expose per-process recommender metrics at /metrics (Prometheus text format).
+# Off by default; when on, only staff users and SHOP_METRICS_ALLOWED_IPS can read it.
+SHOP_METRICS_ENABLED = False
+# REMOTE_ADDR values of Prometheus scrapers allowed to read /metrics without logging in.
+SHOP_METRICS_ALLOWED_IPS = ()
+# Per-request profiling (shop/profiling.py). Requests carrying the header
+# X-Shop-Profile: <token> are always profiled; None disables the header.
+SHOP_PROFILE_TOKEN = None
+# Fraction of all requests to profile at random (0.0 = off). With both the token
+# and the sample rate off, the middleware removes itself at startup.
+SHOP_PROFILE_SAMPLE_RATE = 0.0
+SHOP_PROFILE_DIR = BASE_DIR / 'profiles'
+# Keep only this many most recent profiles on disk.
+SHOP_PROFILE_MAX_RECORDS = 500
+
 # Session settings
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
 
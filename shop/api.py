@@ -0,0 +1,178 @@
+"""
+JSON API for recommendations.
+
+  GET  /api/recommend?q=<текст>&top_n=<n>   — поиск по нотам
+  GET  /api/similar/<pk>?top_n=<n>          — похожие товары
+  POST /api/recommend/batch                 — много запросов / pk за один вызов
+       {"queries": [...], "pks": [...], "top_n": 6, "stream": false}
+
+Рекомендации берутся из shop/recommendations.py — тем же путём, что и у
+HTML-представлений (процесс рекомендаций, при недоступности — своя модель).
+Ответ содержит pk, score и минимальную проекцию товара, загруженную через
+.values() одним запросом, без создания моделей и рендеринга шаблонов.
+При "stream": true (или Accept: application/x-ndjson) пакетный ответ отдаётся
+построчно в формате NDJSON — по строке на каждый запрос/pk.
+"""
+import json
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import recommendations
+from .models import Product
+
+MAX_TOP_N      = 50
+MAX_BATCH_SIZE = 100
+
+PROJECTION_FIELDS = ('pk', 'name', 'brand__name', 'category__name',
+                     'price', 'volume', 'image', 'image_url')
+
+
+class _BadRequest(ValueError):
+    pass
+
+
+def _top_n(value, default):
+    try:
+        top_n = int(value if value is not None else default)
+    except (TypeError, ValueError):
+        raise _BadRequest('top_n must be an integer')
+    return max(1, min(top_n, MAX_TOP_N))
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _project(pks) -> dict[int, dict]:
+    """pk → {name, brand, category, price, volume, image} одним запросом."""
+    rows = Product.objects.filter(pk__in=set(pks)).values(*PROJECTION_FIELDS)
+    out = {}
+    for row in rows:
+        out[row['pk']] = {
+            'pk':       row['pk'],
+            'name':     row['name'],
+            'brand':    row['brand__name'],
+            'category': row['category__name'],
+            'price':    row['price'],
+            'volume':   row['volume'],
+            'image':    settings.MEDIA_URL + row['image'] if row['image'] else row['image_url'],
+        }
+    return out
+
+
+def _items(pairs, projection) -> list[dict]:
+    return [
+        {'pk': pk, 'score': round(score, 4), 'product': projection[pk]}
+        for pk, score in pairs if pk in projection
+    ]
+
+
+@require_GET
+def recommend(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return _error('q is required', 400)
+    try:
+        top_n = _top_n(request.GET.get('top_n'), 12)
+    except _BadRequest as e:
+        return _error(str(e), 400)
+    pairs, error = recommendations.query_pairs(query, top_n)
+    if error:
+        return _error(error, 503)
+    return JsonResponse({'query': query, 'results': _items(pairs, _project(pk for pk, _ in pairs))})
+
+
+@require_GET
+def similar(request, pk):
+    try:
+        top_n = _top_n(request.GET.get('top_n'), 6)
+    except _BadRequest as e:
+        return _error(str(e), 400)
+    _, similar_pairs, error = recommendations.batch_pairs([], [pk], top_n)
+    if error:
+        return _error(error, 503)
+    pairs = similar_pairs[0]
+    return JsonResponse({'pk': pk, 'results': _items(pairs, _project(p for p, _ in pairs))})
+
+
+def _parse_batch(request):
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        raise _BadRequest('body must be JSON')
+    if not isinstance(body, dict):
+        raise _BadRequest('body must be a JSON object')
+    queries = body.get('queries') or []
+    pks     = body.get('pks') or []
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        raise _BadRequest('queries must be a list of strings')
+    if not isinstance(pks, list) or not all(isinstance(p, int) for p in pks):
+        raise _BadRequest('pks must be a list of integers')
+    if not queries and not pks:
+        raise _BadRequest('queries or pks is required')
+    if len(queries) + len(pks) > MAX_BATCH_SIZE:
+        raise _BadRequest(f'at most {MAX_BATCH_SIZE} items per batch')
+    stream = bool(body.get('stream')) or 'application/x-ndjson' in request.headers.get('Accept', '')
+    return queries, pks, _top_n(body.get('top_n'), 6), stream
+
+
+@csrf_exempt
+@require_POST
+def batch(request):
+    try:
+        queries, pks, top_n, stream = _parse_batch(request)
+    except _BadRequest as e:
+        return _error(str(e), 400)
+    if stream:
+        # Первый блок считаем сразу: ошибка модели ещё может стать ответом 503
+        blocks = _blocks(queries, pks)
+        first, error = _resolve_batch(*blocks[0], top_n)
+        if error:
+            return _error(error, 503)
+        return StreamingHttpResponse(_stream_batch(first, blocks[1:], top_n),
+                                     content_type='application/x-ndjson')
+    entries, error = _resolve_batch(queries, pks, top_n)
+    if error:
+        return _error(error, 503)
+    return JsonResponse({'results': entries})
+
+
+def _blocks(queries, pks) -> list[tuple[list, list]]:
+    """Запросы и pk блоками по BATCH_BLOCK (сначала запросы, затем pk)."""
+    from shop.recommender import BATCH_BLOCK
+
+    return ([(queries[i:i + BATCH_BLOCK], []) for i in range(0, len(queries), BATCH_BLOCK)]
+            + [([], pks[i:i + BATCH_BLOCK]) for i in range(0, len(pks), BATCH_BLOCK)])
+
+
+def _resolve_batch(queries, pks, top_n):
+    """(записи ответа, error) для запросов и pk."""
+    query_pairs, similar_pairs, error = recommendations.batch_pairs(queries, pks, top_n)
+    if error:
+        return [], error
+    entries = ([{'query': q, 'pairs': p} for q, p in zip(queries, query_pairs)]
+               + [{'pk': pk, 'pairs': p} for pk, p in zip(pks, similar_pairs)])
+    projection = _project(pk for e in entries for pk, _ in e['pairs'])
+    for entry in entries:
+        entry['results'] = _items(entry.pop('pairs'), projection)
+    return entries, None
+
+
+def _stream_batch(first, blocks, top_n):
+    """NDJSON: считаем и отдаём блоками, первый ответ уходит до конца расчёта."""
+    from django.core.serializers.json import DjangoJSONEncoder
+
+    def lines(entries):
+        return (json.dumps(entry, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+                for entry in entries)
+
+    yield from lines(first)
+    for block in blocks:
+        entries, error = _resolve_batch(*block, top_n)
+        if error:
+            yield json.dumps({'error': error}, ensure_ascii=False) + '\n'
+            return
+        yield from lines(entries)
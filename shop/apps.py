@@ -16,6 +16,9 @@ class ShopConfig(AppConfig):
         Выполняется при старте приложения.
         Автоматически запускает импорт датасета только один раз.
         """
+        # Подключаем обработчики сигналов (инвалидация кэшей)
+        from shop import signals  # noqa: F401
+
         # Выполняем только при запуске сервера разработки
         if 'runserver' not in sys.argv and 'runserver_plus' not in sys.argv:
             return
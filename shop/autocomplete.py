@@ -0,0 +1,227 @@
+"""
+shop/autocomplete.py
+=====================
+Подсказки для поля /recommend/ из компактного префиксного индекса в памяти.
+
+  ИСТОЧНИКИ:
+    ноты (top/middle/base), аккорды (main_accords), бренды, названия товаров
+    и словарь TF-IDF обученной модели.
+
+  СТРУКТУРА:
+    Отсортированный массив ключей + bisect: все строки с префиксом p лежат
+    в непрерывном диапазоне [bisect_left(p), bisect_left(p + '\\uffff')).
+    Многословные термины индексируются и по каждому слову
+    («turkish rose» находится по «ro»). Для префиксов с большим диапазоном
+    (> LARGE_RANGE строк) топ подсказок запоминается: для 1–2 символов —
+    при построении, для остальных — при первом обращении.
+
+  ОБНОВЛЕНИЕ:
+    Индекс перестраивается при смене версии каталога или файла модели и не
+    реже раза в REBUILD_INTERVAL секунд — в фоновом потоке, пока запросы
+    обслуживает прежний индекс. Синхронно строится только самый первый индекс;
+    если он не построился (нет таблиц, ошибка БД), ошибка пишется в лог,
+    подсказок нет, а построение повторяется при следующем запросе.
+    Запросы к БД выполняются только при перестройке.
+"""
+
+import bisect
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+
+MAX_LIMIT         = 20
+PRECOMPUTED_DEPTH = 2
+LARGE_RANGE       = 512
+REBUILD_INTERVAL  = 900
+
+# Порядок при равном весе: сначала ноты и аккорды, потом бренды и товары
+KIND_ORDER = {'note': 0, 'accord': 1, 'brand': 2, 'product': 3, 'term': 4}
+
+logger = logging.getLogger(__name__)
+
+_lock       = threading.Lock()
+_index      = None
+_rebuilding = False
+
+
+class PrefixIndex:
+    """Неизменяемый индекс: ключи отсортированы, записи хранятся параллельно."""
+
+    def __init__(self, entries: dict[tuple[str, str], int]):
+        # entries: (text, kind) → weight
+        rows = []
+        for (text, kind), weight in entries.items():
+            words = text.lower().split()
+            for i in range(len(words)):
+                rows.append((' '.join(words[i:]), -weight, KIND_ORDER[kind], text, kind))
+        rows.sort()
+        self._keys    = [r[0] for r in rows]
+        self._entries = [(r[1], r[2], r[3], r[4]) for r in rows]
+        self._top     = self._precompute()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _range(self, prefix):
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + '\uffff', lo)
+        return lo, hi
+
+    def _ranked(self, lo, hi, limit):
+        # Одна запись может попасть в диапазон несколько раз (по разным словам),
+        # поэтому берём кандидатов с запасом и при нехватке — весь диапазон.
+        candidates = heapq.nsmallest(limit * 3, self._entries[lo:hi])
+        out = self._dedupe(candidates, limit)
+        if len(out) < limit and len(candidates) < hi - lo:
+            out = self._dedupe(sorted(self._entries[lo:hi]), limit)
+        return out
+
+    @staticmethod
+    def _dedupe(rows, limit):
+        seen, out = set(), []
+        for neg_weight, order, text, kind in rows:
+            if (text, kind) in seen:
+                continue
+            seen.add((text, kind))
+            out.append({'text': text, 'kind': kind})
+            if len(out) >= limit:
+                break
+        return out
+
+    def _precompute(self):
+        top = {}
+        prefixes = {k[:n] for k in self._keys for n in range(1, PRECOMPUTED_DEPTH + 1)}
+        for p in prefixes:
+            top[p] = self._ranked(*self._range(p), MAX_LIMIT)
+        return top
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[dict]:
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_LIMIT))
+        top = self._top.get(prefix)
+        if top is not None:
+            return top[:limit]
+        lo, hi = self._range(prefix)
+        if hi - lo > LARGE_RANGE:
+            top = self._top[prefix] = self._ranked(lo, hi, MAX_LIMIT)
+            return top[:limit]
+        return self._ranked(lo, hi, limit)
+
+
+# ─────────────────────────────────────────────────────────────────
+# Построение
+# ─────────────────────────────────────────────────────────────────
+
+def _split_notes(value: str) -> list[str]:
+    return [n.strip() for n in (value or '').split(',') if n.strip()]
+
+
+def collect_entries(model=None) -> dict[tuple[str, str], int]:
+    """Собирает (text, kind) → вес из каталога и словаря модели."""
+    from django.db.models import Count
+    from shop.models import Brand, Product
+
+    counts = Counter()
+    rows = Product.objects.values_list('name', 'top_notes', 'middle_notes',
+                                       'base_notes', 'main_accords')
+    for name, top, middle, base, accords in rows.iterator(chunk_size=2000):
+        if name:
+            counts[(name, 'product')] += 1
+        for note in _split_notes(top) + _split_notes(middle) + _split_notes(base):
+            counts[(note.lower(), 'note')] += 1
+        if isinstance(accords, dict):
+            for accord in accords:
+                counts[(str(accord).lower(), 'accord')] += 1
+
+    brands = Brand.objects.annotate(n=Count('product')).values_list('name', 'n')
+    for name, n in brands:
+        if name:
+            counts[(name, 'brand')] += n
+
+    if model is not None:
+        vocabulary = getattr(model.get('vectorizer'), 'vocabulary_', {}) or {}
+        known = {text.lower() for text, _ in counts}
+        for term in vocabulary:
+            if term not in known:
+                counts[(term, 'term')] += 1
+    return dict(counts)
+
+
+def _load_model_quietly():
+    try:
+        from shop.recommender import load_model
+        return load_model()
+    except Exception:
+        return None
+
+
+def _state_tag():
+    from shop import caching
+    try:
+        from shop.recommender import model_tag
+        tag = model_tag()
+    except ImportError:
+        tag = 'none'
+    return caching.catalogue_version(), tag
+
+
+def _build(tag):
+    global _index, _rebuilding
+    try:
+        _index = (tag, time.monotonic(), PrefixIndex(collect_entries(_load_model_quietly())))
+    finally:
+        _rebuilding = False
+
+
+def _build_in_background(tag):
+    from django.db import connection
+    try:
+        _build(tag)
+    except Exception:
+        # Запросы продолжает обслуживать прежний индекс
+        logger.exception('Autocomplete index rebuild failed')
+    finally:
+        connection.close()
+
+
+def _start_rebuild(tag):
+    threading.Thread(target=_build_in_background, args=(tag,), daemon=True).start()
+
+
+def _is_stale(current, tag) -> bool:
+    return current[0] != tag or time.monotonic() - current[1] > REBUILD_INTERVAL
+
+
+def get_index() -> PrefixIndex:
+    """Текущий индекс; устаревший перестраивается в фоне, пока отвечает прежний."""
+    global _rebuilding
+    tag = _state_tag()
+    current = _index
+    if current is None:
+        with _lock:
+            if _index is None:
+                try:
+                    _build(tag)
+                except Exception:
+                    logger.exception('Autocomplete index build failed')
+                    return PrefixIndex({})
+            return _index[2]
+    if _is_stale(current, tag) and not _rebuilding:
+        with _lock:
+            if not _rebuilding:
+                _rebuilding = True
+                _start_rebuild(tag)
+    return current[2]
+
+
+def reset():
+    global _index
+    _index = None
+
+
+def suggest(prefix: str, limit: int = 10) -> list[dict]:
+    return get_index().suggest(prefix, limit)
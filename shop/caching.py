@@ -0,0 +1,76 @@
+"""
+shop/caching.py
+================
+Версия каталога для ключей фрагментного кэша шаблонов.
+
+Версия хранится в django cache и увеличивается при сохранении или удалении
+Product, Brand и Category (signals.py). Ключи фрагментов и ETag каталога
+включают версию, поэтому старые фрагменты просто перестают запрашиваться
+и вытесняются по таймауту.
+
+Карточка товара от версии каталога не зависит: её ключ — pk, updated_at
+и версии её бренда и категории (annotate_card_versions), которые меняются
+только при сохранении или удалении этого бренда или категории. Правка
+одного товара не сбрасывает остальные карточки.
+
+Боковая панель фильтров зависит только от выбранных значений ProductFilter,
+поэтому её ключ (filter_key) строится из этих полей, а не из сырой строки
+запроса: посторонние параметры (utm_*, fbclid …), порядок параметров и
+повторы значений не плодят копии фрагмента.
+"""
+
+import uuid
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+
+CATALOGUE_VERSION_KEY = 'shop:catalogue:version'
+CARD_VERSION_KEY      = 'shop:card:{kind}:{pk}:version'
+
+# Параметры ProductFilter, которые отображает боковая панель
+# (RangeFilter цены приходит как price_min / price_max)
+FILTER_PARAMS = ('brand', 'category', 'volume', 'price_min', 'price_max')
+
+
+def catalogue_version() -> int:
+    return cache.get_or_set(CATALOGUE_VERSION_KEY, 1, timeout=None)
+
+
+def bump_catalogue_version():
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, 1, timeout=None)
+
+
+def filter_key(params) -> str:
+    """Нормализованный набор фильтров из QueryDict: поля по порядку, значения отсортированы."""
+    pairs = []
+    for name in FILTER_PARAMS:
+        values = sorted({v for v in params.getlist(name) if v != ''})
+        pairs += [(name, v) for v in values]
+    return urlencode(pairs)
+
+
+def _card_keys(product) -> tuple[str, str]:
+    return (CARD_VERSION_KEY.format(kind='brand', pk=product.brand_id),
+            CARD_VERSION_KEY.format(kind='category', pk=product.category_id))
+
+
+def annotate_card_versions(products):
+    """Проставляет product.card_version (бренд + категория) одним get_many на страницу."""
+    products = list(products)
+    keys     = {key for product in products for key in _card_keys(product)}
+    versions = cache.get_many(keys)
+    # Случайные значения: после вытеснения ключа версия не повторится
+    missing  = {key: uuid.uuid4().hex for key in keys - versions.keys()}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    for product in products:
+        product.card_version = '-'.join(versions[key] for key in _card_keys(product))
+
+
+def bump_card_version(kind: str, pk):
+    """Сбрасывает карточки товаров бренда (kind='brand') или категории (kind='category')."""
+    cache.set(CARD_VERSION_KEY.format(kind=kind, pk=pk), uuid.uuid4().hex, timeout=None)
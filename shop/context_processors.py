@@ -0,0 +1,32 @@
+"""
+Context processors for the shop application.
+
+Имена групп пользователя загружаются одним запросом и запоминаются на
+объекте request.user, который живёт ровно один HTTP-запрос. Их используют
+шаблоны (user_groups), фильтр has_group и проверка is_seller.
+"""
+from django.utils.functional import SimpleLazyObject
+
+_CACHE_ATTR = '_shop_group_names'
+
+
+def group_names(user) -> frozenset:
+    """Имена групп пользователя; для анонимного — пустое множество."""
+    if not getattr(user, 'is_authenticated', False):
+        return frozenset()
+    names = getattr(user, _CACHE_ATTR, None)
+    if names is None:
+        names = frozenset(user.groups.values_list('name', flat=True))
+        setattr(user, _CACHE_ATTR, names)
+    return names
+
+
+def forget_group_names(user):
+    """Сбрасывает запомненные группы (после изменения членства)."""
+    user.__dict__.pop(_CACHE_ATTR, None)
+
+
+def user_groups(request):
+    """Добавляет в контекст ленивое множество имён групп текущего пользователя."""
+    user = getattr(request, 'user', None)
+    return {'user_groups': SimpleLazyObject(lambda: group_names(user))}
@@ -0,0 +1,221 @@
+"""
+shop/discounts.py
+==================
+Снимок активных скидок в памяти процесса.
+
+  ПОСТРОЕНИЕ:
+    Все скидки, действующие в данный момент (start_date <= now <= end_date,
+    uses < max_uses), загружаются четырьмя запросами и раскладываются в словари:
+      product / category / brand → лучшая товарная скидка,
+      order-скидки, отсортированные по порогу min_order_value,
+      code → промокод.
+
+  ПОГАШЕНИЕ ПРОМОКОДА:
+    Счётчик uses увеличивается только при оформлении заказа, одним условным
+    UPDATE ... SET uses = uses + 1 WHERE uses < max_uses — без потерянных
+    инкрементов и без превышения max_uses при параллельных заказах.
+
+  ИНВАЛИДАЦИЯ:
+    • сохранение / удаление Discount и изменение его M2M-связей (signals.py);
+    • наступление ближайшей границы окна (start_date или end_date любой скидки);
+    • версия в django cache — при общем кэше (Redis/Memcached) изменение в одном
+      воркере сбрасывает снимки во всех остальных. Версия — случайная строка,
+      а не счётчик: после очистки или вытеснения ключа новая версия не совпадёт
+      со старой. Сам кэш опрашивается не чаще раза в VERSION_CHECK_INTERVAL
+      секунд; в своём процессе invalidate() действует сразу.
+
+  Разрешение скидки для товара/корзины превращается в поиск по словарям.
+"""
+
+import bisect
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from shop import metrics
+
+VERSION_KEY = 'shop:discounts:version'
+VERSION_CHECK_INTERVAL = 1.0
+
+_lock     = threading.Lock()
+_snapshot = None
+# Последняя прочитанная из кэша версия и момент чтения (time.monotonic)
+_checked_version = None
+_checked_at      = 0.0
+
+
+@dataclass
+class DiscountSnapshot:
+    version:         str
+    built_at:        datetime
+    next_start:      datetime | None
+    next_end:        datetime | None
+    by_product:      dict = field(default_factory=dict)
+    by_category:     dict = field(default_factory=dict)
+    by_brand:        dict = field(default_factory=dict)
+    order_discounts: list = field(default_factory=list)
+    order_thresholds: list = field(default_factory=list)
+    promo_codes:     dict = field(default_factory=dict)
+
+    def is_stale(self, now, version) -> bool:
+        if version != self.version:
+            return True
+        if self.next_start is not None and now >= self.next_start:
+            return True
+        if self.next_end is not None and now > self.next_end:
+            return True
+        return False
+
+
+# ─────────────────────────────────────────────────────────────────
+# Построение / инвалидация
+# ─────────────────────────────────────────────────────────────────
+
+def _new_version() -> str:
+    return uuid.uuid4().hex
+
+
+def _current_version() -> str:
+    """Версия снимков из кэша; между опросами — запомненное значение."""
+    global _checked_version, _checked_at
+    now = time.monotonic()
+    version = _checked_version
+    if version is None or now - _checked_at >= VERSION_CHECK_INTERVAL:
+        version = cache.get_or_set(VERSION_KEY, _new_version, timeout=None)
+        _checked_version, _checked_at = version, now
+    return version
+
+
+def _keep_best(mapping: dict, key, discount):
+    best = mapping.get(key)
+    if best is None or discount.value > best.value:
+        mapping[key] = discount
+
+
+def build_snapshot(now=None, version=None) -> DiscountSnapshot:
+    """Загружает действующие скидки и строит словари поиска."""
+    from shop.models import Discount
+
+    now     = now or timezone.now()
+    version = _current_version() if version is None else version
+
+    active = list(
+        Discount.objects.filter(start_date__lte=now, end_date__gte=now)
+        .filter(Q(max_uses__isnull=True) | Q(uses__lt=F('max_uses')))
+    )
+    next_start = (
+        Discount.objects.filter(start_date__gt=now)
+        .order_by('start_date').values_list('start_date', flat=True).first()
+    )
+    next_end = min((d.end_date for d in active), default=None)
+
+    snap = DiscountSnapshot(version=version, built_at=now,
+                            next_start=next_start, next_end=next_end)
+
+    product_discounts = {d.pk: d for d in active if d.discount_type == 'product'}
+    if product_discounts:
+        ids = list(product_discounts)
+        for relation, mapping, column in (
+            (Discount.products,   snap.by_product,  'product_id'),
+            (Discount.categories, snap.by_category, 'category_id'),
+            (Discount.brands,     snap.by_brand,    'brand_id'),
+        ):
+            rows = relation.through.objects.filter(discount_id__in=ids) \
+                                           .values_list('discount_id', column)
+            for discount_id, target_id in rows:
+                _keep_best(mapping, target_id, product_discounts[discount_id])
+
+    order_discounts = sorted(
+        (d for d in active if d.discount_type == 'order'),
+        key=lambda d: d.min_order_value or 0,
+    )
+    snap.order_discounts  = order_discounts
+    snap.order_thresholds = [d.min_order_value or 0 for d in order_discounts]
+
+    snap.promo_codes = {
+        d.code: d for d in active if d.discount_type == 'promo' and d.code
+    }
+    return snap
+
+
+def get_snapshot() -> DiscountSnapshot:
+    """Текущий снимок; перестраивается, если устарел по версии или времени."""
+    global _snapshot
+    now     = timezone.now()
+    version = _current_version()
+    snap    = _snapshot
+    if snap is None or snap.is_stale(now, version):
+        with _lock:
+            snap = _snapshot
+            if snap is None or snap.is_stale(now, version):
+                snap = _snapshot = build_snapshot(now, version)
+                metrics.count('shop_cache_requests_total', cache='discounts', result='miss')
+                return snap
+    metrics.count('shop_cache_requests_total', cache='discounts', result='hit')
+    return snap
+
+
+def invalidate():
+    """Сбрасывает снимок в этом процессе и меняет версию для остальных."""
+    global _snapshot, _checked_version
+    _snapshot = None
+    _checked_version = None
+    cache.set(VERSION_KEY, _new_version(), timeout=None)
+
+
+# ─────────────────────────────────────────────────────────────────
+# Поиск
+# ─────────────────────────────────────────────────────────────────
+
+def best_product_discount(product):
+    """Лучшая (по value) товарная скидка для product, либо None."""
+    snap = get_snapshot()
+    candidates = [
+        snap.by_product.get(product.pk),
+        snap.by_category.get(product.category_id),
+        snap.by_brand.get(product.brand_id),
+    ]
+    return max((d for d in candidates if d is not None),
+               key=lambda d: d.value, default=None)
+
+
+def eligible_order_discounts(total):
+    """Order-скидки, чей порог min_order_value не превышает total."""
+    snap = get_snapshot()
+    return snap.order_discounts[:bisect.bisect_right(snap.order_thresholds, total)]
+
+
+def find_promo(code):
+    """Действующий промокод по строке кода, либо None."""
+    return get_snapshot().promo_codes.get(code)
+
+
+def redeem_promo(discount) -> bool:
+    """
+    Атомарно учитывает одно использование промокода.
+
+    False — если промокод за это время исчерпан, удалён или истёк,
+    а также если discount is None.
+    """
+    from shop.models import Discount
+
+    if discount is None:
+        return False
+    now = timezone.now()
+    updated = Discount.objects.filter(
+        pk=discount.pk, start_date__lte=now, end_date__gte=now,
+    ).filter(
+        Q(max_uses__isnull=True) | Q(uses__lt=F('max_uses'))
+    ).update(uses=F('uses') + 1)
+    if updated and discount.max_uses is not None:
+        # update() не посылает post_save — снимок сбрасываем сами
+        invalidate()
+        transaction.on_commit(invalidate)
+    return bool(updated)
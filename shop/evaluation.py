@@ -0,0 +1,625 @@
+"""
+shop/evaluation.py
+===================
+Движок оценки качества рекомендательной модели (evaluate_recommender).
+
+  ОДИН ПРОХОД ПО МОДЕЛИ:
+    Все тестовые запросы кодируются и ранжируются одной матрицей
+    (recommender.get_pks_by_queries), item-to-item — get_similar_pks_batch.
+    Тексты товаров, признаковые строки и «золотой стандарт» считаются
+    один раз в build_context; метрики читают общие результаты, а не
+    переспрашивают модель и не перебирают каталог заново.
+
+  ПАРАЛЛЕЛЬНО:
+    Независимые группы — метрики выдачи, ошибка восстановления и каждая
+    размерность в сравнении n_components — считаются в пуле процессов.
+    Для сравнения размерностей SVD обучается один раз на максимальном
+    ранге, меньшие ранги — усечение его компонент. Контекст наследуется
+    через fork без сериализации; к БД воркеры не обращаются — всё нужное
+    уже в контексте.
+    Без fork (Windows, macOS spawn) или при workers=1 — последовательно.
+"""
+
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+KS               = (1, 3, 5, 10)
+TOP_N            = max(KS)
+ITEM_SOURCES     = 50   # товаров-источников для item-to-item в Coverage
+ITEM_TOP_N       = 6
+MIN_NOTE_OVERLAP = 1    # минимальное пересечение нот для «релевантного» товара
+SVD_SIZES        = (10, 20, 50)
+
+_context = None  # контекст оценки для процессов пула (наследуется при fork)
+
+
+# ─────────────────────────────────────────────────────────────────
+# Общие данные
+# ─────────────────────────────────────────────────────────────────
+
+def product_row(product) -> dict:
+    """Поля товара, нужные метрикам, — без обращений к БД в воркерах."""
+    from shop.recommender import _shop_product_feature_string
+
+    ing  = str(getattr(product, 'ingredients', '') or '')
+    frag = str(getattr(product, 'fragrances', '') or '')
+    desc = str(getattr(product, 'description', '') or '')
+    return {
+        'pk':       product.pk,
+        'name':     product.name,
+        'category': (product.category.name if product.category_id else '').lower(),
+        'text':     (ing + ' ' + frag + ' ' + desc).lower(),
+        'feature':  _shop_product_feature_string(product),
+    }
+
+
+def note_incidence(texts, notes, exact=False):
+    """
+    Разреженная матрица товары × ноты (CSR, 0/1): нота встречается в тексте.
+    exact=False — как подстрока (note in text), exact=True — как отдельное слово.
+
+    Тексты один раз разбиваются на слова (CountVectorizer); нота без пробелов —
+    подстрока текста тогда и только тогда, когда она подстрока одного из его
+    слов, поэтому сравниваются ноты со словарём, а не с каждым товаром.
+    """
+    import numpy as np
+    from scipy import sparse
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    n_products = len(texts)
+    try:
+        words = CountVectorizer(binary=True, lowercase=False, token_pattern=r'\S+',
+                                dtype=np.int32)
+        tokens = words.fit_transform(texts)                       # товары × слова
+        vocab  = words.vocabulary_
+    except ValueError:                                             # пустой словарь
+        tokens, vocab = sparse.csr_matrix((n_products, 0), dtype=np.int32), {}
+
+    rows, cols, direct = [], [], []
+    for j, note in enumerate(notes):
+        if exact:
+            if note in vocab:
+                rows.append(vocab[note])
+                cols.append(j)
+        elif note.split() == [note]:
+            matched = [i for word, i in vocab.items() if note in word]
+            rows += matched
+            cols += [j] * len(matched)
+        else:
+            direct.append(j)  # нота с пробелами — прямая проверка подстроки
+    mapping   = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                                  shape=(len(vocab), len(notes)))
+    incidence = (tokens @ mapping).tolil()
+    for j in direct:
+        for i, text in enumerate(texts):
+            if notes[j] in text:
+                incidence[i, j] = 1
+    return (incidence.tocsr() > 0).astype(np.int32)
+
+
+def query_notes_matrix(queries, notes):
+    """Разреженная матрица запросы × ноты (CSR, 0/1) по ключевым нотам запросов."""
+    import numpy as np
+    from scipy import sparse
+
+    column = {note: j for j, note in enumerate(notes)}
+    rows, cols = [], []
+    for q, (_, _, query_notes) in enumerate(queries):
+        for word in {w.lower() for w in query_notes}:
+            rows.append(q)
+            cols.append(column[word])
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                             shape=(len(queries), len(notes)))
+
+
+def gold_standard(rows, queries, notes=None, query_notes=None):
+    """
+    «Релевантные» товары всех запросов — разреженная матрица запросы × товары
+    (CSR, bool): категория совпадает с ожидаемым семейством ИЛИ ноты товара
+    содержат хотя бы MIN_NOTE_OVERLAP слов запроса (как подстроки).
+    Пересечения нот для всех запросов — одно произведение разреженных матриц.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    if notes is None:
+        notes = sorted({w.lower() for _, _, qn in queries for w in qn})
+    if query_notes is None:
+        query_notes = query_notes_matrix(queries, notes)
+
+    overlap  = query_notes @ note_incidence([r['text'] for r in rows], notes).T
+    by_notes = overlap >= MIN_NOTE_OVERLAP
+
+    # Семейства: сравниваем с различными категориями, а не с каждым товаром
+    categories = sorted({r['category'] for r in rows})
+    cat_index  = {c: i for i, c in enumerate(categories)}
+    product_cat = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32),
+         ([cat_index[r['category']] for r in rows], range(len(rows)))),
+        shape=(len(categories), len(rows)),
+    )
+    fam_rows, fam_cols = [], []
+    for q, (_, family, _) in enumerate(queries):
+        for c, category in enumerate(categories):
+            if family in category or family[:4] in category:
+                fam_rows.append(q)
+                fam_cols.append(c)
+    family_match = sparse.csr_matrix(
+        (np.ones(len(fam_rows), dtype=np.int32), (fam_rows, fam_cols)),
+        shape=(len(queries), len(categories)),
+    ) @ product_cat
+
+    return ((by_notes.astype(np.int32) + family_match) > 0).tocsr()
+
+
+def relevant_rows(ctx, q: int):
+    """Индексы строк товаров (в ctx['products']), релевантных запросу q."""
+    gold = ctx['gold']
+    return gold.indices[gold.indptr[q]:gold.indptr[q + 1]]
+
+
+def _is_relevant(ctx, q: int, pks):
+    import numpy as np
+
+    rows = [ctx['row'].get(pk, -1) for pk in pks]
+    return np.isin(rows, relevant_rows(ctx, q))
+
+
+def build_context(model: dict, products, queries, popularity=None) -> dict:
+    """
+    products   — товары с select_related('brand', 'category');
+    queries    — [(текст, семейство, ключевые ноты), …];
+    popularity — pk → продано штук (для новизны; None — без продаж).
+    """
+    from shop.recommender import get_pks_by_queries, get_similar_pks_batch
+
+    queries = list(queries)
+    rows    = [product_row(p) for p in products]
+    texts   = [q[0] for q in queries]
+    ranked  = get_pks_by_queries(texts, model, top_n=TOP_N)
+    sources = [r['pk'] for r in rows[:ITEM_SOURCES]]
+    notes   = sorted({w.lower() for _, _, qn in queries for w in qn})
+    q_notes = query_notes_matrix(queries, notes)
+    return {
+        'model':       model,
+        'queries':     queries,
+        'products':    rows,
+        'row':         {r['pk']: i for i, r in enumerate(rows)},
+        'ranked':      [[pk for pk, _ in pairs] for pairs in ranked],
+        'similar':     [[pk for pk, _ in pairs]
+                        for pairs in get_similar_pks_batch(sources, model, top_n=ITEM_TOP_N)],
+        'notes':       notes,
+        'query_notes': q_notes,
+        'gold':        gold_standard(rows, queries, notes, q_notes),
+        'popularity':  popularity or {},
+    }
+
+
+def _mean(values, default=0.0) -> float:
+    return sum(values) / len(values) if values else default
+
+
+# ─────────────────────────────────────────────────────────────────
+# Метрики выдачи
+# ─────────────────────────────────────────────────────────────────
+
+def hit_rate_mrr(ctx) -> dict:
+    hit_rates = {str(k): [] for k in KS}
+    mrrs      = {str(k): [] for k in KS}
+    per_query = []
+
+    for q, ((query_text, _, _), ranked) in enumerate(zip(ctx['queries'], ctx['ranked'])):
+        n_relevant = len(relevant_rows(ctx, q))
+        if not n_relevant:
+            continue
+        hits  = _is_relevant(ctx, q, ranked)
+        first = int(hits.argmax()) + 1 if hits.any() else None
+        q_result = {
+            'query':      query_text[:40],
+            'n_relevant': n_relevant,
+            'hit_at':     {},
+            'rr_at':      {},
+        }
+        for k in KS:
+            hit = 1 if first is not None and first <= k else 0
+            rr  = 1.0 / first if hit else 0.0
+            hit_rates[str(k)].append(hit)
+            mrrs[str(k)].append(rr)
+            q_result['hit_at'][str(k)] = hit
+            q_result['rr_at'][str(k)]  = round(rr, 4)
+        per_query.append(q_result)
+
+    return {
+        'hit_rate':  {k: round(_mean(v), 4) for k, v in hit_rates.items()},
+        'mrr':       {k: round(_mean(v), 4) for k, v in mrrs.items()},
+        'per_query': per_query,
+        'n_queries': len(per_query),
+    }
+
+
+def coverage(ctx) -> dict:
+    seen_5, seen_10 = set(), set()
+    for ranked in ctx['ranked']:
+        seen_5.update(ranked[:5])
+        seen_10.update(ranked[:10])
+    for similar in ctx['similar']:
+        seen_10.update(similar)
+
+    total = len(ctx['products'])
+    return {
+        'total_products':     total,
+        'unique_recommended': len(seen_10),
+        'coverage_at_5':      round(len(seen_5) / total * 100, 1) if total else 0.0,
+        'coverage_at_10':     round(len(seen_10) / total * 100, 1) if total else 0.0,
+        'not_recommended':    total - len(seen_10),
+    }
+
+
+def intra_list_similarity(ctx) -> dict:
+    from shop.recommender import intra_list_similarity as ils
+
+    values, per_query = [], []
+    scores = ils([ranked[:10] for ranked in ctx['ranked']], ctx['model'])
+    for (query_text, _, _), value in zip(ctx['queries'], scores.tolist()):
+        if math.isnan(value):  # меньше двух известных модели товаров
+            continue
+        values.append(value)
+        per_query.append({'query': query_text[:40], 'ils': round(value, 4)})
+
+    return {
+        'mean_ils':  round(_mean(values), 4),
+        'per_query': per_query,
+        'ideal_min': 0.3,
+        'ideal_max': 0.5,
+    }
+
+
+def novelty(ctx) -> dict:
+    """Новизна (−log2 доли в продажах) и разнообразие (1 − ILS) топ-10."""
+    from shop.recommender import diversity, novelty as list_novelty
+
+    lists     = [ranked[:10] for ranked in ctx['ranked']]
+    novelties = list_novelty(lists, ctx['popularity'], len(ctx['products'])).tolist()
+    diversities = diversity(lists, ctx['model']).tolist()
+    per_query = [
+        {'query': q[0][:40], 'novelty': round(n, 4), 'diversity': round(d, 4)}
+        for q, n, d in zip(ctx['queries'], novelties, diversities)
+        if not (math.isnan(n) or math.isnan(d))
+    ]
+    return {
+        'mean_novelty':   round(_mean([q['novelty'] for q in per_query]), 4),
+        'mean_diversity': round(_mean([q['diversity'] for q in per_query]), 4),
+        'per_query':      per_query,
+    }
+
+
+def note_drift(ctx) -> dict:
+    """
+    Доля ключевых нот запроса среди слов топ-1 товара. Пересечения для всех
+    запросов — построчное произведение разреженных матриц нот.
+    """
+    import numpy as np
+
+    products = ctx['products']
+    top = [(q, ctx['row'][ranked[0]]) for q, ranked in enumerate(ctx['ranked'])
+           if ranked and ranked[0] in ctx['row'] and ctx['queries'][q][2]]
+    if not top:
+        return {'mean_drift': 1.0, 'details': []}
+
+    queries, rows = [q for q, _ in top], [r for _, r in top]
+    q_notes  = ctx['query_notes'][queries]
+    words    = note_incidence([products[r]['text'] for r in rows], ctx['notes'], exact=True)
+    overlaps = np.asarray(words.multiply(q_notes).sum(axis=1)).ravel()
+    sizes    = np.asarray(q_notes.sum(axis=1)).ravel()
+
+    values, details = [], []
+    for q, row, overlap, size in zip(queries, rows, overlaps, sizes):
+        overlap_pct = overlap / size * 100
+        drift       = 1 - overlap_pct / 100
+        values.append(float(drift))
+        details.append({
+            'query':        ctx['queries'][q][0][:40],
+            'top1_product': products[row]['name'][:40],
+            'query_notes':  list({w.lower() for w in ctx['queries'][q][2]}),
+            'note_overlap': round(float(overlap_pct), 1),
+            'drift':        round(float(drift), 4),
+        })
+
+    return {
+        'mean_drift': round(_mean(values, default=1.0), 4),
+        'details':    details,
+    }
+
+
+# ─────────────────────────────────────────────────────────────────
+# Модель: ошибка восстановления и размерность SVD
+# ─────────────────────────────────────────────────────────────────
+
+def reconstruction_error(ctx) -> dict:
+    import numpy as np
+
+    model = ctx['model']
+    svd   = model['svd']
+    X     = model['vectorizer'].transform([q[0] for q in ctx['queries']])
+
+    # Проецируем в SVD-пространство и восстанавливаем обратно
+    diff  = X.toarray() - svd.transform(X) @ svd.components_
+    error = float(np.linalg.norm(diff, 'fro') / (X.shape[0] * X.shape[1]))
+
+    return {
+        'reconstruction_error':     round(error, 6),
+        'explained_variance_ratio': round(float(np.sum(svd.explained_variance_ratio_) * 100), 2),
+        'n_components':             model.get('n_components', len(svd.explained_variance_ratio_)),
+        'singular_values':          [round(float(v), 4) for v in svd.singular_values_[:20]],
+        'explained_per_component':  [round(float(v) * 100, 3)
+                                     for v in svd.explained_variance_ratio_[:20]],
+    }
+
+
+def svd_sizes(ctx) -> list[int]:
+    """Размерности для сравнения, ограниченные размером матрицы товаров."""
+    n_rows = sum(1 for r in ctx['products'] if r['feature'].strip())
+    limit  = min(n_rows - 1, len(ctx['model']['vectorizer'].vocabulary_) - 1) - 1
+    sizes  = []
+    for n in sorted({*SVD_SIZES, ctx['model'].get('n_components', 100)}):
+        n = min(n, limit)
+        if n >= 1 and n not in sizes:
+            sizes.append(n)
+    return sizes
+
+
+def _svd_sweep(ctx, max_rank: int):
+    """
+    Одно разложение TF-IDF товаров магазина ранга max_rank (кэшируется в
+    контексте). Компоненты TruncatedSVD упорядочены по убыванию сингулярных
+    чисел, поэтому первые k столбцов проекций — разложение ранга k.
+    """
+    if ctx.get('_svd_sweep', (None,))[0] != max_rank:
+        from sklearn.decomposition import TruncatedSVD
+
+        rows = [r for r in ctx['products'] if r['feature'].strip()]
+        vectorizer = ctx['model']['vectorizer']
+        svd = TruncatedSVD(n_components=max_rank, random_state=42)
+        ctx['_svd_sweep'] = (
+            max_rank,
+            [r['pk'] for r in rows],
+            svd.fit_transform(vectorizer.transform([r['feature'] for r in rows])),
+            svd.transform(vectorizer.transform([q[0] for q in ctx['queries']])),
+            svd.explained_variance_ratio_,
+        )
+    return ctx['_svd_sweep'][1:]
+
+
+def svd_comparison_entry(ctx, n_components: int, max_rank: int | None = None) -> dict:
+    """
+    HR@5, Coverage и ILS для SVD ранга n_components на товарах магазина —
+    усечение общего разложения ранга max_rank (по умолчанию — n_components).
+    """
+    import numpy as np
+    from sklearn.preprocessing import normalize
+    from shop.recommender import list_similarity
+
+    pks, shop_reduced, query_reduced, explained = _svd_sweep(ctx, max_rank or n_components)
+
+    shop_n = np.nan_to_num(normalize(shop_reduced[:, :n_components], norm='l2'), nan=0.0)
+    q_n    = np.nan_to_num(normalize(query_reduced[:, :n_components], norm='l2'), nan=0.0)
+    top    = np.argsort(q_n @ shop_n.T, axis=1)[:, ::-1][:, :10]
+
+    hits, seen = [], set()
+    for q, row in enumerate(top):
+        top_pks = [pks[i] for i in row]
+        seen.update(top_pks)
+        hits.append(1 if _is_relevant(ctx, q, top_pks[:5]).any() else 0)
+    ils = [v for v in list_similarity(shop_n, top).tolist() if not math.isnan(v)]
+
+    return {
+        'n_components':       n_components,
+        'hr_at_5':            round(_mean(hits), 4),
+        'coverage':           round(len(seen) / len(pks) * 100, 1) if pks else 0,
+        'ils':                round(_mean(ils), 4),
+        'explained_variance': round(float(np.sum(explained[:n_components]) * 100), 1),
+    }
+
+
+# ─────────────────────────────────────────────────────────────────
+# Запуск
+# ─────────────────────────────────────────────────────────────────
+
+METRICS = {
+    'hit_rate_mrr':          hit_rate_mrr,
+    'coverage':              coverage,
+    'intra_list_similarity': intra_list_similarity,
+    'reconstruction_error':  reconstruction_error,
+    'note_drift':            note_drift,
+    'novelty':               novelty,
+}
+
+
+def _call(func, args):
+    t0 = time.perf_counter()
+    return func(_context, *args), time.perf_counter() - t0
+
+
+def run(ctx, workers: int = 1) -> dict:
+    """
+    Все метрики по контексту; results['timings'] — секунды по группам.
+    Формат совпадает с test_results/metrics_results.json.
+    """
+    global _context
+
+    tasks = [(name, func, ()) for name, func in METRICS.items()]
+    sizes  = svd_sizes(ctx)
+    tasks += [(f'svd_components:{n}', svd_comparison_entry, (n, sizes[-1])) for n in sizes]
+
+    if sizes:
+        _svd_sweep(ctx, sizes[-1])  # до fork: одно разложение на все размерности
+
+    _context = ctx
+    try:
+        if workers > 1 and len(tasks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            # Подключения к БД наследуются, но воркеры их не трогают
+            # (и завершаются через os._exit, не закрывая чужой сокет)
+            with ProcessPoolExecutor(min(workers, len(tasks)),
+                                     mp_context=multiprocessing.get_context('fork')) as pool:
+                futures = [pool.submit(_call, func, args) for _, func, args in tasks]
+                outputs = [f.result() for f in futures]
+        else:
+            outputs = [_call(func, args) for _, func, args in tasks]
+    finally:
+        _context = None
+
+    results = {'svd_components': {'comparison': []}, 'timings': {}}
+    for (name, _, _), (value, seconds) in zip(tasks, outputs):
+        results['timings'][name] = round(seconds, 4)
+        if name.startswith('svd_components:'):
+            results['svd_components']['comparison'].append(value)
+        else:
+            results[name] = value
+    if not results['svd_components']['comparison']:
+        results['svd_components']['error'] = 'Нет строк для сравнения'
+    return results
+
+
+# ─────────────────────────────────────────────────────────────────
+# Воспроизведение журнала запросов
+# ─────────────────────────────────────────────────────────────────
+#
+# JSONL-журнал: одна строка — объект с полем "q" (как в /recommend/?q=)
+# или "query". Файл читается потоково пачками по batch_size; каждая пачка
+# ранжируется одним матричным проходом (get_pks_by_queries) по рабочей
+# модели и, если задана, по модели-кандидату. Устойчивость выдачи между
+# версиями — overlap@k: доля общих товаров в топ-k.
+
+REPLAY_BATCH = 256
+REPLAY_WORST = 20  # запросов с наименьшим overlap@k в отчёте
+REPLAY_SINGLE_SAMPLE = 16  # одиночных замеров на пачку (меньшая пачка — все запросы)
+
+
+def iter_query_log(path, batch_size: int = REPLAY_BATCH, limit: int | None = None,
+                   stats: dict | None = None):
+    """
+    Пачки запросов из JSONL-журнала. Битые строки и пустые запросы
+    пропускаются; stats (если передан) получает счётчики lines/queries/skipped.
+    """
+    import json
+
+    stats = stats if stats is not None else {}
+    stats.update(lines=0, queries=0, skipped=0)
+    batch = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            stats['lines'] += 1
+            try:
+                entry = json.loads(line)
+                query = str(entry.get('q') or entry.get('query') or '').strip()
+            except (ValueError, AttributeError):
+                query = ''
+            if not query:
+                stats['skipped'] += 1
+                continue
+            batch.append(query)
+            stats['queries'] += 1
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+            if limit and stats['queries'] >= limit:
+                break
+    if batch:
+        yield batch
+
+
+def overlap_at_k(first, second, k: int) -> float:
+    """Доля общих pk в топ-k двух выдач (1.0 — обе пусты)."""
+    a, b = set(first[:k]), set(second[:k])
+    size = min(k, max(len(a), len(b)))
+    return len(a & b) / size if size else 1.0
+
+
+def _distribution(values, percentiles=(50, 95, 99)) -> dict:
+    import numpy as np
+
+    if not len(values):
+        return {'n': 0}
+    arr = np.asarray(values, dtype=np.float64)
+    out = {'n': len(arr), 'mean': round(float(arr.mean()), 4)}
+    for q in percentiles:
+        out[f'p{q}'] = round(float(np.percentile(arr, q)), 4)
+    out['max'] = round(float(arr.max()), 4)
+    return out
+
+
+def _single_sample(batch: list[str], size: int = REPLAY_SINGLE_SAMPLE) -> list[str]:
+    """Равномерная выборка запросов пачки для одиночных замеров."""
+    if len(batch) <= size:
+        return batch
+    step = len(batch) / size
+    return [batch[int(i * step)] for i in range(size)]
+
+
+def replay(path, model: dict, candidate: dict | None = None, k: int = 10,
+           batch_size: int = REPLAY_BATCH, limit: int | None = None) -> dict:
+    """
+    Прогон журнала запросов через модель (и кандидата). Задержки:
+      batch_ms_per_query — время пачки / число запросов (пакетный путь);
+      single_ms          — запросы через get_pks_by_query (путь онлайн-запроса
+                           /recommend/): до REPLAY_SINGLE_SAMPLE равномерно
+                           разнесённых запросов каждой пачки.
+    В каждом распределении n — число замеров, по которым взяты перцентили.
+    """
+    import heapq
+    from shop.recommender import get_pks_by_queries, get_pks_by_query
+
+    models  = {'baseline': model, **({'candidate': candidate} if candidate else {})}
+    latency = {name: {'batch': [], 'single': []} for name in models}
+    empty   = dict.fromkeys(models, 0)
+    overlaps, top1, worst = [], 0, []
+    stats   = {}
+
+    for batch in iter_query_log(path, batch_size, limit, stats):
+        ranked = {}
+        for name, m in models.items():
+            t0 = time.perf_counter()
+            ranked[name] = [[pk for pk, _ in pairs]
+                            for pairs in get_pks_by_queries(batch, m, top_n=k)]
+            latency[name]['batch'].append((time.perf_counter() - t0) * 1000 / len(batch))
+            for query in _single_sample(batch):
+                t0 = time.perf_counter()
+                get_pks_by_query(query, m, top_n=k)
+                latency[name]['single'].append((time.perf_counter() - t0) * 1000)
+            empty[name] += sum(1 for r in ranked[name] if not r)
+
+        if candidate is None:
+            continue
+        for query, old, new in zip(batch, ranked['baseline'], ranked['candidate']):
+            value = overlap_at_k(old, new, k)
+            overlaps.append(value)
+            top1 += bool(old and new and old[0] == new[0]) or (not old and not new)
+            # Куча с обратным знаком — храним REPLAY_WORST наименьших
+            item = (-value, query)
+            if len(worst) < REPLAY_WORST:
+                heapq.heappush(worst, item)
+            elif item > worst[0]:
+                heapq.heapreplace(worst, item)
+
+    n = stats.get('queries', 0)
+    result = {
+        'log':     {**stats, 'path': str(path)},
+        'k':       k,
+        'latency': {name: {'batch_ms_per_query': _distribution(v['batch']),
+                           'single_ms':          _distribution(v['single'])}
+                    for name, v in latency.items()},
+        'empty_results': {name: count for name, count in empty.items()},
+    }
+    if candidate is not None:
+        result['overlap'] = {
+            **_distribution(overlaps, percentiles=(5, 25, 50)),
+            'identical_share': round(sum(1 for v in overlaps if v == 1.0) / n, 4) if n else 0.0,
+            'top1_agreement':  round(top1 / n, 4) if n else 0.0,
+            'worst':           [{'query': q[:80], f'overlap@{k}': round(-v, 4)}
+                                for v, q in sorted(worst, reverse=True)],
+        }
+    return result
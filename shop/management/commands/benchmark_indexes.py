@@ -0,0 +1,196 @@
+"""
+Management command: benchmark_indexes
+======================================
+Сравнивает планы и время горячих запросов каталога без индексов и с индексами
+из Meta.indexes (миграция 0003_catalogue_indexes).
+
+  1. Генерирует синтетический каталог (по умолчанию 100 000 товаров),
+     заказы и скидки.
+  2. Удаляет индексы моделей, выполняет запросы (EXPLAIN + медиана времени).
+  3. Создаёт индексы заново и повторяет замеры.
+
+Всё выполняется в отдельной временной базе (как у load_test и тестов Django:
+для SQLite — временный файл), которая удаляется в конце. Рабочая база не
+блокируется, а её схема не меняется даже при аварийном завершении.
+
+Использование:
+    python manage.py benchmark_indexes
+    python manage.py benchmark_indexes --products 20000 --repeat 20
+"""
+
+import json
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.utils import timezone
+
+RESULTS_DIR  = Path('test_results')
+RESULTS_FILE = RESULTS_DIR / 'index_benchmark.json'
+
+
+class Command(BaseCommand):
+    help = 'Замеряет горячие запросы каталога без индексов и с индексами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000,
+                            help='Размер синтетического каталога (default: 100000)')
+        parser.add_argument('--orders', type=int, default=20_000,
+                            help='Количество синтетических заказов (default: 20000)')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Повторов каждого запроса (default: 10)')
+
+    def handle(self, *args, **options):
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write('  БЕНЧМАРК ИНДЕКСОВ КАТАЛОГА')
+        self.stdout.write('='*60 + '\n')
+
+        old_name = connection.settings_dict['NAME']
+        old_test = connection.settings_dict['TEST'].get('NAME')
+        tmp = tempfile.TemporaryDirectory()
+        if connection.vendor == 'sqlite':
+            # Файл, а не :memory: — ANALYZE и EXPLAIN как у файловой базы
+            connection.settings_dict['TEST']['NAME'] = str(Path(tmp.name) / 'benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self._benchmark(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict['TEST']['NAME'] = old_test
+            tmp.cleanup()
+
+        self._print_summary(results)
+
+        RESULTS_DIR.mkdir(exist_ok=True)
+        payload = {
+            'vendor':   connection.vendor,
+            'products': options['products'],
+            'orders':   options['orders'],
+            'repeat':   options['repeat'],
+            'results':  results,
+        }
+        with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Результаты сохранены: {RESULTS_FILE}'))
+
+    def _benchmark(self, options) -> dict:
+        """Замеры во временной базе: данные, запросы без индексов, с индексами."""
+        from shop.models import Brand, Discount, Order, Product
+
+        models  = [Brand, Product, Order, Discount]
+        results = {}
+        self._seed(options['products'], options['orders'])
+
+        self._apply_indexes(models, create=False)
+        try:
+            self.stdout.write('\n► Без индексов')
+            results['before'] = self._run_queries(options['repeat'])
+        finally:
+            # Индексы возвращаются и при ошибке замера
+            self._apply_indexes(models, create=True)
+        self.stdout.write('\n► С индексами')
+        results['after'] = self._run_queries(options['repeat'])
+        return results
+
+    def _apply_indexes(self, models, create):
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    if create:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        # Обновляем статистику планировщика под текущий набор индексов
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    # ─────────────────────────────────────────────────────────
+    # Данные
+    # ─────────────────────────────────────────────────────────
+
+    def _seed(self, n_products, n_orders):
+        from django.contrib.auth.models import User
+        from shop.models import Discount, Order
+        from shop.synthetic import seed_catalogue
+
+        self.stdout.write(f'  Генерирую каталог: {n_products} товаров …')
+        seed_catalogue(n_products)
+
+        rng  = random.Random(42)
+        user = User.objects.create_user(username='benchmark_indexes_user')
+        statuses = [s for s, _ in Order.STATUS_CHOICES]
+        Order.objects.bulk_create(
+            [Order(user=user, status=rng.choice(statuses), total_price=rng.randint(50, 500))
+             for _ in range(n_orders)],
+            batch_size=2000,
+        )
+
+        now = timezone.now()
+        types = [t for t, _ in Discount.DISCOUNT_TYPES]
+        Discount.objects.bulk_create([
+            Discount(
+                discount_type=rng.choice(types), value_type='percentage',
+                value=rng.randint(5, 30),
+                start_date=now + timezone.timedelta(days=rng.randint(-60, 30)),
+                end_date=now + timezone.timedelta(days=rng.randint(1, 90)),
+                code=f'BENCH{i:05d}',
+            )
+            for i in range(2000)
+        ])
+        self.stdout.write(f'  Заказов: {n_orders}, скидок: 2000')
+
+    # ─────────────────────────────────────────────────────────
+    # Замеры
+    # ─────────────────────────────────────────────────────────
+
+    def _queries(self):
+        from shop.models import Discount, Order, Product
+
+        now  = timezone.now()
+        name = Product.objects.order_by('-pk').values_list('name', flat=True).first()
+        return {
+            'product_list': lambda: Product.objects.select_related('brand', 'category')
+                                                   .order_by('brand__name', 'name')[:25],
+            'import_lookup': lambda: Product.objects.filter(name=name),
+            'active_discounts': lambda: Discount.objects.filter(
+                discount_type='product', start_date__lte=now, end_date__gte=now),
+            'orders_by_status': lambda: Order.objects.filter(status='Pending')
+                                                     .order_by('-created_at')[:100],
+        }
+
+    def _run_queries(self, repeat):
+        out = {}
+        for label, make_qs in self._queries().items():
+            plan = make_qs().explain()
+            list(make_qs())  # прогрев
+            timings = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                list(make_qs())
+                timings.append((time.perf_counter() - t0) * 1000)
+            out[label] = {
+                'plan':      plan,
+                'median_ms': round(statistics.median(timings), 3),
+                'min_ms':    round(min(timings), 3),
+            }
+            self.stdout.write(f'  {label:<18} {out[label]["median_ms"]:>9.3f} мс')
+            for line in plan.splitlines():
+                self.stdout.write(f'      {line}')
+        return out
+
+    def _print_summary(self, results):
+        self.stdout.write('\n' + '─'*60)
+        self.stdout.write(f'  {"Запрос":<18} {"до, мс":>10} {"после, мс":>10} {"ускорение":>10}')
+        for label, before in results['before'].items():
+            after   = results['after'][label]
+            speedup = before['median_ms'] / after['median_ms'] if after['median_ms'] else 0
+            self.stdout.write(
+                f'  {label:<18} {before["median_ms"]:>10.3f} {after["median_ms"]:>10.3f} '
+                f'{speedup:>9.1f}×'
+            )
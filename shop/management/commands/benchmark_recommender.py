@@ -0,0 +1,326 @@
+"""
+Management command: benchmark_recommender
+==========================================
+Воспроизводимый бенчмарк рекомендательной модели на синтетических каталогах.
+
+Для каждого размера каталога (по умолчанию 1k, 10k, 100k; 1M — через --sizes):
+  1. Генерирует признаковые строки товаров (shop/synthetic.py, ноты по Ципфу)
+     и справочный корпус в формате pelegelraz — без БД и без сети.
+  2. Обучает модель (recommender.fit_model) и замеряет время обучения.
+  3. Замеряет загрузку модели из pickle (медиана нескольких повторов).
+  4. Замеряет задержку поиска по запросу и item-to-item (после прогрева):
+     mean / p50 / p95 / p99 / max, time.perf_counter.
+  5. Замеряет пропускную способность в N потоках и N процессах (fork).
+  6. Фиксирует пиковый RSS: каждый размер замеряется в отдельном свежем
+     процессе (spawn), поэтому пик не наследуется от предыдущих размеров;
+     отдельно — пик самого большого процесса пула (RUSAGE_CHILDREN).
+
+Результат — JSON (test_results/recommender_benchmark.json) с версиями
+библиотек и коммитом; --baseline сравнивает с прошлым прогоном и завершается
+ошибкой, если метрика ухудшилась больше чем на --tolerance.
+
+Использование:
+    python manage.py benchmark_recommender
+    python manage.py benchmark_recommender --sizes 1000,10000,100000,1000000
+    python manage.py benchmark_recommender --baseline old.json --tolerance 0.25
+"""
+
+import json
+import multiprocessing
+import os
+import pickle
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+RESULTS_DIR  = Path('test_results')
+RESULTS_FILE = RESULTS_DIR / 'recommender_benchmark.json'
+
+# Метрики для сравнения с --baseline: (путь, чем меньше — тем лучше)
+COMPARED = [
+    (('load_ms',),                      True),
+    (('query_ms', 'p50'),               True),
+    (('query_ms', 'p95'),               True),
+    (('item_ms', 'p50'),                True),
+    (('item_ms', 'p95'),                True),
+    (('throughput', 'threads_qps'),     False),
+    (('throughput', 'processes_qps'),   False),
+]
+
+_worker_model = None  # модель для процессов пула (наследуется при fork)
+
+
+def _run_queries(queries, top_n=12):
+    from shop.recommender import get_pks_by_query
+    for q in queries:
+        get_pks_by_query(q, _worker_model, top_n=top_n)
+    return len(queries)
+
+
+def _latency(samples_ns) -> dict:
+    import numpy as np
+    ms = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    return {
+        'n':    len(ms),
+        'mean': round(float(ms.mean()), 4),
+        'p50':  round(float(np.percentile(ms, 50)), 4),
+        'p95':  round(float(np.percentile(ms, 95)), 4),
+        'p99':  round(float(np.percentile(ms, 99)), 4),
+        'max':  round(float(ms.max()), 4),
+    }
+
+
+def _peak_rss_mb(who='self'):
+    """
+    Пиковый RSS за жизнь процесса (who='self') или самого большого
+    завершённого дочернего процесса (who='children'), МБ.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    target = resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN
+    peak = resource.getrusage(target).ru_maxrss
+    # Linux — килобайты, macOS — байты
+    return round(peak / (1024 * 1024 if platform.system() == 'Darwin' else 1024), 1)
+
+
+def _setup_django():
+    import django
+    django.setup()
+
+
+# ─────────────────────────────────────────────────────────────────
+# Замеры (выполняются в отдельном процессе на каждый размер)
+# ─────────────────────────────────────────────────────────────────
+
+def _bench_size(n, reference, options):
+    """(результат, строки отчёта) для каталога из n товаров."""
+    from shop.recommender import (
+        _pelegelraz_feature_string, fit_model, get_pks_by_query, get_similar_pks,
+    )
+    from shop.synthetic import NOTES, feature_strings
+
+    lines = []
+    rng = random.Random(options['seed'])
+    pks, strings = [], []
+    for pk, fs in feature_strings(n, seed=options['seed']):
+        pks.append(pk)
+        strings.append(fs)
+
+    t0 = time.perf_counter()
+    model = fit_model([_pelegelraz_feature_string(r) for r in reference], strings, pks)
+    build_s = time.perf_counter() - t0
+    del strings
+    lines.append(f'  Обучение             : {build_s:.2f} с '
+                 f'({model["vocab_size"]} токенов, {model["n_components"]} компонент)')
+
+    load_ms = _load_time(model)
+    lines.append(f'  Загрузка pickle      : {load_ms:.1f} мс')
+
+    total   = options['warmup'] + options['queries']
+    queries = [' '.join(rng.sample(NOTES, rng.randint(1, 4))) for _ in range(total)]
+    items   = [rng.choice(pks) for _ in range(total)]
+
+    query_ms = _timed(lambda q: get_pks_by_query(q, model, top_n=12), queries, options['warmup'])
+    item_ms  = _timed(lambda pk: get_similar_pks(pk, model, top_n=6), items, options['warmup'])
+    lines.append(f'  Запрос, мс           : p50 {query_ms["p50"]:.3f}  '
+                 f'p95 {query_ms["p95"]:.3f}  p99 {query_ms["p99"]:.3f}')
+    lines.append(f'  Item-to-item, мс     : p50 {item_ms["p50"]:.3f}  '
+                 f'p95 {item_ms["p95"]:.3f}  p99 {item_ms["p99"]:.3f}')
+
+    throughput = _throughput(model, queries[options['warmup']:], options['workers'])
+    lines.append(f'  Пропускная, запр/с   : {throughput["threads_qps"]} '
+                 f'({options["workers"]} потоков), '
+                 f'{throughput["processes_qps"]} ({options["workers"]} процессов)')
+
+    peak, worker_peak = _peak_rss_mb('self'), _peak_rss_mb('children')
+    lines.append(f'  Пиковый RSS, МБ      : {peak} (процесс замера), '
+                 f'{worker_peak} (крупнейший процесс пула)')
+    return {
+        'n_products':         n,
+        'vocab_size':         model['vocab_size'],
+        'n_components':       model['n_components'],
+        'matrix_mb':          round(model['shop_reduced_norm'].nbytes / 1024 / 1024, 1),
+        'build_s':            round(build_s, 3),
+        'load_ms':            round(load_ms, 3),
+        'query_ms':           query_ms,
+        'item_ms':            item_ms,
+        'throughput':         throughput,
+        'peak_rss_mb':        peak,
+        'worker_peak_rss_mb': worker_peak,
+    }, lines
+
+
+def _load_time(model, repeat=5):
+    import statistics
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'model.pkl'
+        with open(path, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            with open(path, 'rb') as f:
+                pickle.load(f)
+            timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings)
+
+
+def _timed(call, args, warmup):
+    for a in args[:warmup]:
+        call(a)
+    samples = []
+    for a in args[warmup:]:
+        t0 = time.perf_counter_ns()
+        call(a)
+        samples.append(time.perf_counter_ns() - t0)
+    return _latency(samples)
+
+
+def _throughput(model, queries, workers):
+    global _worker_model
+    _worker_model = model
+    chunks = [queries[i::workers] for i in range(workers)]
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        done = sum(pool.map(_run_queries, chunks))
+    threads_qps = round(done / (time.perf_counter() - t0), 1)
+
+    processes_qps = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(workers) as pool:
+            pool.map(_run_queries, [c[:1] for c in chunks])  # прогрев процессов
+            t0 = time.perf_counter()
+            done = sum(pool.map(_run_queries, chunks))
+            processes_qps = round(done / (time.perf_counter() - t0), 1)
+    _worker_model = None
+    return {'threads_qps': threads_qps, 'processes_qps': processes_qps}
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк модели рекомендаций на синтетических каталогах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Размеры каталогов через запятую (default: 1000,10000,100000)')
+        parser.add_argument('--reference', type=int, default=5000,
+                            help='Записей справочного корпуса для SVD (default: 5000)')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Запросов на замер задержки (default: 200)')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Запросов на прогрев (default: 20)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Потоков / процессов для замера пропускной способности (default: 4)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=str(RESULTS_FILE),
+                            help=f'Файл результатов (default: {RESULTS_FILE})')
+        parser.add_argument('--baseline', default=None,
+                            help='JSON прошлого прогона для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимое ухудшение относительно baseline (default: 0.2)')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy
+            import sklearn
+        except ImportError:
+            raise CommandError('Установите scikit-learn: pip install scikit-learn --timeout 120')
+        from shop.synthetic import reference_records
+
+        try:
+            sizes = [int(s) for s in options['sizes'].split(',') if s.strip()]
+        except ValueError:
+            raise CommandError('--sizes: ожидаются целые числа через запятую')
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write('  БЕНЧМАРК РЕКОМЕНДАТЕЛЬНОЙ МОДЕЛИ')
+        self.stdout.write('='*60)
+
+        reference = reference_records(options['reference'], seed=options['seed'])
+        results = {
+            'meta': {
+                'commit':    _git_commit(),
+                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'python':    platform.python_version(),
+                'numpy':     numpy.__version__,
+                'sklearn':   sklearn.__version__,
+                'cpu_count': os.cpu_count(),
+                'options':   {k: options[k] for k in
+                              ('sizes', 'reference', 'queries', 'warmup', 'workers', 'seed')},
+            },
+            'sizes': {},
+        }
+        bench_options = {k: options[k] for k in ('queries', 'warmup', 'workers', 'seed')}
+        for n in sorted(sizes):
+            self.stdout.write(f'\n► Каталог: {n} товаров')
+            # Свежий процесс на размер: ru_maxrss — пик за жизнь процесса
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_setup_django) as pool:
+                result, lines = pool.submit(_bench_size, n, reference, bench_options).result()
+            for line in lines:
+                self.stdout.write(line)
+            results['sizes'][str(n)] = result
+
+        output = Path(options['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Результаты сохранены: {output}'))
+
+        if options['baseline']:
+            self._compare(results, options['baseline'], options['tolerance'])
+
+    # ─────────────────────────────────────────────────────────
+    # Сравнение с baseline
+    # ─────────────────────────────────────────────────────────
+
+    def _compare(self, results, baseline_path, tolerance):
+        try:
+            with open(baseline_path, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Не удалось прочитать baseline: {e}')
+
+        self.stdout.write('\n' + '─'*60)
+        self.stdout.write(f'  Сравнение с {baseline_path} '
+                          f'(коммит {baseline.get("meta", {}).get("commit")})')
+        regressions = []
+        for size, current in results['sizes'].items():
+            previous = baseline.get('sizes', {}).get(size)
+            if not previous:
+                continue
+            for path, lower_is_better in COMPARED:
+                old, new = previous, current
+                for key in path:
+                    old, new = (old or {}).get(key), (new or {}).get(key)
+                if not old or not new:
+                    continue
+                ratio = new / old if lower_is_better else old / new
+                label = f'{size}:{".".join(path)}'
+                marker = ''
+                if ratio > 1 + tolerance:
+                    regressions.append(label)
+                    marker = '  ✗ регрессия'
+                self.stdout.write(f'  {label:<32} {old:>10} → {new:<10} ×{ratio:.2f}{marker}')
+
+        if regressions:
+            raise CommandError(f'Регрессии больше {tolerance:.0%}: {", ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS('✓ Регрессий нет'))
@@ -10,32 +10,43 @@ Management command: evaluate_recommender
   5. Reconstruction Error  — ошибка восстановления TF-IDF матрицы
   6. Note Drift        — совпадение нот запроса с нотами топ-1 ответа
   7. SVD n_components  — сравнение качества при разных размерностях
+  8. Novelty / Diversity — новизна (−log2 доли в продажах) и 1 − ILS
 
 «Золотой стандарт» строится автоматически:
   Релевантным считается товар, у которого совпадает категория (семейство аромата)
-  С запросом И пересечение нот с запросом не менее MIN_NOTE_OVERLAP слов.
+  с запросом ИЛИ пересечение нот с запросом не менее MIN_NOTE_OVERLAP слов.
+
+Расчёт — shop/evaluation.py: все запросы ранжируются одним матричным проходом,
+результаты общие для всех метрик, независимые группы (в т. ч. каждая
+размерность SVD) считаются параллельно в --workers процессах.
 
 Запуск:
     python manage.py evaluate_recommender
+    python manage.py evaluate_recommender --workers 4
 
 Результаты сохраняются в test_results/metrics_results.json
+
+Воспроизведение журнала запросов (--replay): JSONL-файл с объектами
+{"q": "…"} читается потоково пачками и прогоняется через рабочую модель
+и, с --candidate, через переобученную. Отчёт — задержки (p50/p95/p99)
+и устойчивость выдачи overlap@k; --min-overlap завершает команду ошибкой,
+если средний overlap ниже порога (проверка перед заменой модели).
+
+    python manage.py evaluate_recommender --replay queries.jsonl \
+        --candidate ml_models/candidate.pkl --k 10 --min-overlap 0.7
+
+Результаты сохраняются в test_results/replay_results.json
 """
 
 import json
 import time
-import pickle
-import numpy as np
 from pathlib import Path
-from collections import defaultdict
 from django.core.management.base import BaseCommand, CommandError
 
 
 RESULTS_DIR  = Path('test_results')
 RESULTS_FILE = RESULTS_DIR / 'metrics_results.json'
-MODEL_PATH   = Path('ml_models/recommender_model.pkl')
-
-# Минимальное пересечение нот для признания товара «релевантным»
-MIN_NOTE_OVERLAP = 1
+REPLAY_FILE  = RESULTS_DIR / 'replay_results.json'
 
 # Тестовые запросы с указанием ожидаемого семейства аромата
 # Формат: (текст запроса, ожидаемое семейство, ключевые ноты)
@@ -56,6 +67,23 @@ TEST_QUERIES = [
 class Command(BaseCommand):
     help = 'Рассчитывает метрики качества рекомендательной модели.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Процессов для независимых групп метрик; fork только '
+                                 'при значении больше 1 (default: 1)')
+        parser.add_argument('--replay', default=None,
+                            help='JSONL-журнал запросов для воспроизведения')
+        parser.add_argument('--candidate', default=None,
+                            help='Pickle модели-кандидата для сравнения overlap@k')
+        parser.add_argument('--k', type=int, default=10,
+                            help='Глубина выдачи для overlap@k (default: 10)')
+        parser.add_argument('--batch-size', type=int, default=256,
+                            help='Запросов в пачке при воспроизведении (default: 256)')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Не больше N запросов из журнала')
+        parser.add_argument('--min-overlap', type=float, default=None,
+                            help='Минимальный средний overlap@k с кандидатом')
+
     def handle(self, *args, **options):
         RESULTS_DIR.mkdir(exist_ok=True)
 
@@ -65,9 +93,11 @@ class Command(BaseCommand):
 
         # Загрузка зависимостей
         try:
-            from sklearn.metrics.pairwise import cosine_similarity
-            from shop.recommender import load_model, get_pks_by_query, get_similar_pks
-            from shop.models import Product
+            import sklearn  # noqa: F401
+            from shop import evaluation
+            from shop.recommender import load_model
+            from django.db.models import Sum
+            from shop.models import OrderItem, Product
         except ImportError as e:
             raise CommandError(f'Импорт: {e}')
 
@@ -77,18 +107,32 @@ class Command(BaseCommand):
                 'Модель не обучена. Запустите: python manage.py train_recommender'
             )
 
-        # Загрузка всех товаров
+        if options['replay']:
+            return self._replay(model, options)
+
+        # Загрузка всех товаров — один запрос
         all_products = list(
-            Product.objects.select_related('category').order_by('id')
+            Product.objects.select_related('brand', 'category').order_by('id')
         )
         self.stdout.write(f'Товаров в каталоге: {len(all_products)}\n')
 
-        results = {}
+        popularity = dict(
+            OrderItem.objects.values_list('product_id').annotate(sold=Sum('quantity'))
+        )
+
+        t0 = time.perf_counter()
+        ctx = evaluation.build_context(model, all_products, TEST_QUERIES, popularity)
+        prepared_s = time.perf_counter() - t0
+        results = evaluation.run(ctx, workers=max(1, options['workers']))
+        elapsed_s = time.perf_counter() - t0
+        self.stdout.write(
+            f'Расчёт: {elapsed_s:.2f} с (подготовка {prepared_s:.2f} с, '
+            f'процессов: {options["workers"]})\n'
+        )
 
         # ── 1. Hit Rate @ K и MRR ────────────────────────────────
         self.stdout.write('► Метрика 1-2: Hit Rate@K и MRR ...')
-        hr_mrr = self._calc_hit_rate_mrr(model, all_products, get_pks_by_query)
-        results['hit_rate_mrr'] = hr_mrr
+        hr_mrr = results['hit_rate_mrr']
         for k in [1, 3, 5, 10]:
             self.stdout.write(
                 f'  HR@{k:<2} = {hr_mrr["hit_rate"][str(k)]:.3f}  |  '
@@ -98,8 +142,7 @@ class Command(BaseCommand):
 
         # ── 2. Coverage ──────────────────────────────────────────
         self.stdout.write('► Метрика 3: Coverage (покрытие каталога) ...')
-        cov = self._calc_coverage(model, all_products, get_pks_by_query)
-        results['coverage'] = cov
+        cov = results['coverage']
         self.stdout.write(
             f'  Coverage@10 = {cov["coverage_at_10"]:.1f}%  |  '
             f'Coverage@5  = {cov["coverage_at_5"]:.1f}%\n'
@@ -110,8 +153,7 @@ class Command(BaseCommand):
 
         # ── 3. Intra-list Similarity ─────────────────────────────
         self.stdout.write('► Метрика 4: Intra-list Similarity (разнообразие выдачи) ...')
-        ils = self._calc_intra_list_similarity(model, all_products, get_pks_by_query)
-        results['intra_list_similarity'] = ils
+        ils = results['intra_list_similarity']
         self.stdout.write(
             f'  Средняя ILS = {ils["mean_ils"]:.4f}  '
             f'(идеал: 0.3–0.5, ближе к 0 = копии, к 1 = хаос)'
@@ -120,8 +162,7 @@ class Command(BaseCommand):
 
         # ── 4. Reconstruction Error ──────────────────────────────
         self.stdout.write('► Метрика 5: Reconstruction Error TF-IDF матрицы ...')
-        rec = self._calc_reconstruction_error(model)
-        results['reconstruction_error'] = rec
+        rec = results['reconstruction_error']
         self.stdout.write(
             f'  Ошибка восстановления : {rec["reconstruction_error"]:.6f}\n'
             f'  Объяснённая дисперсия : {rec["explained_variance_ratio"]:.1f}%\n'
@@ -131,8 +172,7 @@ class Command(BaseCommand):
 
         # ── 5. Note Drift ────────────────────────────────────────
         self.stdout.write('► Метрика 6: Note Drift (дрейф нот) ...')
-        nd = self._calc_note_drift(model, all_products, get_pks_by_query)
-        results['note_drift'] = nd
+        nd = results['note_drift']
         self.stdout.write(
             f'  Средний дрейф нот = {nd["mean_drift"]:.3f}  '
             f'(0 = идеально, 1 = полный дрейф)'
@@ -146,8 +186,7 @@ class Command(BaseCommand):
 
         # ── 6. SVD n_components сравнение ────────────────────────
         self.stdout.write('► Метрика 7: Влияние n_components на качество ...')
-        svd_comp = self._calc_svd_comparison(model, all_products)
-        results['svd_components'] = svd_comp
+        svd_comp = results['svd_components']
         for entry in svd_comp['comparison']:
             self.stdout.write(
                 f'  n={entry["n_components"]:>4}: '
@@ -157,6 +196,15 @@ class Command(BaseCommand):
             )
         self.stdout.write()
 
+        # ── 7. Новизна и разнообразие ────────────────────────────
+        self.stdout.write('► Метрика 8: Novelty и Diversity ...')
+        nov = results['novelty']
+        self.stdout.write(
+            f'  Средняя новизна       = {nov["mean_novelty"]:.3f} бит\n'
+            f'  Среднее разнообразие  = {nov["mean_diversity"]:.4f}  (1 − ILS)'
+        )
+        self.stdout.write()
+
         # ── Сохранение ───────────────────────────────────────────
         results['meta'] = {
             'timestamp':    time.strftime('%Y-%m-%d %H:%M:%S'),
@@ -164,6 +212,8 @@ class Command(BaseCommand):
             'n_queries':    len(TEST_QUERIES),
             'n_components': model.get('n_components', '?'),
             'vocab_size':   model.get('vocab_size', '?'),
+            'workers':      options['workers'],
+            'elapsed_s':    round(elapsed_s, 3),
         }
 
         with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
@@ -177,345 +227,69 @@ class Command(BaseCommand):
         ))
 
     # ─────────────────────────────────────────────────────────────
-    # Hit Rate @ K и MRR
-    # ─────────────────────────────────────────────────────────────
-
-    def _build_gold_standard(self, query_notes, query_family, all_products):
-        """
-        Для каждого тестового запроса определяет «релевантные» товары.
-        Критерий: категория совпадает с ожидаемым семейством
-                  ИЛИ ноты товара содержат хотя бы одно слово из запроса.
-        """
-        query_words = set(w.lower() for w in query_notes)
-        relevant_pks = set()
-
-        for p in all_products:
-            cat = (p.category.name if p.category_id else '').lower()
-
-            # Критерий 1: совпадение семейства
-            family_match = any(fam in cat for fam in [query_family] +
-                               [query_family[:4]])
-
-            # Критерий 2: совпадение нот
-            ing = str(getattr(p, 'ingredients', '') or '')
-            frag = str(getattr(p, 'fragrances', '') or '')
-            desc = str(getattr(p, 'description', '') or '')
-            product_text = (ing + ' ' + frag + ' ' + desc).lower()
-            note_overlap = sum(1 for w in query_words if w in product_text)
-
-            if family_match or note_overlap >= MIN_NOTE_OVERLAP:
-                relevant_pks.add(p.pk)
-
-        return relevant_pks
-
-    def _calc_hit_rate_mrr(self, model, all_products, get_pks_by_query):
-        Ks = [1, 3, 5, 10]
-        hit_rates = {str(k): [] for k in Ks}
-        mrrs      = {str(k): [] for k in Ks}
-        per_query = []
-
-        for query_text, query_family, query_notes in TEST_QUERIES:
-            relevant = self._build_gold_standard(query_notes, query_family, all_products)
-            if not relevant:
-                continue
-
-            pairs = get_pks_by_query(query_text, model, top_n=max(Ks))
-            ranked_pks = [pk for pk, _ in pairs]
-
-            q_result = {
-                'query': query_text[:40],
-                'n_relevant': len(relevant),
-                'hit_at': {},
-                'rr_at': {},
-            }
-
-            for k in Ks:
-                top_k = ranked_pks[:k]
-                hit = 1 if any(pk in relevant for pk in top_k) else 0
-                hit_rates[str(k)].append(hit)
-
-                # Reciprocal Rank
-                rr = 0.0
-                for rank, pk in enumerate(top_k, start=1):
-                    if pk in relevant:
-                        rr = 1.0 / rank
-                        break
-                mrrs[str(k)].append(rr)
-                q_result['hit_at'][str(k)] = hit
-                q_result['rr_at'][str(k)] = round(rr, 4)
-
-            per_query.append(q_result)
-
-        return {
-            'hit_rate': {k: round(float(np.mean(v)), 4) if v else 0
-                         for k, v in hit_rates.items()},
-            'mrr':      {k: round(float(np.mean(v)), 4) if v else 0
-                         for k, v in mrrs.items()},
-            'per_query': per_query,
-            'n_queries': len(per_query),
-        }
-
-    # ─────────────────────────────────────────────────────────────
-    # Coverage
+    # Воспроизведение журнала запросов
     # ─────────────────────────────────────────────────────────────
 
-    def _calc_coverage(self, model, all_products, get_pks_by_query):
-        all_pks = {p.pk for p in all_products}
-        seen_5  = set()
-        seen_10 = set()
-
-        # Прогоняем все тестовые запросы
-        for query_text, _, _ in TEST_QUERIES:
-            pairs = get_pks_by_query(query_text, model, top_n=10)
-            ranked = [pk for pk, _ in pairs]
-            seen_5.update(ranked[:5])
-            seen_10.update(ranked[:10])
-
-        # Дополнительно — item-to-item для каждого товара
-        from shop.recommender import get_similar_pks
-        for p in all_products[:50]:  # первые 50 как источники
-            pairs = get_similar_pks(p.pk, model, top_n=6)
-            seen_10.update(pk for pk, _ in pairs)
-
-        total = len(all_pks)
-        return {
-            'total_products':    total,
-            'unique_recommended': len(seen_10),
-            'coverage_at_5':    round(len(seen_5)  / total * 100, 1),
-            'coverage_at_10':   round(len(seen_10) / total * 100, 1),
-            'not_recommended':  total - len(seen_10),
-        }
-
-    # ─────────────────────────────────────────────────────────────
-    # Intra-list Similarity
-    # ─────────────────────────────────────────────────────────────
-
-    def _calc_intra_list_similarity(self, model, all_products, get_pks_by_query):
-        from sklearn.metrics.pairwise import cosine_similarity as cos_sim
-
-        shop_norm = model['shop_reduced_norm']
-        pks       = model['product_pks']
-        pk_to_idx = {pk: i for i, pk in enumerate(pks)}
-
-        ils_values = []
-        per_query  = []
-
-        for query_text, _, _ in TEST_QUERIES:
-            pairs    = get_pks_by_query(query_text, model, top_n=10)
-            top_pks  = [pk for pk, _ in pairs[:10]]
-            indices  = [pk_to_idx[pk] for pk in top_pks if pk in pk_to_idx]
-
-            if len(indices) < 2:
-                continue
-
-            vecs = shop_norm[indices]
-            sim_matrix = cos_sim(vecs)
-            # Берём верхний треугольник (без диагонали)
-            n = len(indices)
-            upper = [sim_matrix[i, j] for i in range(n) for j in range(i+1, n)]
-            ils   = float(np.mean(upper)) if upper else 0.0
-            ils_values.append(ils)
-            per_query.append({'query': query_text[:40], 'ils': round(ils, 4)})
-
-        mean_ils = float(np.mean(ils_values)) if ils_values else 0.0
-        return {
-            'mean_ils':  round(mean_ils, 4),
-            'per_query': per_query,
-            'ideal_min': 0.3,
-            'ideal_max': 0.5,
-        }
-
-    # ─────────────────────────────────────────────────────────────
-    # Reconstruction Error
-    # ─────────────────────────────────────────────────────────────
-
-    def _calc_reconstruction_error(self, model):
-        vectorizer = model['vectorizer']
-        svd        = model['svd']
-        shop_norm  = model['shop_reduced_norm']
-
-        # Берём тестовые строки — тексты запросов
-        test_texts = [q[0] for q in TEST_QUERIES]
-        X = vectorizer.transform(test_texts)
-
-        # Проецируем в SVD-пространство и восстанавливаем обратно
-        X_reduced   = svd.transform(X)
-        X_reconstructed = X_reduced @ svd.components_
-
-        # Frobenius norm ошибки
-        diff = X.toarray() - X_reconstructed
-        error = float(np.linalg.norm(diff, 'fro') / (X.shape[0] * X.shape[1]))
-
-        # Объяснённая дисперсия
-        explained = float(np.sum(svd.explained_variance_ratio_) * 100)
-
-        return {
-            'reconstruction_error':   round(error, 6),
-            'explained_variance_ratio': round(explained, 2),
-            'n_components':           model.get('n_components', len(svd.explained_variance_ratio_)),
-            'singular_values':        [round(float(v), 4)
-                                       for v in svd.singular_values_[:20]],
-            'explained_per_component': [round(float(v) * 100, 3)
-                                        for v in svd.explained_variance_ratio_[:20]],
-        }
-
-    # ─────────────────────────────────────────────────────────────
-    # Note Drift
-    # ─────────────────────────────────────────────────────────────
-
-    def _calc_note_drift(self, model, all_products, get_pks_by_query):
-        from shop.models import Product
-
-        drift_values = []
-        details      = []
-
-        for query_text, _, query_notes in TEST_QUERIES:
-            if not query_notes:
-                continue
-
-            query_words = set(w.lower() for w in query_notes)
-            pairs       = get_pks_by_query(query_text, model, top_n=1)
-            if not pairs:
+    def _replay(self, model, options):
+        from shop import evaluation
+        from shop.recommender import _load_model_file
+
+        if not Path(options['replay']).exists():
+            raise CommandError(f'Журнал не найден: {options["replay"]}')
+        candidate = None
+        if options['candidate']:
+            candidate = _load_model_file(options['candidate'])
+            if candidate is None:
+                raise CommandError(f'Модель-кандидат не загружена: {options["candidate"]}')
+        if options['min_overlap'] is not None and candidate is None:
+            raise CommandError('--min-overlap требует --candidate')
+
+        k = options['k']
+        self.stdout.write(f'► Воспроизведение {options["replay"]} '
+                          f'(пачки по {options["batch_size"]}, k={k}) ...')
+        t0 = time.perf_counter()
+        report = evaluation.replay(options['replay'], model, candidate, k=k,
+                                   batch_size=max(1, options['batch_size']),
+                                   limit=options['limit'])
+        elapsed = time.perf_counter() - t0
+        log = report['log']
+        self.stdout.write(
+            f'  Запросов: {log["queries"]} из {log["lines"]} строк '
+            f'(пропущено {log["skipped"]}) за {elapsed:.2f} с'
+        )
+        for name, lat in report['latency'].items():
+            batch, single = lat['batch_ms_per_query'], lat['single_ms']
+            if not batch['n']:
                 continue
+            self.stdout.write(
+                f'  {name:<10} пачкой, мс/запрос: p50 {batch["p50"]:.3f}  p95 {batch["p95"]:.3f}'
+                f' (n={batch["n"]})  |  одиночный, мс: p50 {single["p50"]:.3f}'
+                f'  p95 {single["p95"]:.3f}  p99 {single["p99"]:.3f} (n={single["n"]})'
+                f'  |  пустых: {report["empty_results"][name]}'
+            )
 
-            top_pk = pairs[0][0]
-            try:
-                p = Product.objects.get(pk=top_pk)
-            except Exception:
-                continue
+        overlap = report.get('overlap')
+        if overlap and overlap['n']:
+            self.stdout.write(
+                f'  overlap@{k}: среднее {overlap["mean"]:.3f}  p5 {overlap["p5"]:.3f}  '
+                f'p50 {overlap["p50"]:.3f}  |  совпадает полностью: '
+                f'{overlap["identical_share"]:.1%}  |  топ-1: {overlap["top1_agreement"]:.1%}'
+            )
+            for item in overlap['worst'][:5]:
+                self.stdout.write(f'    «{item["query"][:50]}» → {item[f"overlap@{k}"]:.2f}')
 
-            # Тексты нот топ-1 товара
-            ing   = str(getattr(p, 'ingredients', '') or '').lower()
-            frag  = str(getattr(p, 'fragrances',  '') or '').lower()
-            desc  = str(getattr(p, 'description',  '') or '').lower()
-            product_words = set((ing + ' ' + frag + ' ' + desc).split())
-
-            # Пересечение
-            overlap_count = sum(1 for w in query_words if w in product_words)
-            overlap_pct   = (overlap_count / len(query_words) * 100) if query_words else 0
-            drift         = 1 - overlap_pct / 100
-
-            drift_values.append(drift)
-            details.append({
-                'query':        query_text[:40],
-                'top1_product': p.name[:40],
-                'query_notes':  list(query_words),
-                'note_overlap': round(overlap_pct, 1),
-                'drift':        round(drift, 4),
-            })
-
-        mean_drift = float(np.mean(drift_values)) if drift_values else 1.0
-        return {
-            'mean_drift': round(mean_drift, 4),
-            'details':    details,
+        report['meta'] = {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'candidate': options['candidate'],
+            'elapsed_s': round(elapsed, 3),
         }
-
-    # ─────────────────────────────────────────────────────────────
-    # SVD n_components сравнение
-    # ─────────────────────────────────────────────────────────────
-
-    def _calc_svd_comparison(self, model, all_products):
-        """
-        Сравниваем Hit Rate@5, Coverage и ILS при разных n_components,
-        используя уже обученный vectorizer и масштабируя существующие SVD.
-        """
-        from sklearn.decomposition import TruncatedSVD
-        from sklearn.preprocessing import normalize
-        from sklearn.metrics.pairwise import cosine_similarity as cos_sim
-
-        vectorizer = model['vectorizer']
-        pks        = model['product_pks']
-
-        # Получаем признаковые строки для товаров магазина
-        from shop.recommender import _shop_product_feature_string
-        shop_strings = []
-        valid_pks    = []
-        for p in all_products:
-            from shop.models import Product
-            try:
-                prod = Product.objects.select_related('category').get(pk=p.pk)
-                fs = _shop_product_feature_string(prod)
-                if fs.strip():
-                    shop_strings.append(fs)
-                    valid_pks.append(p.pk)
-            except Exception:
-                continue
-
-        if not shop_strings:
-            return {'comparison': [], 'error': 'Нет строк для сравнения'}
-
-        shop_tfidf = vectorizer.transform(shop_strings)
-
-        # Тестовые запросы
-        test_texts   = [q[0] for q in TEST_QUERIES]
-        query_family = [q[1] for q in TEST_QUERIES]
-        query_notes  = [q[2] for q in TEST_QUERIES]
-
-        # Строим золотой стандарт для HR@5
-        from shop.models import Product as P
-        all_prods_full = list(P.objects.select_related('category').filter(pk__in=valid_pks))
-
-        comparison = []
-        n_components_list = [10, 20, 50, model.get('n_components', 100)]
-        # Убираем дубликаты и сортируем
-        n_components_list = sorted(set(n_components_list))
-        max_possible = min(shop_tfidf.shape[0] - 1, shop_tfidf.shape[1] - 1)
-
-        for n_comp in n_components_list:
-            if n_comp >= max_possible:
-                n_comp = max_possible - 1
-            if n_comp < 1:
-                continue
-
-            svd_tmp = TruncatedSVD(n_components=n_comp, random_state=42)
-            # Обучаем на тех же данных, что и основная модель (на TF-IDF shop)
-            shop_reduced = svd_tmp.fit_transform(shop_tfidf)
-            shop_n = normalize(shop_reduced, norm='l2')
-            shop_n = np.nan_to_num(shop_n, nan=0.0)
-
-            pk_to_idx = {pk: i for i, pk in enumerate(valid_pks)}
-
-            # HR@5
-            hits = []
-            seen = set()
-            ils_vals = []
-
-            for q_text, q_family, q_notes in TEST_QUERIES:
-                q_tfidf   = vectorizer.transform([q_text])
-                q_reduced = svd_tmp.transform(q_tfidf)
-                from sklearn.preprocessing import normalize as norm_fn
-                q_norm    = norm_fn(q_reduced, norm='l2')
-                q_norm    = np.nan_to_num(q_norm, nan=0.0)
-
-                scores    = (shop_n @ q_norm.T).flatten()
-                top_idx   = np.argsort(scores)[::-1][:10]
-                top_pks   = [valid_pks[i] for i in top_idx]
-
-                seen.update(top_pks[:10])
-
-                # Золотой стандарт
-                relevant = self._build_gold_standard(q_notes, q_family, all_prods_full)
-                hit = 1 if any(pk in relevant for pk in top_pks[:5]) else 0
-                hits.append(hit)
-
-                # ILS
-                indices = [pk_to_idx[pk] for pk in top_pks[:10] if pk in pk_to_idx]
-                if len(indices) >= 2:
-                    vecs = shop_n[indices]
-                    sim_m = cos_sim(vecs)
-                    nn = len(indices)
-                    upper = [sim_m[i, j] for i in range(nn) for j in range(i+1, nn)]
-                    ils_vals.append(float(np.mean(upper)))
-
-            coverage = len(seen) / len(valid_pks) * 100 if valid_pks else 0
-            exp_var  = float(np.sum(svd_tmp.explained_variance_ratio_) * 100)
-
-            comparison.append({
-                'n_components':        n_comp,
-                'hr_at_5':             round(float(np.mean(hits)), 4) if hits else 0,
-                'coverage':            round(coverage, 1),
-                'ils':                 round(float(np.mean(ils_vals)), 4) if ils_vals else 0,
-                'explained_variance':  round(exp_var, 1),
-            })
-
-        return {'comparison': comparison}
\ No newline at end of file
+        with open(REPLAY_FILE, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Результаты сохранены в {REPLAY_FILE}'))
+
+        if options['min_overlap'] is not None:
+            mean = overlap['mean'] if overlap and overlap['n'] else 0.0
+            if mean < options['min_overlap']:
+                raise CommandError(
+                    f'Средний overlap@{k} {mean:.3f} ниже порога {options["min_overlap"]}'
+                )
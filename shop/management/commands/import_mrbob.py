@@ -14,7 +14,6 @@ Management command: import_mrbob
 """
 
 import json
-import pandas as pd
 import random
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
@@ -85,6 +84,8 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
+        import pandas as pd
+
         # ── Загрузка данных ──────────────────────────────────────────
         local_csv = options.get('local_csv')
 
@@ -3,10 +3,8 @@ Management command для импорта датасета MrBob23/perfume-descri
 с автоматической загрузкой изображений.
 """
 import os
-import requests
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
-import pandas as pd
 from shop.models import Brand, Category, Product
 from decimal import Decimal
 import random
@@ -18,6 +16,9 @@ class Command(BaseCommand):
         parser.add_argument('csv_file', type=str, help='Путь к perfume_metadata.csv')
 
     def handle(self, *args, **options):
+        import pandas as pd
+        import requests
+
         csv_path = options['csv_file']
 
         if not os.path.exists(csv_path):
@@ -0,0 +1,250 @@
+"""
+Management command: load_test
+==============================
+Нагрузочный тест веб-уровня: одновременные «покупатели» проходят сценарий
+
+    каталог → фильтр → карточка товара → (рекомендации) → в корзину
+    → корзина → оформление заказа
+
+через django.test.Client (полный цикл middleware, представлений и шаблонов
+без сетевого стека). Каждый покупатель — отдельный поток со своей сессией,
+пользователем и подключением к БД.
+
+Данные создаются в отдельной временной базе (как у тестов Django: для SQLite —
+временный файл), поэтому рабочая база не затрагивается.
+
+Отчёт по каждому представлению: запросы/с, задержка p50/p95/p99, среднее
+число SQL-запросов и ошибки; JSON — в test_results/load_test.json.
+
+Использование:
+    python manage.py load_test
+    python manage.py load_test --shoppers 16 --sessions 50 --products 20000
+"""
+
+import json
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.urls import reverse
+
+RESULTS_DIR  = Path('test_results')
+RESULTS_FILE = RESULTS_DIR / 'load_test.json'
+
+QUERIES = ['rose jasmine', 'woody vetiver', 'vanilla amber', 'fresh citrus', 'oud incense']
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class _Recorder:
+    """Замеры по представлениям из всех потоков."""
+
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.samples = defaultdict(list)   # view → [(ms, queries, ok)]
+
+    def add(self, view, ms, queries, ok):
+        with self.lock:
+            self.samples[view].append((ms, queries, ok))
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест представлений магазина с одновременными покупателями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shoppers', type=int, default=8,
+                            help='Одновременных покупателей (потоков) (default: 8)')
+        parser.add_argument('--sessions', type=int, default=20,
+                            help='Сценариев на покупателя (default: 20)')
+        parser.add_argument('--products', type=int, default=5000,
+                            help='Размер синтетического каталога (default: 5000)')
+        parser.add_argument('--recommend-ratio', type=float, default=0.3,
+                            help='Доля сценариев с /recommend/ (default: 0.3)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        from django.test.utils import setup_test_environment, teardown_test_environment
+        from shop.models import Order
+
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write('  НАГРУЗОЧНЫЙ ТЕСТ ПРЕДСТАВЛЕНИЙ')
+        self.stdout.write('='*60 + '\n')
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        tmp = tempfile.TemporaryDirectory()
+        if connection.vendor == 'sqlite':
+            # Файл, а не :memory: — потокам нужны отдельные подключения к одной базе
+            connection.settings_dict['TEST']['NAME'] = str(Path(tmp.name) / 'load_test.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            users, products, filters = self._seed(options)
+            recorder, elapsed = self._run(users, products, filters, options)
+            orders = Order.objects.count()
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            tmp.cleanup()
+
+        report = self._report(recorder, elapsed)
+        checkouts = report.get('checkout', {})
+        placed = checkouts.get('n', 0) - checkouts.get('errors', 0)
+        line = f'\n  Создано заказов: {orders} (успешных оформлений: {placed})'
+        self.stdout.write(self.style.ERROR(line) if orders != placed else line)
+        RESULTS_DIR.mkdir(exist_ok=True)
+        payload = {
+            'vendor':    connection.vendor,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'options':   {k: options[k] for k in
+                          ('shoppers', 'sessions', 'products', 'recommend_ratio', 'seed')},
+            'elapsed_s': round(elapsed, 3),
+            'orders':    orders,
+            'views':     report,
+        }
+        with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Результаты сохранены: {RESULTS_FILE}'))
+
+    # ─────────────────────────────────────────────────────────
+    # Данные
+    # ─────────────────────────────────────────────────────────
+
+    def _seed(self, options):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from django.utils import timezone
+        from shop.models import Discount, Product
+        from shop.synthetic import seed_catalogue
+
+        cache.clear()
+        self.stdout.write(f'  Генерирую каталог: {options["products"]} товаров …')
+        catalogue = seed_catalogue(options['products'], seed=options['seed'])
+        # Запас на складе, чтобы оформление заказов не упиралось в остатки
+        Product.objects.update(stock=10**6)
+
+        now = timezone.now()
+        rng = random.Random(options['seed'])
+        # Скидки на бренды — тип 'product' со связью brands (как в админке),
+        # чтобы карточки и корзина проходили поиск скидки по бренду
+        sale_brands = rng.sample(catalogue['brands'], min(10, len(catalogue['brands'])))
+        for brand in sale_brands:
+            discount = Discount.objects.create(
+                discount_type='product', value_type='percentage', value=rng.randint(5, 25),
+                start_date=now - timezone.timedelta(days=1),
+                end_date=now + timezone.timedelta(days=30),
+            )
+            discount.brands.add(brand)
+
+        self.stdout.write(f'  Товаров со скидкой бренда: '
+                          f'{Product.objects.filter(brand__in=sale_brands).count()}')
+
+        users = [User.objects.create_user(username=f'load_test_{i}')
+                 for i in range(options['shoppers'])]
+        products = list(Product.objects.values_list('pk', flat=True))
+        filters = [{'brand': b.pk} for b in catalogue['brands'][:50]] \
+            + [{'category': c.pk} for c in catalogue['categories']] \
+            + [{'volume': v} for v in (50, 100, 200)]
+        self.stdout.write(f'  Покупателей: {len(users)}, сценариев: '
+                          f'{len(users) * options["sessions"]}')
+        return users, products, filters
+
+    # ─────────────────────────────────────────────────────────
+    # Нагрузка
+    # ─────────────────────────────────────────────────────────
+
+    def _run(self, users, products, filters, options):
+        recorder = _Recorder()
+        threads  = [
+            threading.Thread(target=self._shopper,
+                             args=(user, products, filters, options, recorder, i))
+            for i, user in enumerate(users)
+        ]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return recorder, time.perf_counter() - t0
+
+    def _shopper(self, user, products, filters, options, recorder, n):
+        from django.test import Client
+
+        rng    = random.Random(options['seed'] + n)
+        client = Client()
+        client.force_login(user)
+        queries = [0]
+
+        def counter(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        def hit(view, url, data=None, method='get', redirect_to=None):
+            # redirect_to — единственный допустимый адрес перенаправления
+            # (checkout при ошибке возвращает в корзину — это ошибка)
+            queries[0] = 0
+            t0 = time.perf_counter()
+            try:
+                response = getattr(client, method)(url, data or {})
+                ok = response.status_code == 200 or (
+                    response.status_code == 302
+                    and (redirect_to is None or response.url == redirect_to))
+            except Exception:
+                ok = False
+            recorder.add(view, (time.perf_counter() - t0) * 1000, queries[0], ok)
+
+        try:
+            with connection.execute_wrapper(counter):
+                for _ in range(options['sessions']):
+                    pk = rng.choice(products)
+                    hit('product_list', reverse('product_list'))
+                    hit('product_list?filter', reverse('product_list'), rng.choice(filters))
+                    hit('product_detail', reverse('product_detail', args=[pk]))
+                    if rng.random() < options['recommend_ratio']:
+                        hit('recommend', reverse('recommend'), {'q': rng.choice(QUERIES)})
+                    hit('add_to_cart', reverse('add_to_cart', args=[pk]))
+                    hit('cart', reverse('cart'))
+                    hit('checkout', reverse('checkout'), method='post',
+                        redirect_to=reverse('order_success'))
+        finally:
+            connection.close()
+
+    # ─────────────────────────────────────────────────────────
+    # Отчёт
+    # ─────────────────────────────────────────────────────────
+
+    def _report(self, recorder, elapsed):
+        total = sum(len(s) for s in recorder.samples.values())
+        self.stdout.write(f'\n  Всего запросов: {total} за {elapsed:.2f} с '
+                          f'→ {total / elapsed:.1f} запр/с\n')
+        self.stdout.write(f'  {"Представление":<22} {"n":>6} {"запр/с":>8} {"p50":>8} '
+                          f'{"p95":>8} {"p99":>8} {"SQL":>6} {"ошибки":>7}')
+        report = {}
+        for view, samples in recorder.samples.items():
+            ms      = [s[0] for s in samples]
+            sql     = [s[1] for s in samples]
+            errors  = sum(1 for s in samples if not s[2])
+            report[view] = {
+                'n':        len(samples),
+                'rps':      round(len(samples) / elapsed, 1),
+                'p50_ms':   round(_percentile(ms, 50), 3),
+                'p95_ms':   round(_percentile(ms, 95), 3),
+                'p99_ms':   round(_percentile(ms, 99), 3),
+                'mean_ms':  round(statistics.fmean(ms), 3),
+                'queries':  round(statistics.fmean(sql), 2),
+                'errors':   errors,
+            }
+            r = report[view]
+            line = (f'  {view:<22} {r["n"]:>6} {r["rps"]:>8} {r["p50_ms"]:>8.2f} '
+                    f'{r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f} {r["queries"]:>6} {errors:>7}')
+            self.stdout.write(self.style.ERROR(line) if errors else line)
+        return report
@@ -0,0 +1,135 @@
+"""
+Management command: profile_report
+===================================
+Сводка по профилям запросов, записанным ProfilingMiddleware (shop/profiling.py),
+за окно времени:
+
+  • запросы по путям: количество, средняя и максимальная длительность,
+    доля времени в SQL;
+  • самые горячие функции — статистика cProfile всех профилей окна,
+    сложенная через pstats;
+  • самые дорогие SQL-запросы (по суммарному времени, одинаковый текст
+    запроса — одна строка);
+  • этапы рекомендаций (load_model, encode, score, fetch …).
+
+Использование:
+    python manage.py profile_report
+    python manage.py profile_report --since 30m --path /product/ --limit 20
+    python manage.py profile_report --sort tottime
+"""
+
+import io
+import pstats
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.profiling import load_records, profile_dir
+
+_WINDOW_RE = re.compile(r'^(\d+)([smhd])$')
+_UNITS     = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_window(value: str) -> int:
+    """'45s', '30m', '2h', '1d' → секунды."""
+    match = _WINDOW_RE.match(value.strip())
+    if not match:
+        raise ValueError(value)
+    return int(match.group(1)) * _UNITS[match.group(2)]
+
+
+class Command(BaseCommand):
+    help = 'Сводка по профилям запросов за окно времени.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default='1h',
+                            help='Окно: 45s, 30m, 2h, 1d (default: 1h)')
+        parser.add_argument('--path', default='',
+                            help='Только запросы с этим префиксом пути')
+        parser.add_argument('--limit', type=int, default=25,
+                            help='Строк в каждом разделе (default: 25)')
+        parser.add_argument('--sort', default='cumulative',
+                            choices=['cumulative', 'tottime', 'ncalls'],
+                            help='Сортировка функций (default: cumulative)')
+
+    def handle(self, *args, **options):
+        try:
+            window = parse_window(options['since'])
+        except ValueError:
+            raise CommandError('--since: ожидается число и единица s/m/h/d, например 30m')
+
+        records = load_records(since=time.time() - window, path_prefix=options['path'])
+        if not records:
+            self.stdout.write(self.style.WARNING(
+                f'Нет профилей за {options["since"]} в {profile_dir()}'))
+            return
+
+        limit = options['limit']
+        self.stdout.write('\n' + '='*60)
+        self.stdout.write(f'  ПРОФИЛИ ЗАПРОСОВ: {len(records)} за {options["since"]}')
+        self.stdout.write('='*60)
+
+        self._paths(records, limit)
+        self._functions(records, options['sort'], limit)
+        self._sql(records, limit)
+        self._stages(records)
+
+    def _paths(self, records, limit):
+        by_path = defaultdict(list)
+        for r in records:
+            by_path[f'{r["method"]} {r["path"]}'].append(r)
+        self.stdout.write(f'\n► Запросы\n  {"n":>5} {"средн, мс":>10} {"макс, мс":>10} '
+                          f'{"SQL":>6}  путь')
+        rows = sorted(by_path.items(),
+                      key=lambda kv: sum(r['duration_ms'] for r in kv[1]), reverse=True)
+        for path, items in rows[:limit]:
+            total = sum(r['duration_ms'] for r in items)
+            sql   = sum(r['sql_ms'] for r in items)
+            self.stdout.write(
+                f'  {len(items):>5} {total / len(items):>10.2f} '
+                f'{max(r["duration_ms"] for r in items):>10.2f} '
+                f'{(sql / total if total else 0):>6.0%}  {path}'
+            )
+
+    def _functions(self, records, sort, limit):
+        paths = [r['prof_path'] for r in records if Path(r['prof_path']).exists()]
+        self.stdout.write(f'\n► Горячие функции ({len(paths)} профилей, сортировка: {sort})')
+        if not paths:
+            return
+        stream = io.StringIO()
+        stats  = pstats.Stats(*paths, stream=stream)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        # Пропускаем шапку pstats со списком файлов
+        lines = stream.getvalue().splitlines()
+        start = next((i for i, line in enumerate(lines) if 'ncalls' in line), 0)
+        for line in lines[start:]:
+            if line.strip():
+                self.stdout.write(f'  {line}')
+
+    def _sql(self, records, limit):
+        totals = defaultdict(lambda: [0, 0.0])
+        for r in records:
+            for q in r['sql']:
+                totals[q['sql']][0] += 1
+                totals[q['sql']][1] += q['ms']
+        self.stdout.write(f'\n► SQL ({sum(n for n, _ in totals.values())} запросов)\n'
+                          f'  {"n":>6} {"всего, мс":>10} {"средн, мс":>10}  запрос')
+        rows = sorted(totals.items(), key=lambda kv: kv[1][1], reverse=True)
+        for sql, (n, ms) in rows[:limit]:
+            self.stdout.write(f'  {n:>6} {ms:>10.2f} {ms / n:>10.3f}  {sql[:120]}')
+
+    def _stages(self, records):
+        totals = defaultdict(list)
+        for r in records:
+            for s in r['stages']:
+                totals[s['stage']].append(s['ms'])
+        if not totals:
+            return
+        self.stdout.write(f'\n► Этапы рекомендаций\n  {"n":>6} {"всего, мс":>10} '
+                          f'{"средн, мс":>10}  этап')
+        for stage, values in sorted(totals.items(), key=lambda kv: sum(kv[1]), reverse=True):
+            self.stdout.write(f'  {len(values):>6} {sum(values):>10.2f} '
+                              f'{sum(values) / len(values):>10.3f}  {stage}')
@@ -0,0 +1,44 @@
+"""
+Management command: publish_recommender
+========================================
+Публикует обученную модель (ml_models/recommender_model.pkl) в разделяемой
+памяти: массивы модели кладутся в один сегмент multiprocessing.shared_memory,
+а load_model() в воркерах gunicorn/uwsgi подключается к нему без копирования.
+
+Запускайте после train_recommender (или train_recommender --publish) и после
+перезагрузки сервера — сегменты разделяемой памяти не переживают reboot.
+Пока модель не переопубликована, воркеры читают обновлённый .pkl как обычно.
+
+Использование:
+    python manage.py publish_recommender
+    python manage.py publish_recommender --unpublish
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.recommender import SHM_MANIFEST_PATH, publish_model, unpublish_model
+
+
+class Command(BaseCommand):
+    help = 'Публикует модель рекомендаций в разделяемой памяти.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unpublish', action='store_true',
+                            help='Удалить опубликованный сегмент и манифест')
+
+    def handle(self, *args, **options):
+        if options['unpublish']:
+            unpublish_model()
+            self.stdout.write(self.style.SUCCESS('✓ Модель удалена из разделяемой памяти'))
+            return
+
+        try:
+            manifest = publish_model()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Модель опубликована: сегмент {manifest["segment"]}, '
+            f'{manifest["size"] / 1024 / 1024:.1f} МБ, '
+            f'массивов: {len(manifest["buffers"])}\n'
+            f'  Манифест: {SHM_MANIFEST_PATH}'
+        ))
@@ -0,0 +1,37 @@
+"""
+Management command: rebuild_search_index
+=========================================
+Полностью перестраивает таблицу полнотекстового поиска shop_product_search.
+
+Нужна после массовых операций, которые не посылают сигналы
+(bulk_create, QuerySet.update), например после импорта каталога.
+
+Использование:
+    python manage.py rebuild_search_index
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает индекс полнотекстового поиска товаров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Товаров за одну пачку (default: 1000)')
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('Полнотекстовый поиск поддерживается только для SQLite и PostgreSQL.')
+
+        t0 = time.perf_counter()
+        total = search.rebuild(
+            batch_size=options['batch_size'],
+            progress=lambda n: self.stdout.write(f'  Проиндексировано: {n}'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Индекс перестроен: {total} товаров за {time.perf_counter() - t0:.1f} с'
+        ))
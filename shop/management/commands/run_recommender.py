@@ -0,0 +1,53 @@
+"""
+Management command: run_recommender
+====================================
+Запускает процесс рекомендаций (shop/sidecar.py): модель загружается один
+раз и обслуживает запросы similar / query всех веб-воркеров через Unix socket.
+
+Воркеры подключаются, если в settings указан тот же путь:
+    SHOP_RECOMMENDER_SOCKET = '/tmp/shop-recommender.sock'
+Если процесс не запущен или не отвечает, рекомендации считаются в воркере.
+
+Использование:
+    python manage.py run_recommender
+    python manage.py run_recommender --socket /run/shop/recommender.sock
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.sidecar import RecommenderServer
+
+DEFAULT_SOCKET = '/tmp/shop-recommender.sock'
+
+
+class Command(BaseCommand):
+    help = 'Запускает процесс рекомендаций на Unix socket.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None,
+                            help='Путь к сокету (default: SHOP_RECOMMENDER_SOCKET '
+                                 f'или {DEFAULT_SOCKET})')
+
+    def handle(self, *args, **options):
+        path = options['socket'] or getattr(settings, 'SHOP_RECOMMENDER_SOCKET', None) \
+            or DEFAULT_SOCKET
+        try:
+            server = RecommenderServer(path)
+        except ImportError:
+            raise CommandError('Установите scikit-learn: pip install scikit-learn --timeout 120')
+        except OSError as e:
+            raise CommandError(f'Не удалось открыть сокет {path}: {e}')
+
+        if server.model() is None:
+            self.stdout.write(self.style.WARNING(
+                '⚠ Модель не обучена — запустите python manage.py train_recommender; '
+                'процесс подхватит её автоматически.'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'✓ Рекомендации обслуживаются на {path}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -13,8 +13,6 @@ Management command: test_recommender
 
 import json
 import time
-import numpy as np
-import pickle
 from pathlib import Path
 from django.core.management.base import BaseCommand, CommandError
 
@@ -157,6 +155,7 @@ class Command(BaseCommand):
     # Тест 1: Ненулевые векторы
     # ─────────────────────────────────────────────────────────────
     def _test_vectors(self, model):
+        import numpy as np
         matrix = model['shop_reduced_norm']
         norms = np.linalg.norm(matrix, axis=1)
 
@@ -445,6 +444,7 @@ class Command(BaseCommand):
     # Тест 6: Производительность
     # ─────────────────────────────────────────────────────────────
     def _test_performance(self, model, get_pks_by_query, get_similar_pks):
+        import numpy as np
         from shop.models import Product
         from shop.recommender import MODEL_PATH
 
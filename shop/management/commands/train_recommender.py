@@ -8,6 +8,7 @@ Management command: train_recommender
 
 Использование:
     python manage.py train_recommender
+    python manage.py train_recommender --publish   # + разделяемая память
 
 Требования:
     pip install scikit-learn datasets huggingface_hub
@@ -17,7 +18,7 @@ import time
 from django.core.management.base import BaseCommand, CommandError
 
 from shop.recommender import (
-    build_model, save_model, delete_model,
+    build_model, save_model, delete_model, publish_model,
     MODEL_PATH, MODEL_VERSION,
 )
 
@@ -27,6 +28,10 @@ PELEGELRAZ_ID = 'pelegelraz/perfumes-dataset'
 class Command(BaseCommand):
     help = 'Обучает модель рекомендаций.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--publish', action='store_true',
+                            help='Опубликовать модель в разделяемой памяти для воркеров')
+
     def handle(self, *args, **options):
 
         # ── Проверка scikit-learn ────────────────────────────────
@@ -132,6 +137,9 @@ class Command(BaseCommand):
 
         # ── Сохранение ───────────────────────────────────────────
         save_model(model)
+        if options['publish']:
+            manifest = publish_model(model)
+            self.stdout.write(f'  Разделяемая память: сегмент {manifest["segment"]}')
 
         # ── Итоговая диагностика ─────────────────────────────────
         import numpy as np
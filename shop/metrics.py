@@ -0,0 +1,191 @@
+"""
+shop/metrics.py
+================
+Метрики рекомендаций в памяти процесса.
+
+  ТАЙМЕРЫ:
+    with metrics.timer('score'): ...
+    Длительности этапов (load_model, encode, score, fetch) складываются
+    в гистограммы с фиксированными границами; p50/p95/p99 оцениваются
+    интерполяцией внутри корзины.
+
+  СЧЁТЧИКИ:
+    metrics.count('shop_cache_requests_total', cache='model', result='hit')
+
+  ЭКСПОРТ:
+    GET /metrics — формат Prometheus (text 0.0.4): этапы как summary
+    с квантилями, счётчики как counter. Значения свои у каждого процесса —
+    Prometheus различает воркеры по метке instance/pid. Эндпоинт выключен
+    по умолчанию (SHOP_METRICS_ENABLED) и открыт только staff-пользователям
+    и адресам из SHOP_METRICS_ALLOWED_IPS.
+    @server_timing — заголовок Server-Timing с этапами текущего запроса;
+    collect_timings() — те же этапы для профилировщика (shop/profiling.py).
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Границы корзин, секунды: 50 мкс … ~26 с, шаг ×2
+BUCKETS   = tuple(0.00005 * 2 ** i for i in range(20))
+QUANTILES = (0.5, 0.95, 0.99)
+
+STAGE_METRIC = 'shop_recommender_stage_seconds'
+
+_lock       = threading.Lock()
+_histograms = {}
+_counters   = {}
+
+# Этапы текущего запроса (None — вне collect_timings)
+_request_timings = contextvars.ContextVar('shop_request_timings', default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total  = 0.0
+        self.n      = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.n     += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.n:
+            return 0.0
+        rank, seen = q * self.n, 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+def observe(stage: str, seconds: float):
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = Histogram()
+        hist.observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timer(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+
+def count(name: str, amount: int = 1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def counter_value(name: str, **labels) -> int:
+    return _counters.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def stage(name: str) -> Histogram | None:
+    return _histograms.get(name)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+# ─────────────────────────────────────────────────────────────────
+# Экспорт
+# ─────────────────────────────────────────────────────────────────
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def render_prometheus() -> str:
+    with _lock:
+        histograms = {k: (list(h.counts), h.total, h.n, [h.quantile(q) for q in QUANTILES])
+                      for k, h in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    if histograms:
+        lines += [f'# HELP {STAGE_METRIC} Recommender stage latency.',
+                  f'# TYPE {STAGE_METRIC} summary']
+        for name, (_, total, n, values) in sorted(histograms.items()):
+            for q, value in zip(QUANTILES, values):
+                lines.append(f'{STAGE_METRIC}{_labels([("stage", name), ("quantile", q)])} {value:.6f}')
+            lines.append(f'{STAGE_METRIC}_sum{_labels([("stage", name)])} {total:.6f}')
+            lines.append(f'{STAGE_METRIC}_count{_labels([("stage", name)])} {n}')
+
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            lines.append(f'# TYPE {name} counter')
+            typed.add(name)
+        lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _server_timing_header(timings, total) -> str:
+    merged = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in merged.items()]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Собирает [(этап, секунды), …], замеренные внутри блока (и в потоках,
+    запущенных через sync_to_async). Вложенные блоки видят свои этапы,
+    а внешние — все.
+    """
+    outer   = _request_timings.get()
+    timings = _Timings(outer)
+    token   = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+class _Timings(list):
+    def __init__(self, outer):
+        super().__init__()
+        self._outer = outer
+
+    def append(self, item):
+        super().append(item)
+        if self._outer is not None:
+            self._outer.append(item)
+
+
+def server_timing(view):
+    """Добавляет заголовок Server-Timing с этапами, замеренными в запросе."""
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        t0 = time.perf_counter()
+        with collect_timings() as timings:
+            response = await view(request, *args, **kwargs)
+        response.headers['Server-Timing'] = _server_timing_header(
+            timings, time.perf_counter() - t0)
+        return response
+    return inner
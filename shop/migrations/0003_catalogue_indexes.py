@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-19 00:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_base_notes_product_gender_ratings_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='brand',
+            index=models.Index(fields=['name'], name='shop_brand_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discount',
+            index=models.Index(fields=['discount_type', 'start_date', 'end_date'], name='shop_discount_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='shop_order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='shop_order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand', 'name'], name='shop_product_brand_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'brand'], name='shop_product_name_brand_idx'),
+        ),
+    ]
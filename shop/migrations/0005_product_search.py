@@ -0,0 +1,49 @@
+# Full-text search table for products: FTS5 on SQLite, tsvector + GIN on PostgreSQL.
+
+from django.db import migrations
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE shop_product_search USING fts5(
+    name, brand, description, notes, tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+POSTGRES_CREATE = """
+CREATE TABLE shop_product_search (
+    product_id bigint PRIMARY KEY REFERENCES shop_product (id) ON DELETE CASCADE
+        DEFERRABLE INITIALLY DEFERRED,
+    document tsvector NOT NULL
+);
+CREATE INDEX shop_product_search_document_idx ON shop_product_search USING GIN (document);
+"""
+
+
+def create_search_table(apps, schema_editor):
+    from shop import search
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+    else:
+        return
+    # The initial fill goes through search.rebuild so that documents match the
+    # ones written by signals and rebuild_search_index (main_accords included).
+    search.rebuild(products=apps.get_model('shop', 'Product').objects)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS shop_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
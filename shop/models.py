@@ -18,6 +18,14 @@ class Brand(models.Model):
     # Store an optional description of the brand, which can be empty.
     description = models.TextField(blank=True)
 
+    class Meta:
+        """
+        Metadata configuration for the Brand model.
+
+        Indexes the name, which the product list sorts by through the brand join.
+        """
+        indexes = [models.Index(fields=['name'], name='shop_brand_name_idx')]
+
     def __str__(self):
         """
         Return a string representation of the brand.
@@ -65,6 +73,22 @@ class Product(models.Model):
     seasonal_ratings = models.JSONField(default=dict, blank=True)
     image_url = models.URLField(max_length=500, blank=True, null=True)  # ссылка из датасета
     volume = models.PositiveIntegerField(null=True, blank=True)
+    # Время последнего изменения — ключ кэша карточки товара
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """
+        Metadata configuration for the Product model.
+
+        Indexes the catalogue ordering by brand and name and the importers' lookup by name.
+        """
+        indexes = [
+            # product_list: order_by('brand__name', 'name')
+            models.Index(fields=['brand', 'name'], name='shop_product_brand_name_idx'),
+            # импортёры: filter(name=...) и filter(name=..., brand=...)
+            models.Index(fields=['name', 'brand'], name='shop_product_name_brand_idx'),
+        ]
+
     def __str__(self):
         return f"{self.brand} — {self.name}"
 
@@ -98,6 +122,19 @@ class Order(models.Model):
     # Store the timestamp when the order was created.
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        """
+        Metadata configuration for the Order model.
+
+        Indexes match the admin list filters on status and creation date.
+        """
+        indexes = [
+            # Filter by status and sort the result by creation date.
+            models.Index(fields=['status', 'created_at'], name='shop_order_status_created_idx'),
+            # Filter or sort by creation date alone.
+            models.Index(fields=['created_at'], name='shop_order_created_idx'),
+        ]
+
     def __str__(self):
         """
         Return a string representation of the order.
@@ -168,6 +205,17 @@ class Discount(models.Model):
     # Store the number of times the discount has been used, defaulting to 0.
     uses = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        """
+        Metadata configuration for the Discount model.
+
+        Indexes the active-window lookup by type and validity dates; the code field is already unique.
+        """
+        indexes = [
+            # Select discounts of one type whose validity window contains the current time.
+            models.Index(fields=['discount_type', 'start_date', 'end_date'], name='shop_discount_window_idx'),
+        ]
+
     def __str__(self):
         """
         Return a string representation of the discount.
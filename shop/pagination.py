@@ -0,0 +1,142 @@
+"""
+shop/pagination.py
+===================
+Keyset (cursor) пагинация для каталога.
+
+Страница выбирается условием «после / до последней показанной строки» по
+ключу сортировки (brand__name, name, id) вместо OFFSET, поэтому время
+открытия любой страницы не зависит от её номера. Курсор — непрозрачная
+base64-строка, которую генерирует тег {% page_url cursor=... %}.
+
+Точное COUNT(*) не выполняется на каждый запрос: приблизительное количество
+кэшируется по набору фильтров на COUNT_TIMEOUT секунд.
+"""
+
+import base64
+import hashlib
+import json
+import math
+from functools import cached_property
+
+from django.core.cache import cache
+from django.db.models import Q
+
+ORDERING      = ('brand__name', 'name', 'id')
+COUNT_TIMEOUT = 300
+
+_AFTER, _BEFORE = 'a', 'b'
+
+
+def encode_cursor(direction: str, product) -> str:
+    raw = json.dumps([direction, product.brand.name, product.name, product.pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str | None):
+    """(direction, brand_name, name, id) либо None для некорректного курсора."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, brand_name, name, pk = json.loads(raw)
+        if direction not in (_AFTER, _BEFORE):
+            return None
+        return direction, str(brand_name), str(name), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def _keyset_filter(direction, brand_name, name, pk) -> Q:
+    op = 'gt' if direction == _AFTER else 'lt'
+    return (
+        Q(**{f'brand__name__{op}': brand_name})
+        | Q(brand__name=brand_name, **{f'name__{op}': name})
+        | Q(brand__name=brand_name, name=name, **{f'id__{op}': pk})
+    )
+
+
+class KeysetPage:
+    """Страница, совместимая с шаблоном product_list (как django Page)."""
+
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list   = object_list
+        self.paginator     = paginator
+        self._has_next     = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(_AFTER, self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(_BEFORE, self.object_list[0])
+        return None
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по ключу ORDERING.
+
+    queryset должен включать select_related('brand') — имя бренда
+    нужно для построения курсора.
+    count_key — строка, идентифицирующая набор фильтров (для кэша COUNT).
+    """
+
+    def __init__(self, queryset, per_page, count_key=''):
+        self.queryset  = queryset.order_by(*ORDERING)
+        self.per_page  = per_page
+        self.count_key = count_key
+
+    @cached_property
+    def count(self) -> int:
+        """Приблизительное количество: COUNT(*) кэшируется по фильтрам."""
+        digest = hashlib.md5(self.count_key.encode()).hexdigest()
+        return cache.get_or_set(f'shop:product_count:{digest}',
+                                self.queryset.count, COUNT_TIMEOUT)
+
+    @property
+    def num_pages(self) -> int:
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def get_page(self, cursor: str | None) -> KeysetPage:
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            rows = list(self.queryset[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self,
+                              has_next=len(rows) > self.per_page, has_previous=False)
+
+        direction = decoded[0]
+        qs = self.queryset.filter(_keyset_filter(*decoded))
+        if direction == _AFTER:
+            rows = list(qs[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self,
+                              has_next=len(rows) > self.per_page, has_previous=True)
+
+        rows = list(qs.reverse()[:self.per_page + 1])
+        page = rows[:self.per_page][::-1]
+        return KeysetPage(page, self,
+                          has_next=True, has_previous=len(rows) > self.per_page)
@@ -0,0 +1,219 @@
+"""
+shop/profiling.py
+==================
+Профилирование отдельных запросов в продакшене (по запросу или выборочно).
+
+  ВКЛЮЧЕНИЕ (settings):
+    SHOP_PROFILE_TOKEN       — запрос с заголовком X-Shop-Profile: <token>
+                               профилируется всегда (None — заголовок игнорируется);
+    SHOP_PROFILE_SAMPLE_RATE — доля случайных запросов (0.0 — выключено).
+    Если оба выключены, middleware снимается с цепочки при запуске.
+
+  ЧТО СОХРАНЯЕТСЯ (SHOP_PROFILE_DIR, по два файла на запрос):
+    <id>.prof — статистика cProfile потока запроса (pstats);
+    <id>.json — метод, путь, статус, длительность, SQL-запросы с временем
+                и этапы рекомендаций (metrics.collect_timings).
+    Хранятся последние SHOP_PROFILE_MAX_RECORDS запросов — старые удаляются.
+    Ответ получает заголовок X-Shop-Profile-Id: <id>.
+
+  АНАЛИЗ:
+    python manage.py profile_report --since 1h
+"""
+
+import cProfile
+import json
+import random
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from shop import metrics
+
+HEADER       = 'X-Shop-Profile'
+ID_HEADER    = 'X-Shop-Profile-Id'
+MAX_SQL_TEXT = 2000
+
+
+def profile_dir() -> Path:
+    return Path(getattr(settings, 'SHOP_PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def should_profile(request) -> bool:
+    token = getattr(settings, 'SHOP_PROFILE_TOKEN', None)
+    if token and request.headers.get(HEADER) == token:
+        return True
+    rate = getattr(settings, 'SHOP_PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+class _SqlRecorder:
+    def __init__(self, alias):
+        self.alias   = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'db':   self.alias,
+                'sql':  sql[:MAX_SQL_TEXT],
+                'ms':   round((time.perf_counter() - t0) * 1000, 3),
+                'many': many,
+            })
+
+
+def is_enabled() -> bool:
+    return bool(getattr(settings, 'SHOP_PROFILE_TOKEN', None)) \
+        or getattr(settings, 'SHOP_PROFILE_SAMPLE_RATE', 0.0) > 0
+
+
+def _start_sql_recording():
+    """execute_wrapper на подключениях текущего потока → (stack, recorders)."""
+    stack     = ExitStack()
+    recorders = [_SqlRecorder(conn.alias) for conn in connections.all()]
+    for conn, recorder in zip(connections.all(), recorders):
+        stack.enter_context(conn.execute_wrapper(recorder))
+    return stack, recorders
+
+
+def _start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: в процессе уже работает другой профилировщик
+        return None
+    return profiler
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запрос: cProfile, SQL через execute_wrapper, этапы
+    рекомендаций. Если профилирование выключено в настройках, middleware
+    снимается с цепочки (MiddlewareNotUsed) и не стоит ничего.
+
+    Поддерживает sync и async: под ASGI async-представления
+    (product_detail, recommend) не переводятся в поток. В async-режиме SQL
+    записывается в потоке sync_to_async этого запроса (там работает ORM),
+    а cProfile видит event loop — вместе с конкурирующими запросами.
+    Работа, вынесенная в пул потоков (подсчёт рекомендаций), видна как
+    этапы, но не попадает в cProfile.
+    """
+
+    sync_capable  = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not should_profile(request):
+            return self.get_response(request)
+
+        stack, recorders = _start_sql_recording()
+        t0 = time.perf_counter()
+        with stack, metrics.collect_timings() as timings:
+            profiler = _start_profiler()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        return _finish(request, response, time.perf_counter() - t0,
+                       profiler, recorders, timings)
+
+    async def __acall__(self, request):
+        if not should_profile(request):
+            return await self.get_response(request)
+
+        stack, recorders = await sync_to_async(_start_sql_recording)()
+        t0 = time.perf_counter()
+        try:
+            with metrics.collect_timings() as timings:
+                profiler = _start_profiler()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            await sync_to_async(stack.close)()
+        return _finish(request, response, time.perf_counter() - t0,
+                       profiler, recorders, timings)
+
+
+def _finish(request, response, duration, profiler, recorders, timings):
+    record_id = save(request, response, duration, profiler,
+                     [q for r in recorders for q in r.queries], list(timings))
+    response.headers[ID_HEADER] = record_id
+    return response
+
+
+# ─────────────────────────────────────────────────────────────────
+# Хранилище
+# ─────────────────────────────────────────────────────────────────
+
+def save(request, response, duration, profiler, queries, timings) -> str:
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    # Сортировка имён совпадает с хронологией — по ней работает ротация
+    record_id = f'{int(now * 1000):013d}-{uuid.uuid4().hex[:8]}'
+
+    if profiler is not None:
+        profiler.dump_stats(directory / f'{record_id}.prof')
+    meta = {
+        'id':          record_id,
+        'timestamp':   now,
+        'method':      request.method,
+        'path':        request.path,
+        'status':      response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+        'sql':         queries,
+        'sql_ms':      round(sum(q['ms'] for q in queries), 3),
+        'stages':      [{'stage': s, 'ms': round(sec * 1000, 3)} for s, sec in timings],
+    }
+    (directory / f'{record_id}.json').write_text(json.dumps(meta), encoding='utf-8')
+    rotate(directory)
+    return record_id
+
+
+def rotate(directory=None, keep=None):
+    directory = directory or profile_dir()
+    keep = keep if keep is not None else getattr(settings, 'SHOP_PROFILE_MAX_RECORDS', 500)
+    records = sorted(directory.glob('*.json'))
+    for meta in records[:max(0, len(records) - keep)]:
+        meta.unlink(missing_ok=True)
+        meta.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def load_records(since: float = 0.0, path_prefix: str = '') -> list[dict]:
+    """Метаданные записей не старше since (unix time), по возрастанию времени."""
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    out = []
+    for meta_path in sorted(directory.glob('*.json')):
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        if meta.get('timestamp', 0) < since or not meta.get('path', '').startswith(path_prefix):
+            continue
+        meta['prof_path'] = str(meta_path.with_suffix('.prof'))
+        out.append(meta)
+    return out
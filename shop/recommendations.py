@@ -0,0 +1,95 @@
+"""
+shop/recommendations.py
+========================
+Рекомендации для представлений: HTML (views.py) и JSON API (api.py)
+получают пары (pk, score) только через эти функции.
+
+  ПОРЯДОК:
+    1. Процесс рекомендаций (sidecar.py), если задан SHOP_RECOMMENDER_SOCKET, —
+       модель в веб-воркер не загружается.
+    2. При SidecarUnavailable (или без сокета) — модель в своём процессе
+       (recommender.load_model) и тот же расчёт; промах считается в
+       shop_sidecar_fallbacks_total.
+
+  Пакетные варианты идут к процессу рекомендаций по одному запросу на элемент
+  (в одном соединении), а в своём процессе считаются одним матричным проходом.
+"""
+
+from shop import metrics, sidecar
+
+
+def load_model_safe():
+    """Возвращает (model, error_str). model=None при любой проблеме."""
+    try:
+        from shop.recommender import load_model
+        model = load_model()
+        if model is None:
+            return None, (
+                'Модель не обучена или устарела. '
+                'Запустите: python manage.py train_recommender'
+            )
+        return model, None
+    except ImportError:
+        return None, 'Установите scikit-learn: pip install scikit-learn --timeout 120'
+    except Exception as e:
+        return None, f'Ошибка загрузки модели: {e}'
+
+
+def _from_sidecar(call):
+    """Результат call() из процесса рекомендаций; None — считать в своём процессе."""
+    if not sidecar.is_enabled():
+        return None
+    try:
+        with metrics.timer('sidecar'):
+            return call()
+    except sidecar.SidecarUnavailable:
+        metrics.count('shop_sidecar_fallbacks_total')  # считаем в своём процессе
+        return None
+
+
+def similar_pairs(product_pk: int, top_n: int = 6) -> list[tuple[int, float]]:
+    """[(pk, score), …] похожих товаров; пустой список, если модели нет."""
+    pairs = _from_sidecar(lambda: sidecar.similar(product_pk, top_n))
+    if pairs is not None:
+        return pairs
+    model, _ = load_model_safe()
+    if model is None:
+        return []
+    try:
+        from shop.recommender import get_similar_pks
+        return get_similar_pks(product_pk, model, top_n=top_n)
+    except Exception:
+        return []
+
+
+def query_pairs(query: str, top_n: int):
+    """(pairs, error) для текстового запроса к рекомендательной модели."""
+    pairs = _from_sidecar(lambda: sidecar.query(query, top_n))
+    if pairs is not None:
+        return pairs, None
+    model, error = load_model_safe()
+    if model is None:
+        return [], error
+    from shop.recommender import get_pks_by_query
+    return get_pks_by_query(query, model, top_n=top_n), None
+
+
+def batch_pairs(queries: list[str], product_pks: list[int], top_n: int):
+    """
+    (pairs по запросам, pairs по pk, error) — пакетный вариант query_pairs
+    и similar_pairs. При ошибке загрузки модели оба списка пусты.
+    """
+    if not queries and not product_pks:
+        return [], [], None
+    found = _from_sidecar(lambda: (
+        [sidecar.query(q, top_n) for q in queries],
+        [sidecar.similar(pk, top_n) for pk in product_pks],
+    ))
+    if found is not None:
+        return *found, None
+    model, error = load_model_safe()
+    if model is None:
+        return [], [], error
+    from shop.recommender import get_pks_by_queries, get_similar_pks_batch
+    return (get_pks_by_queries(queries, model, top_n=top_n),
+            get_similar_pks_batch(product_pks, model, top_n=top_n), None)
@@ -17,14 +17,22 @@ shop/recommender.py
     Возвращаются pk реальных Product из БД.
 """
 
+import json
+import os
 import pickle
-import numpy as np
+import secrets
 from pathlib import Path
 
+from shop import metrics
+
 MODEL_DIR     = Path(__file__).resolve().parent.parent / 'ml_models'
 MODEL_PATH    = MODEL_DIR / 'recommender_model.pkl'
 MODEL_VERSION = 5  # увеличиваем при изменении схемы
 
+# Манифест опубликованной в разделяемой памяти модели (publish_model)
+SHM_MANIFEST_PATH = MODEL_DIR / 'recommender_model.shm.json'
+SHM_ALIGN         = 64
+
 
 # ─────────────────────────────────────────────────────────────────
 # Сохранение / загрузка
@@ -37,28 +45,198 @@ def save_model(obj: dict):
         pickle.dump(obj, f)
 
 
-def load_model() -> dict | None:
-    """None — если файл отсутствует, повреждён или версия устарела."""
-    if not MODEL_PATH.exists():
+def _is_valid(obj) -> bool:
+    required = {'vectorizer', 'svd', 'shop_reduced_norm', 'product_pks', '_version'}
+    return (isinstance(obj, dict) and required.issubset(obj.keys())
+            and obj.get('_version') == MODEL_VERSION)
+
+
+def _load_model_file(path=None) -> dict | None:
+    """Модель из pickle-файла (по умолчанию — рабочая); None — нет файла или не та версия."""
+    path = Path(path) if path else MODEL_PATH
+    if not path.exists():
         return None
     try:
-        with open(MODEL_PATH, 'rb') as f:
+        with open(path, 'rb') as f:
             obj = pickle.load(f)
-        required = {'vectorizer', 'svd', 'shop_reduced_norm', 'product_pks', '_version'}
-        if not required.issubset(obj.keys()):
-            return None
-        if obj.get('_version') != MODEL_VERSION:
-            return None
-        return obj
+        return obj if _is_valid(obj) else None
     except Exception:
         return None
 
 
+def load_model() -> dict | None:
+    """
+    None — если файл отсутствует, повреждён или версия устарела.
+    Если модель опубликована в разделяемой памяти (publish_model) и манифест
+    соответствует текущему файлу, массивы подключаются без копирования.
+    """
+    import numpy  # noqa: F401 — без numpy модель не загрузить: ImportError вызывающему
+    with metrics.timer('load_model'):
+        model = _attach_published()
+        if model is None:
+            model = _load_model_file()
+            metrics.count('shop_cache_requests_total', cache='model', result='miss')
+            metrics.count('shop_model_loads_total', source='file' if model else 'none')
+    return model
+
+
+def model_tag() -> str:
+    """Короткий идентификатор текущего файла модели (версия схемы + mtime)."""
+    try:
+        mtime = MODEL_PATH.stat().st_mtime_ns
+    except OSError:
+        return 'none'
+    return f'{MODEL_VERSION}-{mtime}'
+
+
 def delete_model():
+    unpublish_model()
     if MODEL_PATH.exists():
         MODEL_PATH.unlink()
 
 
+# ─────────────────────────────────────────────────────────────────
+# Разделяемая память
+# ─────────────────────────────────────────────────────────────────
+#
+# Модель сериализуется pickle protocol 5 с внешними буферами: все массивы
+# numpy (shop_reduced_norm, svd.components_, idf_ векторизатора …) лежат
+# в одном сегменте multiprocessing.shared_memory, в том же сегменте — сам
+# pickle без массивов. product_pks публикуется массивом int64 (а не списком
+# int, который каждый воркер распаковал бы в свою кучу); словарь pk → строка
+# строится из него лениво (_pk_index). Воркеры подключаются к сегменту и получают массивы
+# как представления его памяти, поэтому ОЗУ под модель не растёт с числом
+# воркеров. Манифест (JSON) хранит имя сегмента, смещения и model_tag()
+# файла, из которого модель опубликована.
+
+_attached = None  # (имя сегмента, model) в текущем процессе
+
+
+def _align(n: int) -> int:
+    return (n + SHM_ALIGN - 1) // SHM_ALIGN * SHM_ALIGN
+
+
+def _shared_memory(name, create=False, size=0):
+    """
+    SharedMemory без resource_tracker: иначе сегмент удаляется при выходе
+    из процесса, который его создал или подключил (до Python 3.13).
+    """
+    from multiprocessing import resource_tracker, shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _read_manifest() -> dict | None:
+    try:
+        return json.loads(SHM_MANIFEST_PATH.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def _unlink_segment(name):
+    # С учётом в resource_tracker: unlink() снимает сегмент с учёта
+    from multiprocessing import shared_memory
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except OSError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def publish_model(model: dict | None = None) -> dict:
+    """
+    Публикует модель в разделяемой памяти и возвращает манифест.
+    Предыдущий сегмент удаляется; уже подключённые воркеры продолжают
+    работать со своим отображением до перехода на новый сегмент.
+    """
+    if model is None:
+        model = _load_model_file()
+    if model is None:
+        raise ValueError('Модель не обучена. Запустите: python manage.py train_recommender')
+
+    import numpy as np
+    model = {k: v for k, v in model.items() if not k.startswith('_') or k == '_version'}
+    model['product_pks'] = np.asarray(model['product_pks'], dtype=np.int64)
+    buffers = []
+    payload = pickle.dumps(model, protocol=5, buffer_callback=buffers.append)
+    raws    = [b.raw() for b in buffers]
+
+    offset, layout = _align(len(payload)), []
+    for raw in raws:
+        layout.append([offset, raw.nbytes])
+        offset = _align(offset + raw.nbytes)
+
+    name = f'shoprec_{secrets.token_hex(6)}'
+    shm  = _shared_memory(name, create=True, size=max(offset, 1))
+    shm.buf[:len(payload)] = payload
+    for raw, (start, size) in zip(raws, layout):
+        shm.buf[start:start + size] = raw
+        raw.release()
+    shm.close()
+
+    previous = _read_manifest()
+    manifest = {
+        'version': MODEL_VERSION,
+        'source':  model_tag(),
+        'segment': name,
+        'size':    offset,
+        'pickle':  [0, len(payload)],
+        'buffers': layout,
+    }
+    MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = SHM_MANIFEST_PATH.with_suffix('.tmp')
+    tmp.write_text(json.dumps(manifest), encoding='utf-8')
+    os.replace(tmp, SHM_MANIFEST_PATH)
+
+    if previous and previous.get('segment') != name:
+        _unlink_segment(previous['segment'])
+    return manifest
+
+
+def unpublish_model():
+    """Удаляет сегмент и манифест; load_model() снова читает файл."""
+    manifest = _read_manifest()
+    if manifest:
+        _unlink_segment(manifest['segment'])
+    SHM_MANIFEST_PATH.unlink(missing_ok=True)
+
+
+def _attach_published() -> dict | None:
+    global _attached
+    manifest = _read_manifest()
+    if not manifest or manifest.get('version') != MODEL_VERSION:
+        return None
+    if manifest.get('source') != model_tag():
+        return None  # файл модели переобучен после публикации
+    if _attached is not None and _attached[0] == manifest['segment']:
+        metrics.count('shop_cache_requests_total', cache='model', result='hit')
+        return _attached[1]
+    try:
+        shm = _shared_memory(manifest['segment'])
+    except OSError:
+        return None
+
+    start, size = manifest['pickle']
+    # Только чтение: сегмент общий для всех воркеров
+    buffers = [shm.buf[o:o + n].toreadonly() for o, n in manifest['buffers']]
+    try:
+        obj = pickle.loads(shm.buf[start:start + size], buffers=buffers)
+    except Exception:
+        return None
+    if not _is_valid(obj):
+        return None
+    # Последним ключом: при удалении модели сегмент закрывается после массивов
+    obj['_shm'] = shm
+    _attached = (manifest['segment'], obj)
+    metrics.count('shop_model_loads_total', source='shm')
+    return obj
+
+
 # ─────────────────────────────────────────────────────────────────
 # Формирование признаковых строк
 # ─────────────────────────────────────────────────────────────────
@@ -150,12 +328,9 @@ def build_model(pelegelraz_df, verbose_callback=None) -> dict:
     """
     Строит модель рекомендаций.
 
-    pelegelraz_df — pandas DataFrame датасета pelegelraz.
+    pelegelraz_df — pandas DataFrame датасета pelegelraz (или список словарей).
     verbose_callback — функция для вывода сообщений (например, self.stdout.write).
     """
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.decomposition import TruncatedSVD
-    from sklearn.preprocessing import normalize
     from shop.models import Product
 
     def log(msg):
@@ -194,13 +369,30 @@ def build_model(pelegelraz_df, verbose_callback=None) -> dict:
 
     # ── Шаг 2: признаки pelegelraz ──────────────────────────────
     log('  Формирую признаки pelegelraz …')
-    pelegelraz_strings = [
-        _pelegelraz_feature_string(row)
-        for row in pelegelraz_df.to_dict('records')
-    ]
+    records = pelegelraz_df.to_dict('records') if hasattr(pelegelraz_df, 'to_dict') \
+        else list(pelegelraz_df)
+    pelegelraz_strings = [_pelegelraz_feature_string(row) for row in records]
     pelegelraz_strings = [s for s in pelegelraz_strings if s.strip()]
     log(f'  Записей pelegelraz   : {len(pelegelraz_strings)}')
 
+    return fit_model(pelegelraz_strings, shop_strings, product_pks, verbose_callback)
+
+
+def fit_model(pelegelraz_strings: list[str], shop_strings: list[str],
+              product_pks: list[int], verbose_callback=None) -> dict:
+    """
+    Шаги 3–5 build_model на готовых признаковых строках (без БД) —
+    используется и бенчмарком на синтетических каталогах.
+    """
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.preprocessing import normalize
+
+    def log(msg):
+        if verbose_callback:
+            verbose_callback(msg)
+
     # ── Шаг 3: обучаем TF-IDF на ОБЪЕДИНЁННОМ корпусе ──────────
     # Это гарантирует, что все слова из товаров магазина попадут в словарь
     log('  Обучаю TF-IDF на объединённом корпусе …')
@@ -260,23 +452,26 @@ def build_model(pelegelraz_df, verbose_callback=None) -> dict:
 
 def get_similar_pks(product_pk: int, model: dict, top_n: int = 6) -> list[tuple[int, float]]:
     """Item-to-item: возвращает [(pk, score), …] top_n похожих товаров."""
+    import numpy as np
     pks       = model['product_pks']
     shop_norm = model['shop_reduced_norm']
 
-    if product_pk not in pks:
+    idx = _pk_index(model).get(product_pk)
+    if idx is None:
         return []
 
-    idx    = pks.index(product_pk)
-    vec    = shop_norm[idx].reshape(1, -1)
-    scores = (shop_norm @ vec.T).flatten()
-    scores[idx] = -1
+    with metrics.timer('score'):
+        vec    = shop_norm[idx].reshape(1, -1)
+        scores = (shop_norm @ vec.T).flatten()
+        scores[idx] = -1
 
-    top_idx = np.argsort(scores)[::-1][:top_n]
-    return [(pks[i], float(scores[i])) for i in top_idx]
+        top_idx = np.argsort(scores)[::-1][:top_n]
+        return [(int(pks[i]), float(scores[i])) for i in top_idx]
 
 
 def get_pks_by_query(query: str, model: dict, top_n: int = 12) -> list[tuple[int, float]]:
     """Поиск по запросу пользователя среди товаров магазина."""
+    import numpy as np
     from sklearn.preprocessing import normalize
 
     vectorizer = model['vectorizer']
@@ -284,11 +479,191 @@ def get_pks_by_query(query: str, model: dict, top_n: int = 12) -> list[tuple[int
     shop_norm  = model['shop_reduced_norm']
     pks        = model['product_pks']
 
-    q_tfidf   = vectorizer.transform([query])
-    q_reduced = svd.transform(q_tfidf)
-    q_norm    = normalize(q_reduced, norm='l2')
-    q_norm    = np.nan_to_num(q_norm, nan=0.0)
+    with metrics.timer('encode'):
+        q_tfidf   = vectorizer.transform([query])
+        q_reduced = svd.transform(q_tfidf)
+        q_norm    = normalize(q_reduced, norm='l2')
+        q_norm    = np.nan_to_num(q_norm, nan=0.0)
+
+    with metrics.timer('score'):
+        scores  = (shop_norm @ q_norm.T).flatten()
+        top_idx = np.argsort(scores)[::-1][:top_n]
+        return [(int(pks[i]), float(scores[i])) for i in top_idx]
+
+
+# ─────────────────────────────────────────────────────────────────
+# Пакетный поиск
+# ─────────────────────────────────────────────────────────────────
+
+BATCH_BLOCK = 32  # строк матрицы запросов за один проход (ограничивает память)
+
+
+def _pk_index(model: dict) -> dict:
+    """pk → номер строки в shop_reduced_norm (кэшируется в самом model)."""
+    index = model.get('_pk_index')
+    if index is None:
+        pks = model['product_pks']
+        # Опубликованная модель хранит pk массивом int64 — ключи делаем int
+        pks = pks.tolist() if hasattr(pks, 'tolist') else pks
+        index = model['_pk_index'] = {pk: i for i, pk in enumerate(pks)}
+    return index
+
+
+def _top_pairs(scores, pks, top_n) -> list[tuple[int, float]]:
+    """top_n лучших по убыванию: argpartition O(n) вместо полного argsort."""
+    import numpy as np
+    top_n = min(top_n, len(scores))
+    if top_n <= 0:
+        return []
+    idx = np.argpartition(-scores, top_n - 1)[:top_n]
+    idx = idx[np.argsort(-scores[idx])]
+    return [(int(pks[i]), float(scores[i])) for i in idx]
+
+
+def encode_queries(queries: list[str], model: dict):
+    """Запросы → нормированные векторы в пространстве SVD (одной матрицей)."""
+    import numpy as np
+    from sklearn.preprocessing import normalize
+
+    with metrics.timer('encode'):
+        q_reduced = model['svd'].transform(model['vectorizer'].transform(queries))
+        return np.nan_to_num(normalize(q_reduced, norm='l2'), nan=0.0)
+
+
+def get_pks_by_queries(queries: list[str], model: dict,
+                       top_n: int = 12) -> list[list[tuple[int, float]]]:
+    """Пакетный вариант get_pks_by_query: один проход матричного умножения на блок."""
+    if not queries:
+        return []
+    shop_norm = model['shop_reduced_norm']
+    pks       = model['product_pks']
+    q_norm    = encode_queries(queries, model)
+    out = []
+    with metrics.timer('score'):
+        for start in range(0, len(queries), BATCH_BLOCK):
+            block = q_norm[start:start + BATCH_BLOCK] @ shop_norm.T
+            out.extend(_top_pairs(row, pks, top_n) for row in block)
+    return out
+
+
+def get_similar_pks_batch(product_pks: list[int], model: dict,
+                          top_n: int = 6) -> list[list[tuple[int, float]]]:
+    """Пакетный вариант get_similar_pks; для неизвестных pk — пустой список."""
+    import numpy as np
+    shop_norm = model['shop_reduced_norm']
+    pks       = model['product_pks']
+    index     = _pk_index(model)
+    out = [[] for _ in product_pks]
+    known = [(n, index[pk]) for n, pk in enumerate(product_pks) if pk in index]
+    with metrics.timer('score'):
+        for start in range(0, len(known), BATCH_BLOCK):
+            chunk  = known[start:start + BATCH_BLOCK]
+            rows   = [i for _, i in chunk]
+            scores = shop_norm[rows] @ shop_norm.T
+            scores[np.arange(len(rows)), rows] = -1
+            for (n, _), row in zip(chunk, scores):
+                out[n] = _top_pairs(row, pks, top_n)
+    return out
+
+
+# ─────────────────────────────────────────────────────────────────
+# Разнообразие и новизна выдачи
+# ─────────────────────────────────────────────────────────────────
+#
+# ILS списка — среднее косинусное сходство по парам его товаров. Сумма по
+# парам i < j берётся без матрицы n×n: Σ v_i·v_j = (‖Σ v_i‖² − Σ ‖v_i‖²) / 2,
+# поэтому список из n товаров стоит O(n·d). Списки выравниваются нулевыми
+# строками до общей длины и обрабатываются блоками по LIST_BLOCK.
+
+LIST_BLOCK = 1024  # списков за один проход (ограничивает память)
+
+
+def list_similarity(vectors, index_lists):
+    """
+    ILS для списков номеров строк нормированной матрицы vectors.
+    Возвращает массив по спискам; NaN — в списке меньше двух товаров.
+    """
+    import numpy as np
+    lengths = np.fromiter((len(l) for l in index_lists), dtype=np.int64,
+                          count=len(index_lists))
+    out   = np.full(len(index_lists), np.nan)
+    width = int(lengths.max()) if len(lengths) else 0
+    if width < 2:
+        return out
 
-    scores  = (shop_norm @ q_norm.T).flatten()
-    top_idx = np.argsort(scores)[::-1][:top_n]
-    return [(pks[i], float(scores[i])) for i in top_idx]
\ No newline at end of file
+    mask   = np.arange(width) < lengths[:, None]
+    padded = np.zeros(mask.shape, dtype=np.int64)
+    padded[mask] = np.concatenate([np.asarray(l, dtype=np.int64) for l in index_lists])
+
+    for start in range(0, len(index_lists), LIST_BLOCK):
+        stop  = start + LIST_BLOCK
+        block = vectors[padded[start:stop]] * mask[start:stop, :, None]   # списки × n × d
+        sums  = block.sum(axis=1)
+        pairs = ((sums * sums).sum(axis=1) - (block * block).sum(axis=(1, 2))) / 2
+        n     = lengths[start:stop]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[start:stop] = np.where(n >= 2, pairs / (n * (n - 1) / 2), np.nan)
+    return out
+
+
+def _index_lists(pk_lists, model: dict) -> list[list[int]]:
+    index = _pk_index(model)
+    return [[index[pk] for pk in pks if pk in index] for pks in pk_lists]
+
+
+def intra_list_similarity(pk_lists, model: dict):
+    """ILS списков pk (неизвестные модели pk пропускаются)."""
+    return list_similarity(model['shop_reduced_norm'], _index_lists(pk_lists, model))
+
+
+def diversity(pk_lists, model: dict):
+    """Разнообразие выдачи: 1 − ILS."""
+    return 1 - intra_list_similarity(pk_lists, model)
+
+
+def novelty(pk_lists, popularity: dict, catalogue_size: int):
+    """
+    Новизна: средняя собственная информация −log2 p(i) товаров списка, где
+    p(i) — доля товара в продажах (popularity: pk → штук) со сглаживанием
+    Лапласа по каталогу. NaN — для пустых списков.
+    """
+    import numpy as np
+    lengths = np.fromiter((len(l) for l in pk_lists), dtype=np.int64, count=len(pk_lists))
+    flat    = [pk for pks in pk_lists for pk in pks]
+    counts  = np.fromiter((popularity.get(pk, 0) for pk in flat), dtype=np.float64,
+                          count=len(flat))
+    total   = sum(popularity.values()) + max(catalogue_size, 1)
+    info    = -np.log2((counts + 1) / total)
+    sums    = np.bincount(np.repeat(np.arange(len(pk_lists)), lengths), weights=info,
+                          minlength=len(pk_lists))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(lengths > 0, sums / lengths, np.nan)
+
+
+def rerank_diverse(pairs: list[tuple[int, float]], model: dict, top_n: int,
+                   weight: float = 0.3) -> list[tuple[int, float]]:
+    """
+    Переранжирование с учётом разнообразия (жадный MMR): на каждом шаге
+    берётся кандидат с наибольшим (1 − weight)·score − weight·max сходства
+    с уже выбранными. pairs — кандидаты с запасом (например, get_pks_by_query
+    с top_n×3); weight=0 — исходный порядок.
+    """
+    import numpy as np
+    index = _pk_index(model)
+    candidates = [(pk, score) for pk, score in pairs if pk in index]
+    if weight <= 0 or len(candidates) < 2:
+        return candidates[:top_n]
+
+    vecs   = model['shop_reduced_norm'][[index[pk] for pk, _ in candidates]]
+    sims   = vecs @ vecs.T
+    scores = np.array([score for _, score in candidates])
+    redundancy = np.zeros(len(candidates))
+    available  = np.ones(len(candidates), dtype=bool)
+    chosen = []
+    for _ in range(min(top_n, len(candidates))):
+        gain = np.where(available, (1 - weight) * scores - weight * redundancy, -np.inf)
+        i = int(gain.argmax())
+        chosen.append(i)
+        available[i] = False
+        redundancy = np.maximum(redundancy, sims[i])
+    return [candidates[i] for i in chosen]
@@ -0,0 +1,164 @@
+"""
+shop/search.py
+===============
+Полнотекстовый поиск по товарам.
+
+  ХРАНЕНИЕ:
+    Денормализованная таблица shop_product_search (миграция 0005):
+      • SQLite     — виртуальная таблица FTS5 (name, brand, description, notes),
+                     rowid = Product.id;
+      • PostgreSQL — (product_id, document tsvector) + GIN-индекс.
+    Для остальных СУБД используется запасной вариант на icontains.
+
+  СИНХРОНИЗАЦИЯ:
+    Сигналы Product/Brand (signals.py) вызывают index_products / remove_product.
+    bulk_create и update() сигналов не посылают — после массового импорта
+    запустите: python manage.py rebuild_search_index
+
+  ПОИСК:
+    Каждое слово запроса ищется как префикс ("rose" → rose, rosewood …),
+    слова объединяются по AND, результаты ранжируются (bm25 / ts_rank)
+    с большим весом у названия и бренда.
+"""
+
+import re
+
+from django.db import connection
+
+TABLE = 'shop_product_search'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported() -> bool:
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _document(product) -> dict:
+    accords = product.main_accords if isinstance(product.main_accords, dict) else {}
+    notes = ' '.join(filter(None, [
+        product.top_notes, product.middle_notes, product.base_notes, ' '.join(accords),
+    ]))
+    return {
+        'name':        product.name or '',
+        'brand':       product.brand.name if product.brand_id else '',
+        'description': product.description or '',
+        'notes':       notes,
+    }
+
+
+def _terms(query: str) -> list[str]:
+    return [w.lower() for w in _WORD_RE.findall(query or '')]
+
+
+# ─────────────────────────────────────────────────────────────────
+# Индексация
+# ─────────────────────────────────────────────────────────────────
+
+def index_products(products):
+    """Добавляет или обновляет документы товаров (нужен select_related('brand'))."""
+    if not is_supported():
+        return
+    products = list(products)
+    if not products:
+        return
+    pks = [p.pk for p in products]
+    docs = [(p.pk, _document(p)) for p in products]
+    with connection.cursor() as cursor:
+        _delete(cursor, pks)
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, name, brand, description, notes) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [(pk, d['name'], d['brand'], d['description'], d['notes']) for pk, d in docs],
+            )
+        else:
+            cursor.executemany(
+                # coalesce: to_tsvector(NULL) обнулил бы весь документ
+                f"INSERT INTO {TABLE} (product_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('simple', coalesce(%s, '')), 'A') || "
+                f"setweight(to_tsvector('simple', coalesce(%s, '')), 'A') || "
+                f"setweight(to_tsvector('simple', coalesce(%s, '')), 'B') || "
+                f"setweight(to_tsvector('simple', coalesce(%s, '')), 'C'))",
+                [(pk, d['name'], d['brand'], d['notes'], d['description']) for pk, d in docs],
+            )
+
+
+def _delete(cursor, pks):
+    placeholders = ', '.join(['%s'] * len(pks))
+    column = 'rowid' if connection.vendor == 'sqlite' else 'product_id'
+    cursor.execute(f'DELETE FROM {TABLE} WHERE {column} IN ({placeholders})', pks)
+
+
+def remove_product(pk):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        _delete(cursor, [pk])
+
+
+def rebuild(batch_size=1000, progress=None, products=None) -> int:
+    """
+    Полностью перестраивает индекс. Возвращает количество товаров.
+    products — queryset товаров (миграция 0005 передаёт историческую модель);
+    по умолчанию — Product.objects.
+    """
+    if not is_supported():
+        return 0
+    if products is None:
+        from shop.models import Product
+        products = Product.objects
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    qs = products.select_related('brand').order_by('pk')
+    total, batch = 0, []
+    for product in qs.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            index_products(batch)
+            total += len(batch)
+            batch = []
+            if progress:
+                progress(total)
+    index_products(batch)
+    return total + len(batch)
+
+
+# ─────────────────────────────────────────────────────────────────
+# Поиск
+# ─────────────────────────────────────────────────────────────────
+
+def search_pks(query: str, limit: int = 50) -> list[tuple[int, float]]:
+    """[(pk, score), …] по убыванию релевантности."""
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{t}"*' for t in terms)
+        sql = (f'SELECT rowid, -bm25({TABLE}, 10.0, 5.0, 1.0, 3.0) AS score '
+               f'FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY score DESC LIMIT %s')
+        params = [match, limit]
+    elif connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{t}:*' for t in terms)
+        sql = (f"SELECT product_id, ts_rank(document, to_tsquery('simple', %s)) AS score "
+               f"FROM {TABLE} WHERE document @@ to_tsquery('simple', %s) "
+               f"ORDER BY score DESC LIMIT %s")
+        params = [tsquery, tsquery, limit]
+    else:
+        return _search_fallback(terms, limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(pk, float(score)) for pk, score in cursor.fetchall()]
+
+
+def _search_fallback(terms, limit):
+    from django.db.models import Q
+    from shop.models import Product
+
+    qs = Product.objects.all()
+    for t in terms:
+        qs = qs.filter(Q(name__icontains=t) | Q(brand__name__icontains=t)
+                       | Q(description__icontains=t))
+    return [(pk, 1.0) for pk in qs.order_by('name').values_list('pk', flat=True)[:limit]]
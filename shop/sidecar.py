@@ -0,0 +1,241 @@
+"""
+shop/sidecar.py
+================
+Отдельный процесс рекомендаций: модель загружается один раз на сервер,
+а не в каждом веб-воркере.
+
+  ЗАПУСК:
+    python manage.py run_recommender --socket /run/shop/recommender.sock
+    В settings: SHOP_RECOMMENDER_SOCKET = '/run/shop/recommender.sock'
+
+  ПРОТОКОЛ (Unix domain socket, одно соединение — много запросов):
+    кадр     = длина (uint32, big-endian) + тело
+    запрос   = op (uint8) + top_n (uint16) + аргумент
+                 OP_SIMILAR — pk (int64)
+                 OP_QUERY   — текст запроса в UTF-8
+    ответ    = status (uint8) + n (uint32) + n × (pk int64, score float64)
+
+  КЛИЕНТ:
+    similar() / query() возвращают [(pk, score), …] или бросают
+    SidecarUnavailable — тогда представления считают рекомендации
+    в своём процессе (shop/recommendations.py).
+"""
+
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+OP_PING, OP_SIMILAR, OP_QUERY = 0, 1, 2
+STATUS_OK, STATUS_NO_MODEL, STATUS_ERROR = 0, 1, 2
+
+MAX_TOP_N = 1000
+
+_LENGTH   = struct.Struct('!I')
+_REQUEST  = struct.Struct('!BH')
+_PK       = struct.Struct('!q')
+_RESPONSE = struct.Struct('!BI')
+_PAIR     = struct.Struct('!qd')
+
+
+class SidecarUnavailable(Exception):
+    pass
+
+
+# ─────────────────────────────────────────────────────────────────
+# Кодирование
+# ─────────────────────────────────────────────────────────────────
+
+def _frame(payload: bytes) -> bytes:
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def encode_request(op: int, top_n: int, arg) -> bytes:
+    head = _REQUEST.pack(op, max(0, min(top_n, MAX_TOP_N)))
+    if op == OP_SIMILAR:
+        return head + _PK.pack(arg)
+    if op == OP_QUERY:
+        return head + arg.encode('utf-8')
+    return head
+
+
+def decode_request(data: bytes):
+    op, top_n = _REQUEST.unpack_from(data)
+    body = data[_REQUEST.size:]
+    if op == OP_SIMILAR:
+        return op, top_n, _PK.unpack(body)[0]
+    if op == OP_QUERY:
+        return op, top_n, body.decode('utf-8')
+    return op, top_n, None
+
+
+def encode_response(status: int, pairs=()) -> bytes:
+    return _RESPONSE.pack(status, len(pairs)) + b''.join(
+        _PAIR.pack(int(pk), float(score)) for pk, score in pairs
+    )
+
+
+def decode_response(data: bytes):
+    status, n = _RESPONSE.unpack_from(data)
+    body = data[_RESPONSE.size:_RESPONSE.size + n * _PAIR.size]
+    return status, list(_PAIR.iter_unpack(body))
+
+
+def _read_exact(read, n: int) -> bytes | None:
+    chunks, remaining = [], n
+    while remaining:
+        chunk = read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_frame(read) -> bytes | None:
+    head = _read_exact(read, _LENGTH.size)
+    if head is None:
+        return None
+    return _read_exact(read, _LENGTH.unpack(head)[0])
+
+
+# ─────────────────────────────────────────────────────────────────
+# Сервер
+# ─────────────────────────────────────────────────────────────────
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            data = _read_frame(self.request.recv)
+            if data is None:
+                return
+            self.request.sendall(_frame(self.server.respond(data)))
+
+
+class RecommenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Держит модель в памяти и отвечает на запросы клиентов.
+    Модель перечитывается, когда меняется файл (recommender.model_tag()).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, loader=None):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        self.path    = path
+        self._loader = loader
+        self._lock   = threading.Lock()
+        self._model  = None
+        self._tag    = None
+        self.model()
+
+    def _load(self):
+        from shop.recommender import load_model
+        return (self._loader or load_model)()
+
+    def model(self):
+        from shop.recommender import model_tag
+        tag = model_tag()
+        if tag != self._tag:
+            with self._lock:
+                if tag != self._tag:
+                    self._model, self._tag = self._load(), tag
+        return self._model
+
+    def respond(self, data: bytes) -> bytes:
+        from shop.recommender import get_pks_by_query, get_similar_pks
+        try:
+            op, top_n, arg = decode_request(data)
+            if op == OP_PING:
+                return encode_response(STATUS_OK)
+            model = self.model()
+            if model is None:
+                return encode_response(STATUS_NO_MODEL)
+            if op == OP_SIMILAR:
+                return encode_response(STATUS_OK, get_similar_pks(arg, model, top_n=top_n))
+            if op == OP_QUERY:
+                return encode_response(STATUS_OK, get_pks_by_query(arg, model, top_n=top_n))
+        except Exception:
+            pass
+        return encode_response(STATUS_ERROR)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# ─────────────────────────────────────────────────────────────────
+# Клиент
+# ─────────────────────────────────────────────────────────────────
+
+_local = threading.local()
+
+
+def _settings():
+    from django.conf import settings
+    return (getattr(settings, 'SHOP_RECOMMENDER_SOCKET', None),
+            getattr(settings, 'SHOP_RECOMMENDER_TIMEOUT', 0.5))
+
+
+def is_enabled() -> bool:
+    return bool(_settings()[0])
+
+
+def _connection(path, timeout):
+    # Одно соединение на поток: без повторного connect() на каждый запрос
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == path:
+        return conn
+    close()
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(path)
+    except OSError:
+        conn.close()
+        raise
+    _local.conn, _local.path = conn, path
+    return conn
+
+
+def close():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+    _local.conn = None
+
+
+def _call(op, top_n, arg=None) -> list[tuple[int, float]]:
+    path, timeout = _settings()
+    if not path:
+        raise SidecarUnavailable('SHOP_RECOMMENDER_SOCKET is not set')
+    try:
+        conn = _connection(path, timeout)
+        conn.sendall(_frame(encode_request(op, top_n, arg)))
+        data = _read_frame(conn.recv)
+    except OSError as e:
+        close()
+        raise SidecarUnavailable(str(e))
+    if data is None:
+        close()
+        raise SidecarUnavailable('connection closed')
+    status, pairs = decode_response(data)
+    if status != STATUS_OK:
+        raise SidecarUnavailable(f'status {status}')
+    return pairs
+
+
+def ping():
+    _call(OP_PING, 0)
+
+
+def similar(product_pk: int, top_n: int = 6) -> list[tuple[int, float]]:
+    return _call(OP_SIMILAR, top_n, product_pk)
+
+
+def query(text: str, top_n: int = 12) -> list[tuple[int, float]]:
+    return _call(OP_QUERY, top_n, text)
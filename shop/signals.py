@@ -0,0 +1,69 @@
+"""
+Signal handlers for the shop application.
+
+Обработчики сигналов, сбрасывающие кэши в памяти при изменении данных.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from shop import caching, discounts, search
+from shop.context_processors import forget_group_names
+from shop.models import Brand, Category, Discount, Product
+
+
+def _invalidate_discounts():
+    # Сразу — чтобы текущий поток увидел свои изменения,
+    # и после коммита — чтобы снимок, собранный другим потоком
+    # до фиксации транзакции, тоже был сброшен.
+    discounts.invalidate()
+    transaction.on_commit(discounts.invalidate)
+
+
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+def discount_changed(sender, **kwargs):
+    _invalidate_discounts()
+
+
+@receiver(m2m_changed, sender=Discount.products.through)
+@receiver(m2m_changed, sender=Discount.categories.through)
+@receiver(m2m_changed, sender=Discount.brands.through)
+def discount_relations_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_discounts()
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalogue_changed(sender, instance, **kwargs):
+    caching.bump_catalogue_version()
+    caching.bump_card_version('brand' if sender is Brand else 'category', instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        forget_group_names(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    caching.bump_catalogue_version()
+    if not raw:
+        search.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    caching.bump_catalogue_version()
+    search.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Brand)
+def brand_saved(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        search.index_products(instance.product_set.select_related('brand'))
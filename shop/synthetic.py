@@ -0,0 +1,132 @@
+"""
+shop/synthetic.py
+==================
+Синтетический каталог для бенчмарков и нагрузочных тестов.
+
+Ноты выбираются по закону Ципфа (несколько очень частых нот — bergamot,
+musk, vanilla — и длинный хвост редких), как в реальных датасетах.
+Генерация детерминирована: одинаковый seed даёт одинаковый каталог.
+"""
+
+import random
+from decimal import Decimal
+
+NOTES = [
+    'bergamot', 'musk', 'vanilla', 'amber', 'jasmine', 'rose', 'patchouli',
+    'sandalwood', 'cedar', 'vetiver', 'lemon', 'mandarin', 'pink pepper',
+    'tonka bean', 'iris', 'lavender', 'neroli', 'orange blossom', 'oud',
+    'leather', 'tuberose', 'ylang-ylang', 'cardamom', 'saffron', 'incense',
+    'benzoin', 'grapefruit', 'peony', 'lily of the valley', 'violet',
+    'cinnamon', 'tobacco', 'coconut', 'fig', 'black currant', 'pear',
+    'apple', 'raspberry', 'sea notes', 'mint', 'basil', 'ginger', 'pine',
+    'moss', 'labdanum', 'myrrh', 'heliotrope', 'cashmere', 'coffee', 'honey',
+]
+
+ACCORDS = [
+    'woody', 'floral', 'citrus', 'sweet', 'fresh', 'aromatic', 'warm spicy',
+    'powdery', 'fruity', 'amber', 'musky', 'green', 'aquatic', 'leather',
+]
+
+CATEGORIES = ['Floral', 'Woody', 'Oriental', 'Citrus', 'Fresh', 'Gourmand', 'Chypre', 'Fougere']
+
+FAMILIES = ['floral', 'woody', 'oriental', 'citrus', 'fresh', 'gourmand', 'chypre', 'fougere',
+            'aromatic', 'leather']
+
+# Веса Ципфа: p(k) ∝ 1 / k
+_NOTE_WEIGHTS = [1 / (k + 1) for k in range(len(NOTES))]
+
+
+def _sample_notes(rng: random.Random, k: int) -> list[str]:
+    seen = []
+    while len(seen) < k:
+        note = rng.choices(NOTES, weights=_NOTE_WEIGHTS)[0]
+        if note not in seen:
+            seen.append(note)
+    return seen
+
+
+def product_fields(rng: random.Random, i: int) -> dict:
+    """Поля одного синтетического товара (без brand/category)."""
+    top, middle, base = (_sample_notes(rng, rng.randint(2, 4)) for _ in range(3))
+    accords = {a: rng.randint(30, 100) for a in rng.sample(ACCORDS, 4)}
+    return {
+        'name':         f'Synthetic {i:07d}',
+        'description':  (f'Top notes are {", ".join(top)}; middle notes are '
+                         f'{", ".join(middle)}; base notes are {", ".join(base)}.'),
+        'price':        Decimal(rng.randint(2000, 35000)) / 100,
+        'stock':        rng.randint(5, 50),
+        'volume':       rng.choice((50, 100, 200)),
+        'top_notes':    ', '.join(top),
+        'middle_notes': ', '.join(middle),
+        'base_notes':   ', '.join(base),
+        'main_accords': accords,
+    }
+
+
+def seed_catalogue(n_products: int, n_brands: int | None = None, seed: int = 42,
+                   batch_size: int = 2000, progress=None) -> dict:
+    """
+    Создаёт n_products товаров (и бренды/категории) через bulk_create.
+
+    progress — функция (created, total) для вывода прогресса.
+    Возвращает {'brands': [...], 'categories': [...], 'n_products': n}.
+    """
+    from shop.models import Brand, Category, Product
+
+    rng      = random.Random(seed)
+    n_brands = n_brands or max(10, n_products // 200)
+
+    brands = Brand.objects.bulk_create(
+        [Brand(name=f'Synthetic Brand {i:05d}') for i in range(n_brands)]
+    )
+    categories = Category.objects.bulk_create([Category(name=c) for c in CATEGORIES])
+
+    batch = []
+    for i in range(n_products):
+        batch.append(Product(brand=rng.choice(brands), category=rng.choice(categories),
+                             **product_fields(rng, i)))
+        if len(batch) >= batch_size:
+            Product.objects.bulk_create(batch)
+            batch = []
+            if progress:
+                progress(i + 1, n_products)
+    if batch:
+        Product.objects.bulk_create(batch)
+        if progress:
+            progress(n_products, n_products)
+
+    return {'brands': brands, 'categories': categories, 'n_products': n_products}
+
+
+def reference_records(n: int, seed: int = 7) -> list[dict]:
+    """Записи в формате датасета pelegelraz (для обучения SVD без сети)."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        notes = _sample_notes(rng, rng.randint(5, 10))
+        base  = notes[-rng.randint(2, 3):]
+        family = rng.choice(FAMILIES)
+        out.append({
+            'all_notes':  ','.join(notes),
+            'base_notes': ','.join(base),
+            'family':     family,
+            'professional_description':
+                f'A {family} fragrance built around {notes[0]} and {notes[1]} '
+                f'with a {" and ".join(base)} base.',
+        })
+    return out
+
+
+def feature_strings(n_products: int, seed: int = 42):
+    """
+    (pk, признаковая строка) для n_products синтетических товаров без БД:
+    те же поля, что у seed_catalogue, через recommender._shop_product_feature_string.
+    """
+    from shop.models import Category, Product
+    from shop.recommender import _shop_product_feature_string
+
+    rng = random.Random(seed)
+    categories = [Category(name=c) for c in CATEGORIES]
+    for i in range(n_products):
+        product = Product(pk=i + 1, category=rng.choice(categories), **product_fields(rng, i))
+        yield product.pk, _shop_product_feature_string(product)
@@ -2,6 +2,9 @@
 Template tags for the shop application.
 """
 from django import template
+from django.http import QueryDict
+
+from shop.context_processors import group_names
 
 register = template.Library()
 
@@ -9,19 +12,23 @@ register = template.Library()
 @register.filter
 def has_group(user, group_name):
     """Check if a user is a member of a specified group."""
-    return user.groups.filter(name=group_name).exists()
+    return group_name in group_names(user)
 
 
 @register.simple_tag(takes_context=True)
-def page_url(context, page_num):
+def page_url(context, page_num=None, cursor=None):
     """
     Build a pagination URL preserving existing GET parameters
-    but replacing the 'page' parameter.
-    Usage: {% page_url 3 %}
+    but replacing the 'page' parameter, or the opaque 'cursor'
+    parameter in keyset pagination mode.
+    Usage: {% page_url 3 %} or {% page_url cursor=page_obj.next_cursor %}
     """
     request = context.get('request')
-    if request:
-        params = request.GET.copy()
+    params = request.GET.copy() if request else QueryDict(mutable=True)
+    if cursor is not None:
+        params.pop('page', None)
+        params['cursor'] = cursor
+    else:
+        params.pop('cursor', None)
         params['page'] = str(page_num)
-        return '?' + params.urlencode()
-    return f'?page={page_num}'
\ No newline at end of file
+    return '?' + params.urlencode()
@@ -1,11 +1,29 @@
+import importlib.util
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import ANY, patch
 from django.template.loader import render_to_string
-from django.test import TestCase, Client, RequestFactory
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User, Group
 from django.utils import timezone
 from django.contrib.messages.storage.fallback import FallbackStorage
 from shop.models import Brand, Category, Product, Order, OrderItem, Discount
 from shop.filters import ProductFilter
+from shop import autocomplete, caching, discounts, metrics, recommendations, sidecar
+from shop import search as product_search
 from shop.templatetags.shop_tags import has_group
 from shop.views import (
     register, product_list, add_to_cart, cart, checkout,
@@ -594,4 +612,1539 @@ class OrderSuccessTemplateTests(TestCase):
         # Check for the presence of the alert-success class.
         self.assertIn('class="alert alert-success"', rendered)
         # Verify the presence of the check-circle icon.
-        self.assertIn('bi-check-circle-fill', rendered)
\ No newline at end of file
+        self.assertIn('bi-check-circle-fill', rendered)
+
+class DiscountIndexTests(TestCase):
+    """Снимок активных скидок (shop/discounts.py)."""
+
+    def setUp(self):
+        discounts.invalidate()
+        now = timezone.now()
+        self.brand = Brand.objects.create(name='Index Brand')
+        self.other_brand = Brand.objects.create(name='Other Brand')
+        self.category = Category.objects.create(name='Index Category')
+        self.product = Product.objects.create(
+            name='Indexed', brand=self.brand, category=self.category, price=100, stock=5
+        )
+        self.brand_discount = Discount.objects.create(
+            discount_type='product', value_type='percentage', value=5,
+            start_date=now - timezone.timedelta(days=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+        self.brand_discount.brands.add(self.brand)
+
+    def test_best_product_discount_across_relations(self):
+        now = timezone.now()
+        better = Discount.objects.create(
+            discount_type='product', value_type='percentage', value=20,
+            start_date=now - timezone.timedelta(days=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+        better.categories.add(self.category)
+        self.assertEqual(discounts.best_product_discount(self.product), better)
+
+    def test_lookup_uses_no_queries_when_warm(self):
+        discounts.get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(discounts.best_product_discount(self.product), self.brand_discount)
+
+    def test_m2m_change_invalidates_snapshot(self):
+        self.assertIsNotNone(discounts.best_product_discount(self.product))
+        self.brand_discount.brands.remove(self.brand)
+        self.brand_discount.brands.add(self.other_brand)
+        self.assertIsNone(discounts.best_product_discount(self.product))
+
+    def test_exhausted_discount_is_skipped(self):
+        self.brand_discount.max_uses = 3
+        self.brand_discount.uses = 3
+        self.brand_discount.save()
+        self.assertIsNone(discounts.best_product_discount(self.product))
+
+    def test_snapshot_stale_at_window_boundary(self):
+        now = timezone.now()
+        upcoming = Discount.objects.create(
+            discount_type='promo', value_type='fixed', value=10, code='SOON',
+            start_date=now + timezone.timedelta(hours=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+        snap = discounts.get_snapshot()
+        self.assertNotIn('SOON', snap.promo_codes)
+        self.assertEqual(snap.next_start, upcoming.start_date)
+        later = now + timezone.timedelta(hours=2)
+        self.assertTrue(snap.is_stale(later, snap.version))
+        self.assertIn('SOON', discounts.build_snapshot(now=later).promo_codes)
+
+    def test_version_is_read_from_cache_once_per_interval(self):
+        snap = discounts.get_snapshot()
+        # Другой воркер сменил версию — заметим её только после интервала
+        cache.set(discounts.VERSION_KEY, 'from-another-worker', timeout=None)
+        self.assertIs(discounts.get_snapshot(), snap)
+        later = time.monotonic() + discounts.VERSION_CHECK_INTERVAL + 1
+        with patch('shop.discounts.time.monotonic', return_value=later):
+            rebuilt = discounts.get_snapshot()
+        self.assertIsNot(rebuilt, snap)
+        self.assertEqual(rebuilt.version, 'from-another-worker')
+
+    def test_version_does_not_repeat_after_cache_flush(self):
+        snap = discounts.get_snapshot()
+        cache.clear()
+        later = time.monotonic() + discounts.VERSION_CHECK_INTERVAL + 1
+        with patch('shop.discounts.time.monotonic', return_value=later):
+            self.assertNotEqual(discounts.get_snapshot().version, snap.version)
+
+    def test_promo_pricing_leaves_snapshot_untouched(self):
+        now = timezone.now()
+        Discount.objects.create(
+            discount_type='promo', value_type='fixed', value=10, code='KEEP', max_uses=5,
+            start_date=now - timezone.timedelta(days=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+        promo = discounts.find_promo('KEEP')
+        with self.assertNumQueries(0):
+            self.assertEqual(apply_promo_code('KEEP', 100, [{'quantity': 1}]), 10)
+        self.assertEqual(promo.uses, 0)
+        self.assertIs(discounts.find_promo('KEEP'), promo)
+
+    def test_order_discounts_filtered_by_threshold(self):
+        now = timezone.now()
+        window = dict(start_date=now - timezone.timedelta(days=1),
+                      end_date=now + timezone.timedelta(days=1))
+        small = Discount.objects.create(discount_type='order', value_type='fixed',
+                                        value=5, min_order_value=50, **window)
+        big = Discount.objects.create(discount_type='order', value_type='fixed',
+                                      value=30, min_order_value=200, **window)
+        self.assertEqual(discounts.eligible_order_discounts(100), [small])
+        self.assertEqual(discounts.eligible_order_discounts(250), [small, big])
+
+
+class CheckoutTests(TestCase):
+    """Атомарное оформление заказа."""
+
+    def setUp(self):
+        discounts.invalidate()
+        self.user = User.objects.create_user(username='buyer', password='password')
+        self.client.login(username='buyer', password='password')
+        brand = Brand.objects.create(name='Checkout Brand')
+        category = Category.objects.create(name='Checkout Category')
+        self.product1 = Product.objects.create(name='P1', brand=brand, category=category,
+                                               price=Decimal('10.00'), stock=5)
+        self.product2 = Product.objects.create(name='P2', brand=brand, category=category,
+                                               price=Decimal('20.00'), stock=1)
+
+    def _set_cart(self, cart):
+        session = self.client.session
+        session['cart'] = cart
+        session.save()
+
+    def test_checkout_creates_order_and_decrements_stock(self):
+        self._set_cart({str(self.product1.pk): 2, str(self.product2.pk): 1})
+        response = self.client.post(reverse('checkout'))
+        self.assertRedirects(response, reverse('order_success'))
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.total_price, Decimal('40.00'))
+        self.assertEqual(order.orderitem_set.count(), 2)
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product1.stock, 3)
+        self.assertEqual(self.product2.stock, 0)
+        self.assertEqual(self.client.session['cart'], {})
+
+    def test_checkout_rolls_back_when_stock_is_short(self):
+        self._set_cart({str(self.product1.pk): 2, str(self.product2.pk): 3})
+        response = self.client.post(reverse('checkout'))
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 5)
+
+    def test_checkout_names_the_short_product(self):
+        self._set_cart({str(self.product1.pk): 4, str(self.product2.pk): 3})
+        response = self.client.post(reverse('checkout'), follow=True)
+        messages = [str(m) for m in response.context['messages']]
+        self.assertIn('Not enough stock for P2.', messages)
+        self.assertNotIn('Not enough stock for P1.', messages)
+
+    def test_checkout_retries_when_stock_is_topped_up(self):
+        # Первый UPDATE «не нашёл» остатков, а к повторному чтению их хватает
+        real_update = QuerySet.update
+        calls = []
+
+        def flaky_update(qs, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else real_update(qs, **kwargs)
+
+        self._set_cart({str(self.product1.pk): 2})
+        with patch.object(QuerySet, 'update', flaky_update):
+            response = self.client.post(reverse('checkout'))
+        self.assertRedirects(response, reverse('order_success'))
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 3)
+
+    def test_checkout_reports_generic_shortage_after_retries(self):
+        self._set_cart({str(self.product1.pk): 2})
+        with patch.object(QuerySet, 'update', return_value=0):
+            response = self.client.post(reverse('checkout'), follow=True)
+        messages = [str(m) for m in response.context['messages']]
+        self.assertIn('Not enough stock for some items.', messages)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_applies_order_discount_to_final_total(self):
+        now = timezone.now()
+        Discount.objects.create(
+            discount_type='order', value_type='fixed', value=5, min_order_value=30,
+            start_date=now - timezone.timedelta(days=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+        self._set_cart({str(self.product1.pk): 2, str(self.product2.pk): 1})
+        self.client.post(reverse('checkout'))
+        self.assertEqual(Order.objects.get(user=self.user).discount_applied, Decimal('5.00'))
+
+
+class PromoRedemptionTests(TestCase):
+    """Промокод погашается только при оформлении заказа."""
+
+    def setUp(self):
+        discounts.invalidate()
+        now = timezone.now()
+        self.user = User.objects.create_user(username='promo', password='password')
+        self.client.login(username='promo', password='password')
+        brand = Brand.objects.create(name='Promo Brand')
+        category = Category.objects.create(name='Promo Category')
+        self.product = Product.objects.create(name='P', brand=brand, category=category,
+                                              price=Decimal('100.00'), stock=10)
+        self.promo = Discount.objects.create(
+            discount_type='promo', value_type='fixed', value=10, code='ONCE', max_uses=1,
+            start_date=now - timezone.timedelta(days=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+        session = self.client.session
+        session['cart'] = {str(self.product.pk): 1}
+        session.save()
+
+    def test_cart_post_does_not_consume_promo(self):
+        self.client.post(reverse('cart'), {'promo_code': 'ONCE'})
+        self.client.post(reverse('cart'), {'promo_code': 'ONCE'})
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.uses, 0)
+        self.assertEqual(self.client.session['promo_code'], 'ONCE')
+
+    def test_checkout_redeems_promo(self):
+        self.client.post(reverse('cart'), {'promo_code': 'ONCE'})
+        self.client.post(reverse('checkout'))
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.uses, 1)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.promo_code, 'ONCE')
+        self.assertEqual(order.discount_applied, Decimal('10.00'))
+
+    def test_checkout_rejects_exhausted_promo(self):
+        self.client.post(reverse('cart'), {'promo_code': 'ONCE'})
+        Discount.objects.filter(pk=self.promo.pk).update(uses=1)
+        response = self.client.post(reverse('checkout'))
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        self.assertNotIn('promo_code', self.client.session)
+
+    def test_checkout_looks_promo_up_once(self):
+        self.client.post(reverse('cart'), {'promo_code': 'ONCE'})
+        with patch.object(discounts, 'find_promo', wraps=discounts.find_promo) as find:
+            self.client.post(reverse('checkout'))
+        find.assert_called_once_with('ONCE')
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.uses, 1)
+
+    def test_redeem_missing_promo_is_rejected(self):
+        self.assertFalse(discounts.redeem_promo(None))
+
+
+class PromoConcurrencyTests(TransactionTestCase):
+    """Нагрузочная проверка: 100 параллельных погашений не превышают max_uses."""
+
+    REDEMPTIONS = 100
+    MAX_USES = 60
+
+    def setUp(self):
+        discounts.invalidate()
+        now = timezone.now()
+        self.promo = Discount.objects.create(
+            discount_type='promo', value_type='fixed', value=1, code='RACE',
+            max_uses=self.MAX_USES,
+            start_date=now - timezone.timedelta(days=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+
+    def test_parallel_redemptions_are_counted_exactly(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.db import connection
+
+        barrier = threading.Barrier(self.REDEMPTIONS)
+
+        def redeem(_):
+            barrier.wait()
+            try:
+                return discounts.redeem_promo(self.promo)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.REDEMPTIONS) as pool:
+            results = list(pool.map(redeem, range(self.REDEMPTIONS)))
+
+        self.promo.refresh_from_db()
+        self.assertEqual(sum(results), self.MAX_USES)
+        self.assertEqual(self.promo.uses, self.MAX_USES)
+
+
+class SearchMigrationTests(TransactionTestCase):
+    """Начальное заполнение индекса в миграции 0005 совпадает с search._document."""
+
+    def test_initial_fill_matches_signal_documents(self):
+        from django.core.management import call_command
+        brand = Brand.objects.create(name='Migrated Brand')
+        category = Category.objects.create(name='Migrated Category')
+        product = Product.objects.create(
+            name='Migrated Scent', brand=brand, category=category, price=10,
+            top_notes='bergamot', main_accords={'leathery': 80})
+        call_command('migrate', 'shop', '0004', verbosity=0)
+        call_command('migrate', 'shop', '0005', verbosity=0)
+        self.assertEqual(product_search.search_pks('leathery'), [(product.pk, ANY)])
+        self.assertEqual(product_search.search_pks('bergamot'), [(product.pk, ANY)])
+
+
+class IndexBenchmarkTests(TransactionTestCase):
+    """benchmark_indexes: отчёт и неизменная схема после прогона."""
+
+    TABLES = ('shop_brand', 'shop_product', 'shop_order', 'shop_discount')
+
+    def _schema(self):
+        with connection.cursor() as cursor:
+            return {table: sorted(connection.introspection.get_constraints(cursor, table))
+                    for table in self.TABLES}
+
+    def test_small_run_reports_and_restores_indexes(self):
+        from django.core.management import call_command
+        from shop.management.commands import benchmark_indexes as command
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        results_dir = Path(tmp.name)
+        before = self._schema()
+        # Временная база подменяется базой теста — она и так временная
+        with patch.object(connection.creation, 'create_test_db') as create, \
+                patch.object(connection.creation, 'destroy_test_db') as destroy, \
+                patch.object(command, 'RESULTS_DIR', results_dir), \
+                patch.object(command, 'RESULTS_FILE', results_dir / 'index_benchmark.json'):
+            call_command('benchmark_indexes', '--products', '50', '--orders', '20',
+                         '--repeat', '1', stdout=io.StringIO())
+        create.assert_called_once()
+        destroy.assert_called_once()
+        self.assertEqual(self._schema(), before)
+
+        report = json.loads((results_dir / 'index_benchmark.json').read_text(encoding='utf-8'))
+        self.assertEqual(report['products'], 50)
+        self.assertEqual(set(report['results']), {'before', 'after'})
+        labels = {'product_list', 'import_lookup', 'active_discounts', 'orders_by_status'}
+        for phase in report['results'].values():
+            self.assertEqual(set(phase), labels)
+            for entry in phase.values():
+                self.assertEqual(set(entry), {'plan', 'median_ms', 'min_ms'})
+
+
+@override_settings(SHOP_KEYSET_PAGINATION=True)
+class KeysetPaginationTests(TestCase):
+    """Keyset-пагинация product_list."""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Keyset Category')
+        self.products = []
+        for b in ('Alpha', 'Beta', 'Gamma'):
+            brand = Brand.objects.create(name=b)
+            for i in range(20):
+                self.products.append(Product.objects.create(
+                    name=f'{b} scent {i:02d}', brand=brand, category=category, price=10))
+        self.expected = [p.pk for p in self.products]
+
+    def _walk(self):
+        seen, url = [], reverse('product_list')
+        while url:
+            response = self.client.get(url)
+            page = response.context['page_obj']
+            seen.extend(p.pk for p in page)
+            url = (reverse('product_list') + f'?cursor={page.next_cursor}'
+                   if page.has_next() else None)
+        return seen, page
+
+    def test_walk_forward_covers_catalogue_in_order(self):
+        seen, _ = self._walk()
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_cursor_returns_preceding_page(self):
+        _, last = self._walk()
+        response = self.client.get(reverse('product_list') + f'?cursor={last.previous_cursor}')
+        page = response.context['page_obj']
+        self.assertEqual([p.pk for p in page], self.expected[25:50])
+        self.assertTrue(page.has_previous())
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('product_list') + '?cursor=garbage')
+        self.assertEqual([p.pk for p in response.context['page_obj']], self.expected[:25])
+
+    def test_count_is_cached_per_filter(self):
+        self.client.get(reverse('product_list'))
+        Product.objects.create(name='Late', brand=self.products[0].brand,
+                               category=self.products[0].category, price=1)
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 60)
+
+    def test_page_url_replaces_page_with_cursor(self):
+        request = RequestFactory().get('/', {'page': '3', 'brand': '1'})
+        rendered = Template('{% load shop_tags %}{% page_url cursor="abc" %}').render(
+            Context({'request': request}))
+        self.assertIn('cursor=abc', rendered)
+        self.assertIn('brand=1', rendered)
+        self.assertNotIn('page=', rendered)
+
+
+class FragmentCacheTests(TestCase):
+    """Фрагментный кэш боковой панели фильтров и карточек товаров."""
+
+    def setUp(self):
+        cache.clear()
+        self.brand = Brand.objects.create(name='Cached Brand')
+        self.category = Category.objects.create(name='Cached Category')
+        self.product = Product.objects.create(name='Cached Scent', brand=self.brand,
+                                              category=self.category, price=10)
+
+    def test_sidebar_and_cards_served_from_cache(self):
+        url = reverse('product_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        tables = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('FROM "shop_category"', tables)
+        self.assertContains(response, 'Cached Brand')
+
+    def test_brand_save_invalidates_sidebar(self):
+        self.client.get(reverse('product_list'))
+        Brand.objects.create(name='Fresh Brand')
+        self.assertContains(self.client.get(reverse('product_list')), 'Fresh Brand')
+
+    def test_product_save_invalidates_card(self):
+        self.client.get(reverse('product_list'))
+        self.product.name = 'Renamed Scent'
+        self.product.save()
+        self.assertContains(self.client.get(reverse('product_list')), 'Renamed Scent')
+
+    def _mark_card(self, product):
+        # Подменяем закэшированную карточку: если она не перерисуется, метка останется
+        from django.core.cache.utils import make_template_fragment_key
+        response = self.client.get(reverse('product_list'))
+        card = next(p for p in response.context['products'] if p.pk == product.pk)
+        key = make_template_fragment_key('product_card', [
+            product.pk, card.updated_at.isoformat(), card.card_version])
+        self.assertIsNotNone(cache.get(key))
+        cache.set(key, f'CARD-MARK-{product.pk}')
+
+    def test_product_save_keeps_other_cards(self):
+        other = Product.objects.create(name='Other Scent', brand=self.brand,
+                                       category=self.category, price=20)
+        self._mark_card(other)
+        self.product.name = 'Renamed Scent'
+        self.product.save()
+        response = self.client.get(reverse('product_list'))
+        self.assertContains(response, f'CARD-MARK-{other.pk}')
+        self.assertContains(response, 'Renamed Scent')
+
+    def test_brand_save_invalidates_its_cards(self):
+        self._mark_card(self.product)
+        self.brand.name = 'Renamed Brand'
+        self.brand.save()
+        self.assertNotContains(self.client.get(reverse('product_list')),
+                               f'CARD-MARK-{self.product.pk}')
+
+    def test_sidebar_varies_on_selected_filters(self):
+        self.client.get(reverse('product_list'))
+        response = self.client.get(reverse('product_list'), {'brand': self.brand.pk})
+        self.assertContains(response, f'<option value="{self.brand.pk}"\n              selected>')
+
+    def test_sidebar_key_ignores_unrelated_params(self):
+        url = reverse('product_list')
+        other = Brand.objects.create(name='Second Brand')
+        self.client.get(url, {'brand': [other.pk, self.brand.pk], 'volume': '50'})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url + f'?volume=50&utm_source=mail&brand={self.brand.pk}'
+                                  f'&brand={other.pk}&brand={other.pk}&price_min=')
+        tables = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('FROM "shop_category"', tables)
+
+    def test_filter_key_is_normalised(self):
+        from django.http import QueryDict
+        self.assertEqual(caching.filter_key(QueryDict('volume=50&brand=2&brand=1&brand=2&fbclid=x')),
+                         'brand=1&brand=2&volume=50')
+        self.assertEqual(caching.filter_key(QueryDict('page=3&price_max=')), '')
+
+
+class GroupCacheTests(TestCase):
+    """Группы пользователя загружаются один раз за запрос."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='seller', password='password')
+        self.user.groups.add(Group.objects.create(name='Sellers'))
+
+    def test_has_group_queries_once_per_user_object(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(has_group(user, 'Sellers'))
+            self.assertFalse(has_group(user, 'Buyers'))
+            self.assertTrue(views.is_seller(user))
+
+    def test_membership_change_resets_cached_groups(self):
+        self.assertTrue(has_group(self.user, 'Sellers'))
+        self.user.groups.clear()
+        self.assertFalse(has_group(self.user, 'Sellers'))
+
+    def test_context_processor_exposes_groups(self):
+        self.client.login(username='seller', password='password')
+        response = self.client.get(reverse('order_success'))
+        self.assertIn('Sellers', response.context['user_groups'])
+        self.assertContains(response, reverse('manage_products'))
+
+    def test_anonymous_page_view_skips_group_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('order_success'))
+        self.assertFalse(any('auth_group' in q['sql'] for q in ctx.captured_queries))
+
+
+class ConditionalGetTests(TestCase):
+    """ETag / Last-Modified для каталога и карточки товара."""
+
+    def setUp(self):
+        cache.clear()
+        discounts.invalidate()
+        self.brand = Brand.objects.create(name='Etag Brand')
+        self.category = Category.objects.create(name='Etag Category')
+        self.product = Product.objects.create(name='Etag Scent', brand=self.brand,
+                                              category=self.category, price=50)
+
+    def _revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_product_list_not_modified(self):
+        response = self._revalidate(reverse('product_list'))
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_list_etag_needs_no_catalogue_scan(self):
+        url = reverse('product_list')
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('Last-Modified', response)
+        self.assertFalse([q for q in ctx.captured_queries if 'shop_product' in q['sql']])
+
+    def test_product_list_etag_changes_after_product_delete(self):
+        url = reverse('product_list')
+        Product.objects.create(name='Older Scent', brand=self.brand,
+                               category=self.category, price=40)
+        etag = self.client.get(url)['ETag']
+        self.product.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_messages_disable_conditional_list(self):
+        url = reverse('product_list')
+        self.client.get(url)
+        self.client.post(reverse('add_to_cart', args=[self.product.pk]))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_product_list_etag_changes_after_product_save(self):
+        url = reverse('product_list')
+        etag = self.client.get(url)['ETag']
+        self.product.price = 60
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_list_etag_depends_on_filters(self):
+        etag = self.client.get(reverse('product_list'))['ETag']
+        response = self.client.get(reverse('product_list'), {'volume': '50'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_detail_not_modified(self):
+        response = self._revalidate(reverse('product_detail', args=[self.product.pk]))
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_detail_etag_changes_with_discount(self):
+        url = reverse('product_detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        now = timezone.now()
+        sale = Discount.objects.create(
+            discount_type='product', value_type='percentage', value=10,
+            start_date=now - timezone.timedelta(days=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+        sale.products.add(self.product)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_checkout_changes_product_detail_etag(self):
+        user = User.objects.create_user(username='etag_buyer', password='password')
+        self.client.force_login(user)
+        self.product.stock = 5
+        self.product.save()
+        url = reverse('product_detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('add_to_cart', args=[self.product.pk]))
+        self.client.post(reverse('checkout'))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 4)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '4')
+
+    def test_pending_messages_disable_etag(self):
+        self.client.post(reverse('add_to_cart', args=[self.product.pk]))
+        self.assertNotIn('ETag', self.client.get(reverse('product_list')))
+
+
+class SearchTests(TestCase):
+    """Полнотекстовый поиск (FTS5), синхронизируемый сигналами."""
+
+    def setUp(self):
+        self.brand = Brand.objects.create(name='Maison Lumiere')
+        category = Category.objects.create(name='Search Category')
+        self.rose = Product.objects.create(
+            name='Rose Absolue', brand=self.brand, category=category, price=10,
+            description='A bright floral.', top_notes='bergamot', base_notes='musk')
+        self.oud = Product.objects.create(
+            name='Midnight Oud', brand=self.brand, category=category, price=10,
+            description='Smoky wood with a hint of rose.', base_notes='oud, amber')
+
+    def test_prefix_match_and_ranking(self):
+        pks = [pk for pk, _ in product_search.search_pks('ros')]
+        self.assertEqual(pks, [self.rose.pk, self.oud.pk])
+
+    def test_terms_are_combined_with_and(self):
+        pks = [pk for pk, _ in product_search.search_pks('rose amber')]
+        self.assertEqual(pks, [self.oud.pk])
+
+    def test_notes_and_brand_are_searchable(self):
+        self.assertEqual([pk for pk, _ in product_search.search_pks('bergamot')], [self.rose.pk])
+        self.assertEqual(len(product_search.search_pks('lumiere')), 2)
+
+    def test_index_follows_product_and_brand_changes(self):
+        self.oud.name = 'Midnight Leather'
+        self.oud.save()
+        self.assertEqual(product_search.search_pks('oud midnight'), [(self.oud.pk, ANY)])
+        self.brand.name = 'Atelier Nord'
+        self.brand.save()
+        self.assertEqual(len(product_search.search_pks('atelier')), 2)
+        self.rose.delete()
+        self.assertEqual(len(product_search.search_pks('atelier')), 1)
+
+    def test_rebuild_restores_bulk_created_products(self):
+        Product.objects.bulk_create([Product(name='Vetiver Storm', brand=self.brand,
+                                             category=self.rose.category, price=10)])
+        self.assertEqual(product_search.search_pks('vetiver'), [])
+        product_search.rebuild()
+        self.assertEqual(len(product_search.search_pks('vetiver')), 1)
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search'), {'q': 'midnight'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([i['product'] for i in response.context['results']], [self.oud])
+
+
+class AutocompleteTests(TestCase):
+    """Подсказки /recommend/autocomplete/ из префиксного индекса в памяти."""
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset()
+        self.brand = Brand.objects.create(name='Rosendo Mateu')
+        category = Category.objects.create(name='Auto Category')
+        for i in range(3):
+            Product.objects.create(name=f'Rosewood {i}', brand=self.brand, category=category,
+                                   price=10, top_notes='rose, bergamot',
+                                   base_notes='turkish rose, musk',
+                                   main_accords={'rosy': 80, 'woody': 50})
+        Product.objects.create(name='Rogue', brand=self.brand, category=category, price=10,
+                               top_notes='rosemary')
+
+    def test_suggestions_ranked_by_frequency(self):
+        texts = [s['text'] for s in autocomplete.suggest('ros', limit=4)]
+        self.assertEqual(texts, ['Rosendo Mateu', 'rose', 'turkish rose', 'rosy'])
+
+    def test_prefix_matches_inner_words(self):
+        texts = [s['text'] for s in autocomplete.suggest('turk')]
+        self.assertEqual(texts, ['turkish rose'])
+        self.assertIn('turkish rose', [s['text'] for s in autocomplete.suggest('rose')])
+
+    def test_warm_index_answers_without_queries(self):
+        autocomplete.suggest('r')
+        with self.assertNumQueries(0):
+            self.assertTrue(autocomplete.suggest('rosem'))
+
+    def test_catalogue_change_rebuilds_index(self):
+        autocomplete.suggest('r')
+        Brand.objects.create(name='Roja Parfums')
+        # Перестройка идёт в фоне; в тесте выполняем её синхронно
+        with patch.object(autocomplete, '_start_rebuild', autocomplete._build):
+            self.assertEqual(autocomplete.suggest('roj'), [])
+        self.assertIn('Roja Parfums', [s['text'] for s in autocomplete.suggest('roj')])
+
+    def test_failed_first_build_degrades_and_retries(self):
+        from django.db import OperationalError
+        with patch.object(autocomplete, '_build', side_effect=OperationalError('no such table')), \
+                self.assertLogs('shop.autocomplete', 'ERROR'):
+            self.assertEqual(autocomplete.suggest('ros'), [])
+            response = self.client.get(reverse('recommend_autocomplete'), {'q': 'ros'})
+        self.assertEqual(response.json()['suggestions'], [])
+        self.assertIn('rose', [s['text'] for s in autocomplete.suggest('ros')])
+
+    def test_endpoint_returns_json(self):
+        response = self.client.get(reverse('recommend_autocomplete'), {'q': 'Mus', 'limit': 'x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['suggestions'], [{'text': 'musk', 'kind': 'note'}])
+
+
+def _tiny_model(products):
+    """Небольшая модель TF-IDF + SVD по описаниям товаров (для тестов API)."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.preprocessing import normalize
+
+    texts = [p.description for p in products]
+    vectorizer = TfidfVectorizer().fit(texts)
+    tfidf = vectorizer.transform(texts)
+    svd = TruncatedSVD(n_components=min(4, tfidf.shape[1] - 1), random_state=0).fit(tfidf)
+    return {
+        'vectorizer':        vectorizer,
+        'svd':               svd,
+        'shop_reduced_norm': normalize(svd.transform(tfidf)),
+        'product_pks':       [p.pk for p in products],
+    }
+
+
+@skipUnless(importlib.util.find_spec('sklearn'), 'scikit-learn is not installed')
+class RecommendationApiTests(TestCase):
+    """JSON API рекомендаций."""
+
+    def setUp(self):
+        brand = Brand.objects.create(name='Api Brand')
+        category = Category.objects.create(name='Api Category')
+        descriptions = ['rose jasmine peony', 'rose jasmine lily', 'cedar vetiver smoke',
+                        'cedar vetiver leather', 'vanilla amber musk']
+        self.products = [
+            Product.objects.create(name=f'Api {i}', brand=brand, category=category,
+                                   price=10, description=d)
+            for i, d in enumerate(descriptions)
+        ]
+        patcher = patch('shop.recommendations.load_model_safe',
+                        return_value=(_tiny_model(self.products), None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recommend_returns_projection(self):
+        response = self.client.get(reverse('api_recommend'), {'q': 'cedar vetiver', 'top_n': 2})
+        results = response.json()['results']
+        self.assertEqual({r['pk'] for r in results}, {self.products[2].pk, self.products[3].pk})
+        self.assertEqual(results[0]['product']['brand'], 'Api Brand')
+        self.assertEqual(set(results[0]['product']),
+                         {'pk', 'name', 'brand', 'category', 'price', 'volume', 'image'})
+
+    def test_similar_excludes_product_itself(self):
+        pk = self.products[0].pk
+        results = self.client.get(reverse('api_similar', args=[pk]), {'top_n': 1}).json()['results']
+        self.assertEqual([r['pk'] for r in results], [self.products[1].pk])
+
+    def test_batch_matches_single_calls(self):
+        body = {'queries': ['rose jasmine', 'vanilla'], 'pks': [self.products[2].pk], 'top_n': 1}
+        response = self.client.post(reverse('api_recommend_batch'), body,
+                                    content_type='application/json')
+        batched = [r['results'] for r in response.json()['results']]
+        single = [
+            self.client.get(reverse('api_recommend'), {'q': 'rose jasmine', 'top_n': 1}).json()['results'],
+            self.client.get(reverse('api_recommend'), {'q': 'vanilla', 'top_n': 1}).json()['results'],
+            self.client.get(reverse('api_similar', args=[self.products[2].pk]),
+                            {'top_n': 1}).json()['results'],
+        ]
+        self.assertEqual(batched, single)
+
+    def test_batch_stream_returns_ndjson(self):
+        body = {'queries': ['rose', 'cedar'], 'stream': True}
+        response = self.client.post(reverse('api_recommend_batch'), body,
+                                    content_type='application/json')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['query'] for line in lines], ['rose', 'cedar'])
+
+    def test_batch_validation(self):
+        response = self.client.post(reverse('api_recommend_batch'), {'pks': ['x']},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RecommendationApiErrorTests(TestCase):
+    def test_missing_model_returns_503(self):
+        with patch('shop.recommendations.load_model_safe', return_value=(None, 'no model')):
+            response = self.client.get(reverse('api_recommend'), {'q': 'rose'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {'error': 'no model'})
+
+    def test_missing_query_returns_400(self):
+        self.assertEqual(self.client.get(reverse('api_recommend')).status_code, 400)
+
+
+class AsyncViewTests(TestCase):
+    """product_detail и recommend как async-представления (AsyncClient)."""
+
+    def setUp(self):
+        cache.clear()
+        discounts.invalidate()
+        brand = Brand.objects.create(name='Async Brand')
+        category = Category.objects.create(name='Async Category')
+        self.product = Product.objects.create(name='Async Scent', brand=brand,
+                                              category=category, price=100)
+        self.other = Product.objects.create(name='Async Other', brand=brand,
+                                            category=category, price=80)
+        now = timezone.now()
+        discount = Discount.objects.create(
+            discount_type='product', value_type='percentage', value=10,
+            start_date=now - timezone.timedelta(days=1),
+            end_date=now + timezone.timedelta(days=1),
+        )
+        discount.products.add(self.product)
+
+    async def test_product_detail_scores_similar_and_applies_discount(self):
+        with patch('shop.recommendations.similar_pairs',
+                   return_value=[(self.other.pk, 0.5)]) as similar_pairs:
+            response = await self.async_client.get(
+                reverse('product_detail', args=[self.product.pk]))
+        self.assertEqual(response.status_code, 200)
+        similar_pairs.assert_called_once_with(self.product.pk, 6)
+        self.assertEqual(response.context['final_price'], 90)
+        self.assertEqual(response.context['similar'],
+                         [{'product': self.other, 'score': 50.0}])
+        self.assertIn('ETag', response)
+
+    async def test_product_detail_not_modified(self):
+        url = reverse('product_detail', args=[self.product.pk])
+        with patch('shop.recommendations.similar_pairs', return_value=[]):
+            etag = (await self.async_client.get(url))['ETag']
+            response = await self.async_client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_product_detail_missing_product(self):
+        with patch('shop.recommendations.similar_pairs', return_value=[]):
+            response = await self.async_client.get(reverse('product_detail', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_recommend_orders_results_by_score(self):
+        pairs = [(self.other.pk, 0.9), (self.product.pk, 0.4)]
+        with patch('shop.recommendations.query_pairs', return_value=(pairs, None)):
+            response = await self.async_client.get(reverse('recommend'), {'q': 'rose'})
+        self.assertEqual([r['product'] for r in response.context['results']],
+                         [self.other, self.product])
+
+    async def test_recommend_reports_model_error(self):
+        with patch('shop.recommendations.query_pairs', return_value=([], 'no model')):
+            response = await self.async_client.get(reverse('recommend'), {'q': 'rose'})
+        self.assertEqual(response.context['error'], 'no model')
+
+
+class RecommenderSidecarTests(TestCase):
+    """Процесс рекомендаций на Unix socket и запасной путь в воркере."""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'rec.sock')
+        self.server = sidecar.RecommenderServer(self.path, loader=lambda: {'fake': True})
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(sidecar.close)
+
+    def test_protocol_roundtrip(self):
+        with override_settings(SHOP_RECOMMENDER_SOCKET=self.path), \
+                patch('shop.recommender.get_similar_pks', return_value=[(7, 0.25)]) as similar, \
+                patch('shop.recommender.get_pks_by_query', return_value=[(3, 0.5), (4, 0.125)]) as query:
+            self.assertEqual(sidecar.similar(5, top_n=2), [(7, 0.25)])
+            self.assertEqual(sidecar.query('роза и ваниль', top_n=2), [(3, 0.5), (4, 0.125)])
+        similar.assert_called_once_with(5, {'fake': True}, top_n=2)
+        query.assert_called_once_with('роза и ваниль', {'fake': True}, top_n=2)
+
+    def test_views_use_sidecar(self):
+        with override_settings(SHOP_RECOMMENDER_SOCKET=self.path), \
+                patch('shop.recommender.get_similar_pks', return_value=[(7, 0.25)]), \
+                patch('shop.recommendations.load_model_safe') as load_model:
+            self.assertEqual(recommendations.similar_pairs(5), [(7, 0.25)])
+        load_model.assert_not_called()
+
+    def test_api_uses_sidecar_like_views(self):
+        brand = Brand.objects.create(name='Sidecar Brand')
+        category = Category.objects.create(name='Sidecar Category')
+        product = Product.objects.create(name='Sidecar Scent', brand=brand,
+                                         category=category, price=10)
+        with override_settings(SHOP_RECOMMENDER_SOCKET=self.path), \
+                patch('shop.recommender.get_pks_by_query', return_value=[(product.pk, 0.5)]), \
+                patch('shop.recommender.get_similar_pks', return_value=[(product.pk, 0.25)]), \
+                patch('shop.recommendations.load_model_safe') as load_model:
+            single = self.client.get(reverse('api_recommend'), {'q': 'rose'}).json()
+            batch = self.client.post(reverse('api_recommend_batch'),
+                                     {'queries': ['rose'], 'pks': [5]},
+                                     content_type='application/json').json()
+        load_model.assert_not_called()
+        self.assertEqual([r['pk'] for r in single['results']], [product.pk])
+        self.assertEqual([[r['score'] for r in e['results']] for e in batch['results']],
+                         [[0.5], [0.25]])
+
+    def test_missing_model_falls_back_in_process(self):
+        self.server._loader = lambda: None
+        self.server._tag = None
+        with override_settings(SHOP_RECOMMENDER_SOCKET=self.path), \
+                patch('shop.recommendations.load_model_safe', return_value=(None, 'no model')):
+            self.assertEqual(recommendations.query_pairs('rose', 5), ([], 'no model'))
+
+    def test_unreachable_socket_falls_back_in_process(self):
+        missing = os.path.join(tempfile.mkdtemp(), 'missing.sock')
+        with override_settings(SHOP_RECOMMENDER_SOCKET=missing), \
+                patch('shop.recommendations.load_model_safe', return_value=(None, 'no model')):
+            self.assertRaises(sidecar.SidecarUnavailable, sidecar.ping)
+            self.assertEqual(recommendations.similar_pairs(5), [])
+
+
+@skipUnless(importlib.util.find_spec('numpy'), 'numpy is not installed')
+class SharedModelTests(TestCase):
+    """Публикация модели в разделяемой памяти и подключение load_model()."""
+
+    def setUp(self):
+        import numpy as np
+        from shop import recommender
+
+        self.recommender = recommender
+        tmp = tempfile.mkdtemp()
+        for name, value in [('MODEL_DIR', Path(tmp)),
+                            ('MODEL_PATH', Path(tmp) / 'model.pkl'),
+                            ('SHM_MANIFEST_PATH', Path(tmp) / 'model.shm.json'),
+                            ('_attached', None)]:
+            patcher = patch.object(recommender, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(recommender.unpublish_model)
+
+        self.norm = np.arange(12, dtype=np.float64).reshape(4, 3)
+        recommender.save_model({'vectorizer': 'v', 'svd': 's',
+                                'shop_reduced_norm': self.norm, 'product_pks': [1, 2, 3, 4]})
+
+    def test_load_model_attaches_without_copy(self):
+        import numpy as np
+
+        manifest = self.recommender.publish_model()
+        model = self.recommender.load_model()
+        np.testing.assert_array_equal(model['shop_reduced_norm'], self.norm)
+        self.assertFalse(model['shop_reduced_norm'].flags.writeable)
+        # pk — тоже представление сегмента, а не список в куче воркера
+        self.assertEqual(model['product_pks'].dtype, np.int64)
+        self.assertFalse(model['product_pks'].flags.writeable)
+        np.testing.assert_array_equal(model['product_pks'], [1, 2, 3, 4])
+        self.assertNotIn('_pk_index', model)
+
+        # Изменение сегмента видно в уже загруженной модели — копии нет
+        shm = self.recommender._shared_memory(manifest['segment'])
+        offset = manifest['buffers'][0][0]
+        np.ndarray((4, 3), dtype=np.float64, buffer=shm.buf, offset=offset)[0, 0] = 42.0
+        self.assertEqual(model['shop_reduced_norm'][0, 0], 42.0)
+        shm.close()
+        self.assertIs(self.recommender.load_model(), model)
+
+    def test_published_pks_resolve_to_ints(self):
+        self.recommender.publish_model()
+        model = self.recommender.load_model()
+        similar = self.recommender.get_similar_pks(2, model, top_n=3)
+        self.assertEqual(len(similar), 3)
+        self.assertNotIn(2, [pk for pk, _ in similar])
+        self.assertTrue(all(type(pk) is int for pk, _ in similar))
+        self.assertEqual(self.recommender._pk_index(model), {1: 0, 2: 1, 3: 2, 4: 3})
+        self.assertEqual(self.recommender.get_similar_pks(99, model), [])
+
+    def test_retrained_file_takes_precedence(self):
+        self.recommender.publish_model()
+        os.utime(self.recommender.MODEL_PATH, ns=(0, 0))
+        model = self.recommender.load_model()
+        self.assertNotIn('_shm', model)
+        self.assertTrue(model['shop_reduced_norm'].flags.owndata)
+
+    def test_republish_replaces_segment(self):
+        from multiprocessing import shared_memory
+
+        first = self.recommender.publish_model()
+        second = self.recommender.publish_model()
+        self.assertNotEqual(first['segment'], second['segment'])
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=first['segment'])
+
+
+class MetricsTests(TestCase):
+    """Гистограммы этапов, /metrics и Server-Timing."""
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_histogram_quantiles(self):
+        for ms in range(1, 101):
+            metrics.observe('score', ms / 1000)
+        hist = metrics.stage('score')
+        self.assertEqual(hist.n, 100)
+        # Оценка по корзинам: в пределах соседней границы (шаг ×2)
+        self.assertTrue(0.025 <= hist.quantile(0.5) <= 0.1, hist.quantile(0.5))
+        self.assertTrue(0.05 <= hist.quantile(0.99) <= 0.2, hist.quantile(0.99))
+        self.assertLessEqual(hist.quantile(0.5), hist.quantile(0.95))
+
+    def test_metrics_endpoint_prometheus_format(self):
+        metrics.observe('encode', 0.002)
+        metrics.count('shop_cache_requests_total', cache='model', result='hit')
+        with self.settings(SHOP_METRICS_ENABLED=True, SHOP_METRICS_ALLOWED_IPS=('127.0.0.1',)):
+            body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE shop_recommender_stage_seconds summary', body)
+        self.assertIn('shop_recommender_stage_seconds{stage="encode",quantile="0.95"}', body)
+        self.assertIn('shop_recommender_stage_seconds_count{stage="encode"} 1', body)
+        self.assertIn('shop_cache_requests_total{cache="model",result="hit"} 1', body)
+
+    def test_metrics_endpoint_is_off_by_default(self):
+        User.objects.create_user(username='ops', password='password', is_staff=True)
+        self.client.login(username='ops', password='password')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    @override_settings(SHOP_METRICS_ENABLED=True)
+    def test_metrics_endpoint_is_not_public(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 404)
+        User.objects.create_user(username='ops', password='password', is_staff=True)
+        self.client.login(username='ops', password='password')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(SHOP_METRICS_ENABLED=True, SHOP_METRICS_ALLOWED_IPS=('10.0.0.5',))
+    def test_metrics_endpoint_allows_listed_scraper(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    def test_recommend_sends_server_timing(self):
+        brand = Brand.objects.create(name='Timing Brand')
+        category = Category.objects.create(name='Timing Category')
+        product = Product.objects.create(name='Timing Scent', brand=brand,
+                                         category=category, price=10)
+
+        def scored(query, top_n):
+            with metrics.timer('score'):
+                return [(product.pk, 0.5)], None
+
+        with patch('shop.recommendations.query_pairs', side_effect=scored):
+            response = self.client.get(reverse('recommend'), {'q': 'rose'})
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(stages, ['score', 'fetch', 'total'])
+        self.assertEqual(metrics.stage('fetch').n, 1)
+
+    def test_discount_snapshot_hits_are_counted(self):
+        discounts.invalidate()
+        discounts.get_snapshot()
+        discounts.get_snapshot()
+        self.assertEqual(metrics.counter_value('shop_cache_requests_total',
+                                               cache='discounts', result='miss'), 1)
+        self.assertEqual(metrics.counter_value('shop_cache_requests_total',
+                                               cache='discounts', result='hit'), 1)
+
+
+@skipUnless(importlib.util.find_spec('sklearn'), 'scikit-learn is not installed')
+class SyntheticModelTests(TestCase):
+    """Синтетический каталог для benchmark_recommender: без БД и детерминированно."""
+
+    def test_feature_strings_are_deterministic(self):
+        from shop.synthetic import feature_strings
+        first = list(feature_strings(20, seed=1))
+        self.assertEqual(first, list(feature_strings(20, seed=1)))
+        self.assertEqual([pk for pk, _ in first], list(range(1, 21)))
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_fit_model_on_synthetic_catalogue(self):
+        from shop.recommender import _pelegelraz_feature_string, fit_model, get_similar_pks
+        from shop.synthetic import feature_strings, reference_records
+
+        pairs = list(feature_strings(50))
+        model = fit_model([_pelegelraz_feature_string(r) for r in reference_records(60)],
+                          [fs for _, fs in pairs], [pk for pk, _ in pairs])
+        self.assertEqual(model['shop_reduced_norm'].shape[0], 50)
+        self.assertEqual(len(get_similar_pks(1, model, top_n=5)), 5)
+
+
+@skipUnless(importlib.util.find_spec('sklearn'), 'scikit-learn is not installed')
+class EvaluationEngineTests(TestCase):
+    """Движок evaluate_recommender: общий проход по модели и параллельные группы."""
+
+    QUERIES = [
+        ('rose jasmine', 'floral', ['rose', 'jasmine']),
+        ('cedar vetiver', 'woody', ['cedar', 'vetiver']),
+    ]
+
+    def setUp(self):
+        brand = Brand.objects.create(name='Eval Brand')
+        floral = Category.objects.create(name='Floral')
+        woody = Category.objects.create(name='Woody')
+        rows = [('rose jasmine peony', floral), ('rose jasmine lily', floral),
+                ('cedar vetiver smoke', woody), ('cedar vetiver leather', woody),
+                ('vanilla amber musk', woody), ('iris violet powder', floral)]
+        for i, (description, category) in enumerate(rows):
+            Product.objects.create(name=f'Eval {i}', brand=brand, category=category,
+                                   price=10, description=description)
+        self.products = list(Product.objects.select_related('brand', 'category').order_by('id'))
+        self.model = _tiny_model(self.products)
+
+    def test_context_is_built_without_queries(self):
+        from shop import evaluation
+        with self.assertNumQueries(0):
+            ctx = evaluation.build_context(self.model, self.products, self.QUERIES)
+        self.assertEqual(len(ctx['ranked']), 2)
+        relevant = {ctx['products'][i]['pk'] for i in evaluation.relevant_rows(ctx, 0)}
+        self.assertEqual(relevant, {p.pk for p in self.products if p.category.name == 'Floral'})
+
+    def test_sparse_gold_standard_matches_substring_rules(self):
+        from shop import evaluation
+        rows = [
+            {'pk': 1, 'category': 'floral', 'text': 'primrose, lily'},
+            {'pk': 2, 'category': 'woody',  'text': 'cedarwood smoke'},
+            {'pk': 3, 'category': 'fresh',  'text': 'sea salt, orange blossom'},
+            {'pk': 4, 'category': '',       'text': ''},
+        ]
+        queries = [('q1', 'floral', ['Rose']), ('q2', 'citrus', ['cedar', 'salt']),
+                   ('q3', 'aromatic', ['orange blossom']), ('q4', 'woodland', ['oud'])]
+        gold = evaluation.gold_standard(rows, queries)
+        self.assertEqual([{rows[i]['pk'] for i in gold[q].indices} for q in range(4)],
+                         [{1}, {2, 3}, {3}, {2}])
+
+        words = evaluation.note_incidence([r['text'] for r in rows], ['cedar', 'smoke'],
+                                          exact=True)
+        self.assertEqual(words.toarray().tolist(), [[0, 0], [0, 1], [0, 0], [0, 0]])
+
+    def test_metrics_share_query_results(self):
+        from shop import evaluation
+        ctx = evaluation.build_context(self.model, self.products, self.QUERIES)
+        with patch('shop.recommender.get_pks_by_query') as single:
+            results = evaluation.run(ctx)
+        single.assert_not_called()
+        self.assertEqual(results['hit_rate_mrr']['hit_rate']['1'], 1.0)
+        self.assertEqual(results['note_drift']['mean_drift'], 0.0)
+        self.assertEqual(results['coverage']['total_products'], 6)
+        self.assertTrue(results['svd_components']['comparison'])
+
+    def test_svd_sweep_fits_once_for_all_ranks(self):
+        from sklearn.decomposition import TruncatedSVD
+        from shop import evaluation
+        ctx = evaluation.build_context(self.model, self.products, self.QUERIES)
+        with patch.object(evaluation, 'SVD_SIZES', (1, 2, 3)), \
+                patch.object(TruncatedSVD, 'fit_transform', autospec=True,
+                             side_effect=TruncatedSVD.fit_transform) as fit:
+            comparison = evaluation.run(ctx)['svd_components']['comparison']
+        self.assertEqual(fit.call_count, 1)
+        self.assertEqual([e['n_components'] for e in comparison], [1, 2, 3, 4])
+        explained = [e['explained_variance'] for e in comparison]
+        self.assertEqual(explained, sorted(explained))
+
+    def test_process_pool_matches_sequential_run(self):
+        from shop import evaluation
+        sequential = evaluation.run(
+            evaluation.build_context(self.model, self.products, self.QUERIES), workers=1)
+        parallel = evaluation.run(
+            evaluation.build_context(self.model, self.products, self.QUERIES), workers=3)
+        sequential.pop('timings')
+        self.assertEqual(set(parallel.pop('timings')), set(evaluation.METRICS)
+                         | {f'svd_components:{e["n_components"]}'
+                            for e in sequential['svd_components']['comparison']})
+        self.assertEqual(parallel, sequential)
+
+    def test_command_runs_in_process_by_default(self):
+        from shop.management.commands.evaluate_recommender import Command
+        options = Command().create_parser('manage.py', 'evaluate_recommender').parse_args([])
+        self.assertEqual(options.workers, 1)
+
+
+@skipUnless(importlib.util.find_spec('sklearn'), 'scikit-learn is not installed')
+class ListDiversityTests(TestCase):
+    """ILS, разнообразие, новизна и MMR-переранжирование в shop/recommender.py."""
+
+    def setUp(self):
+        import numpy as np
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(30, 5))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors[3] = 0  # товар без признаков
+        self.model = {'shop_reduced_norm': vectors, 'product_pks': list(range(100, 130))}
+
+    def test_blocked_ils_matches_pairwise_mean(self):
+        import numpy as np
+        from shop import recommender
+        lists = [[100, 101, 102, 103], [110, 111], [120], [], [125, 999, 126, 127, 128]]
+        with patch.object(recommender, 'LIST_BLOCK', 2):
+            ils = recommender.intra_list_similarity(lists, self.model)
+
+        norm = self.model['shop_reduced_norm']
+        for pks, value in zip(lists, ils):
+            rows = [pk - 100 for pk in pks if pk != 999]
+            if len(rows) < 2:
+                self.assertTrue(np.isnan(value))
+                continue
+            sims = norm[rows] @ norm[rows].T
+            self.assertAlmostEqual(value, sims[np.triu_indices(len(rows), 1)].mean())
+        np.testing.assert_allclose(recommender.diversity(lists[:2], self.model), 1 - ils[:2])
+
+    def test_novelty_rewards_rarely_sold_products(self):
+        from shop import recommender
+        popularity = {100: 50, 101: 50}
+        popular, rare, empty = recommender.novelty([[100, 101], [120, 121], []], popularity, 30)
+        self.assertLess(popular, rare)
+        self.assertAlmostEqual(rare, math.log2(130))
+        self.assertTrue(math.isnan(empty))
+
+    def test_rerank_diverse_skips_near_duplicates(self):
+        from shop import recommender
+        norm = self.model['shop_reduced_norm']
+        norm[1] = norm[0]  # 101 — копия 100
+        pairs = [(100, 0.9), (101, 0.89), (102, 0.5)]
+        self.assertEqual(recommender.rerank_diverse(pairs, self.model, top_n=2, weight=0),
+                         pairs[:2])
+        self.assertEqual([pk for pk, _ in recommender.rerank_diverse(pairs, self.model, 2,
+                                                                      weight=0.5)],
+                         [100, 102])
+
+
+@skipUnless(importlib.util.find_spec('sklearn'), 'scikit-learn is not installed')
+class QueryLogReplayTests(TestCase):
+    """evaluate_recommender --replay: потоковый прогон журнала и overlap@k."""
+
+    def setUp(self):
+        brand = Brand.objects.create(name='Replay Brand')
+        category = Category.objects.create(name='Replay Category')
+        descriptions = ['rose jasmine peony', 'rose jasmine lily', 'cedar vetiver smoke',
+                        'cedar vetiver leather', 'vanilla amber musk', 'iris violet powder']
+        products = [Product.objects.create(name=f'Replay {i}', brand=brand, category=category,
+                                           price=10, description=d)
+                    for i, d in enumerate(descriptions)]
+        self.model = _tiny_model(products)
+        # Кандидат с перевёрнутым порядком товаров — выдача расходится
+        self.shuffled = dict(self.model, product_pks=self.model['product_pks'][::-1])
+        self.dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.log = self.dir / 'queries.jsonl'
+        lines = [json.dumps({'q': q}) for q in ('rose', 'cedar smoke', 'vanilla', 'iris')]
+        lines += ['not json', json.dumps({'q': ''}), json.dumps({'query': 'jasmine'}), '']
+        self.log.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    def test_log_is_streamed_in_batches(self):
+        from shop import evaluation
+        stats = {}
+        batches = list(evaluation.iter_query_log(self.log, batch_size=2, stats=stats))
+        self.assertEqual(batches, [['rose', 'cedar smoke'], ['vanilla', 'iris'], ['jasmine']])
+        self.assertEqual(stats, {'lines': 7, 'queries': 5, 'skipped': 2})
+        self.assertEqual(list(evaluation.iter_query_log(self.log, limit=3)),
+                         [['rose', 'cedar smoke', 'vanilla']])
+
+    def test_same_model_is_fully_stable(self):
+        from shop import evaluation
+        report = evaluation.replay(self.log, self.model, dict(self.model), k=3, batch_size=2)
+        self.assertEqual(report['log']['queries'], 5)
+        self.assertEqual(report['overlap']['mean'], 1.0)
+        self.assertEqual(report['overlap']['top1_agreement'], 1.0)
+        # Пачки меньше выборки замеряются целиком: по одному замеру на запрос
+        self.assertEqual(report['latency']['candidate']['single_ms']['n'], 5)
+        self.assertEqual(report['latency']['candidate']['batch_ms_per_query']['n'], 3)
+
+    def test_single_latency_is_sampled_across_large_batches(self):
+        from shop import evaluation
+        batch = [f'q{i}' for i in range(100)]
+        sample = evaluation._single_sample(batch, size=10)
+        self.assertEqual(len(sample), 10)
+        self.assertEqual(sample[0], 'q0')
+        self.assertEqual(sample[-1], 'q90')
+        self.assertEqual(evaluation._single_sample(batch[:4], size=10), batch[:4])
+
+    def test_overlap_gate_rejects_diverging_candidate(self):
+        import pickle
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from shop import recommender
+        from shop.management.commands import evaluate_recommender as command
+
+        candidate = self.dir / 'candidate.pkl'
+        candidate.write_bytes(pickle.dumps(dict(self.shuffled, _version=recommender.MODEL_VERSION)))
+        with patch('shop.recommender.load_model', return_value=self.model), \
+                patch.object(command, 'RESULTS_DIR', self.dir), \
+                patch.object(command, 'REPLAY_FILE', self.dir / 'replay.json'):
+            with self.assertRaisesMessage(CommandError, 'ниже порога'):
+                call_command('evaluate_recommender', '--replay', str(self.log),
+                             '--candidate', str(candidate), '--k', '2',
+                             '--min-overlap', '0.99', stdout=io.StringIO())
+        report = json.loads((self.dir / 'replay.json').read_text(encoding='utf-8'))
+        self.assertLess(report['overlap']['mean'], 0.99)
+        self.assertEqual(len(report['overlap']['worst']), 5)
+
+
+class QueryBudgetMixin:
+    """
+    Число SQL-запросов представления не должно зависеть от размера каталога
+    или корзины. assertQueriesStable выполняет запрос при каждом размере
+    фикстуры и сравнивает количества; при расхождении в сообщение попадают
+    самые медленные запросы.
+    """
+
+    SLOWEST = 5
+
+    def count_queries(self, request):
+        cache.clear()
+        discounts.invalidate()
+        with CaptureQueriesContext(connection) as ctx:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        return ctx.captured_queries
+
+    @staticmethod
+    def slowest_queries(captured, n=SLOWEST) -> str:
+        ordered = sorted(captured, key=lambda q: float(q['time']), reverse=True)
+        return '\n'.join(f'  {float(q["time"]) * 1000:8.3f} ms  {q["sql"][:200]}'
+                         for q in ordered[:n])
+
+    def assertQueriesStable(self, label, grow, request, sizes=(1, 10)):
+        """grow(size) готовит фикстуру заданного размера, request() выполняет запрос."""
+        counts = {}
+        for size in sizes:
+            grow(size)
+            captured = self.count_queries(request)
+            counts[size] = len(captured)
+        if len(set(counts.values())) > 1:
+            self.fail(f'{label}: число запросов растёт с размером {counts}\n'
+                      f'Самые медленные запросы (размер {size}):\n'
+                      f'{self.slowest_queries(captured)}')
+        return counts[sizes[-1]]
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Бюджет запросов для представлений каталога, корзины и заказа."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', password='pw')
+        self.brands = [Brand.objects.create(name=f'Budget Brand {i}') for i in range(3)]
+        self.category = Category.objects.create(name='Budget Category')
+        self.products = []
+        now = timezone.now()
+        self.discount = Discount.objects.create(
+            discount_type='product', value_type='percentage', value=10,
+            start_date=now - timezone.timedelta(days=1), end_date=now + timezone.timedelta(days=1))
+        self.discount.brands.add(self.brands[0])
+
+    def _grow_catalogue(self, size):
+        while len(self.products) < size:
+            i = len(self.products)
+            self.products.append(Product.objects.create(
+                name=f'Budget {i:03d}', brand=self.brands[i % 3], category=self.category,
+                price=10 + i, stock=100, volume=100))
+
+    def _fill_cart(self, size):
+        self._grow_catalogue(size)
+        session = self.client.session
+        session['cart'] = {str(p.pk): 1 for p in self.products[:size]}
+        session.save()
+
+    def test_product_list(self):
+        self.assertQueriesStable('product_list', self._grow_catalogue,
+                                 lambda: self.client.get(reverse('product_list')), sizes=(2, 30))
+
+    def test_product_list_keyset(self):
+        with override_settings(SHOP_KEYSET_PAGINATION=True):
+            self.assertQueriesStable('product_list (keyset)', self._grow_catalogue,
+                                     lambda: self.client.get(reverse('product_list')),
+                                     sizes=(2, 30))
+
+    def test_product_detail_similar(self):
+        def grow(size):
+            self._grow_catalogue(size + 1)
+            self.similar = [(p.pk, 0.5) for p in self.products[1:size + 1]]
+
+        with patch('shop.recommendations.similar_pairs', side_effect=lambda pk, n: self.similar):
+            self.assertQueriesStable(
+                'product_detail', grow,
+                lambda: self.client.get(reverse('product_detail', args=[self.products[0].pk])))
+
+    def test_recommend_results(self):
+        def grow(size):
+            self._grow_catalogue(size)
+            self.pairs = [(p.pk, 0.5) for p in self.products[:size]]
+
+        with patch('shop.recommendations.query_pairs', side_effect=lambda q, n: (self.pairs, None)):
+            self.assertQueriesStable('recommend', grow,
+                                     lambda: self.client.get(reverse('recommend'), {'q': 'rose'}))
+
+    def test_search_results(self):
+        def grow(size):
+            self._grow_catalogue(size)
+            self.hits = [(p.pk, 1.0) for p in self.products[:size]]
+
+        with patch('shop.search.search_pks', side_effect=lambda q, limit: self.hits):
+            self.assertQueriesStable('search', grow,
+                                     lambda: self.client.get(reverse('search'), {'q': 'budget'}))
+
+    def test_cart(self):
+        self.assertQueriesStable('cart', self._fill_cart,
+                                 lambda: self.client.get(reverse('cart')))
+
+    def test_budget_covers_brand_discount(self):
+        self._fill_cart(3)
+        items = self.client.get(reverse('cart')).context['cart_items']
+        applied = {item['product'].brand_id: item['discount'] for item in items}
+        self.assertEqual(applied[self.brands[0].pk], self.discount)
+        self.assertIsNone(applied[self.brands[1].pk])
+
+    def test_checkout(self):
+        self.client.force_login(self.user)
+        self.assertQueriesStable('checkout', self._fill_cart,
+                                 lambda: self.client.post(reverse('checkout')))
+
+    def test_manage_products(self):
+        sellers = Group.objects.create(name='Sellers')
+        self.user.groups.add(sellers)
+        self.client.force_login(self.user)
+        self.assertQueriesStable('manage_products', self._grow_catalogue,
+                                 lambda: self.client.get(reverse('manage_products')),
+                                 sizes=(2, 30))
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Выборочное профилирование запросов и сводка profile_report."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        patcher = override_settings(SHOP_PROFILE_DIR=self.dir, SHOP_PROFILE_TOKEN='secret',
+                                    SHOP_PROFILE_SAMPLE_RATE=0.0, SHOP_PROFILE_MAX_RECORDS=3)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        brand = Brand.objects.create(name='Profile Brand')
+        category = Category.objects.create(name='Profile Category')
+        self.product = Product.objects.create(name='Profile Scent', brand=brand,
+                                              category=category, price=10)
+
+    def test_requests_without_token_are_not_profiled(self):
+        response = self.client.get(reverse('product_list'), headers={'X-Shop-Profile': 'wrong'})
+        self.assertNotIn('X-Shop-Profile-Id', response)
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    def test_profile_captures_sql_and_stages(self):
+        def scored(query, top_n):
+            with metrics.timer('score'):
+                return [(self.product.pk, 0.5)], None
+
+        with patch('shop.recommendations.query_pairs', side_effect=scored):
+            response = self.client.get(reverse('recommend'), {'q': 'rose'},
+                                       headers={'X-Shop-Profile': 'secret'})
+        record_id = response['X-Shop-Profile-Id']
+        self.assertTrue((self.dir / f'{record_id}.prof').exists())
+        meta = json.loads((self.dir / f'{record_id}.json').read_text())
+        self.assertEqual((meta['path'], meta['status']), ('/recommend/', 200))
+        self.assertTrue(any('shop_product' in q['sql'] for q in meta['sql']))
+        self.assertEqual([s['stage'] for s in meta['stages']], ['score', 'fetch'])
+
+    def test_disabled_profiling_removes_middleware(self):
+        from django.core.exceptions import MiddlewareNotUsed
+        from shop.profiling import ProfilingMiddleware
+        with override_settings(SHOP_PROFILE_TOKEN=None, SHOP_PROFILE_SAMPLE_RATE=0.0):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_async_chain_stays_async(self):
+        from asgiref.sync import iscoroutinefunction
+        from shop.profiling import ProfilingMiddleware
+
+        async def view(request):
+            return None
+
+        self.assertTrue(iscoroutinefunction(ProfilingMiddleware(view)))
+
+    async def test_async_request_is_profiled(self):
+        response = await self.async_client.get(
+            reverse('product_detail', args=[self.product.pk]),
+            headers={'X-Shop-Profile': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        record_id = response['X-Shop-Profile-Id']
+        meta = json.loads((self.dir / f'{record_id}.json').read_text())
+        self.assertTrue(any('shop_product' in q['sql'] for q in meta['sql']))
+
+    def test_store_rotates_old_records(self):
+        for _ in range(5):
+            self.client.get(reverse('product_list'), headers={'X-Shop-Profile': 'secret'})
+        self.assertEqual(len(list(self.dir.glob('*.json'))), 3)
+        self.assertEqual(len(list(self.dir.glob('*.prof'))), 3)
+
+    def test_profile_report_aggregates_window(self):
+        from django.core.management import call_command
+
+        self.client.get(reverse('product_list'), headers={'X-Shop-Profile': 'secret'})
+        self.client.get(reverse('product_list'), headers={'X-Shop-Profile': 'secret'})
+        out = io.StringIO()
+        call_command('profile_report', '--since', '5m', stdout=out)
+        report = out.getvalue()
+        self.assertIn('ПРОФИЛИ ЗАПРОСОВ: 2', report)
+        self.assertIn('GET /', report)
+        self.assertIn('ncalls', report)
+        self.assertIn('shop_product', report)
+
+
+class StartupImportTests(TestCase):
+    """
+    Запуск Django и manage.py не тянут numpy/pandas/sklearn: тяжёлые
+    зависимости импортируются там, где используются (аудит: python -X importtime).
+    """
+
+    HEAVY = ('numpy', 'pandas', 'sklearn', 'scipy', 'requests')
+
+    # Проверяем отсутствие модулей, а не время: оно зависит от машины
+    PROBE = (
+        'import json, os, sys\n'
+        'loaded = {}\n'
+        'def probe(stage):\n'
+        '    loaded[stage] = [m for m in %r if m in sys.modules]\n'
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'python_shop.settings')\n"
+        'import django\n'
+        'django.setup()\n'
+        "probe('setup')\n"
+        'import python_shop.urls\n'
+        "probe('urls')\n"
+        'from django.core.management import get_commands, load_command_class\n'
+        'for name, app in get_commands().items():\n'
+        '    load_command_class(app, name)\n'
+        "probe('commands')\n"
+        'print(json.dumps(loaded))\n'
+    )
+
+    def _run(self, *args):
+        import subprocess
+        import sys
+        from django.conf import settings
+        result = subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result
+
+    def test_startup_and_commands_skip_heavy_imports(self):
+        out = self._run('-c', self.PROBE % (self.HEAVY,)).stdout
+        report = json.loads(out.strip().splitlines()[-1])
+        self.assertEqual(report, {'setup': [], 'urls': [], 'commands': []})
+
+    def test_manage_help_skips_heavy_imports(self):
+        # -X importtime печатает в stderr каждый импортированный модуль
+        result = self._run('-X', 'importtime', 'manage.py', 'help')
+        self.assertIn('train_recommender', result.stdout)
+        imported = {line.rsplit('|', 1)[-1].strip().split('.')[0]
+                    for line in result.stderr.splitlines() if line.startswith('import time:')}
+        self.assertIn('django', imported)
+        self.assertEqual(imported & set(self.HEAVY), set())
@@ -4,7 +4,7 @@ URL configuration for the shop application.
 This module defines the URL patterns for the shop application, mapping URLs to views for handling product listings, cart operations, user registration, and order processing.
 """
 from django.urls import path
-from . import views
+from . import api, views
 
 # Define URL patterns for routing requests to views.
 urlpatterns = [
@@ -26,4 +26,14 @@ urlpatterns = [
     path('order_success/', views.order_success, name='order_success'),
     # Route requests to the notes recommendation page.
     path('recommend/', views.recommend, name='recommend'),
+    # Route requests to the JSON autocomplete for the recommendation box.
+    path('recommend/autocomplete/', views.recommend_autocomplete, name='recommend_autocomplete'),
+    # Route requests to the Prometheus metrics of the recommender.
+    path('metrics', views.metrics_view, name='metrics'),
+    # Route requests to the full-text product search.
+    path('search/', views.search, name='search'),
+    # Route requests to the JSON recommendation API.
+    path('api/recommend', api.recommend, name='api_recommend'),
+    path('api/recommend/batch', api.batch, name='api_recommend_batch'),
+    path('api/similar/<int:pk>', api.similar, name='api_similar'),
 ]
\ No newline at end of file
@@ -1,20 +1,33 @@
 """
 Views for the shop application.
 """
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.paginator import Paginator
-from django.db.models import F, Q
-from django.utils import timezone
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from .models import Product, Order, OrderItem, Discount
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+from .models import Product, Order, OrderItem
 from .filters import ProductFilter
+from .pagination import KeysetPaginator
+from . import caching, discounts, metrics, recommendations
+from .context_processors import group_names
 
 
 def is_seller(user):
-    return user.groups.filter(name='Sellers').exists()
+    return 'Sellers' in group_names(user)
 
 
 def register(request):
@@ -29,16 +42,113 @@ def register(request):
     return render(request, 'shop/register.html', {'form': form})
 
 
+PRODUCTS_PER_PAGE = 25
+SEARCH_LIMIT      = 50
+
+
+# ─────────────────────────────────────────────────────
+# Условные GET (ETag / Last-Modified)
+# ─────────────────────────────────────────────────────
+
+def _etag(*parts) -> str:
+    return hashlib.md5('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _viewer_state(request):
+    """
+    Часть ETag, зависящая от посетителя (шапка сайта), либо None,
+    если есть непоказанные flash-сообщения — такую страницу не кэшируем.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    user = request.user
+    if not user.is_authenticated:
+        return 'anon'
+    return f'{user.pk}:{user.username}:{",".join(sorted(group_names(user)))}'
+
+
+def _product_list_etag(request):
+    """
+    Каталог: посетитель, версия каталога (растёт при сохранении и удалении
+    товаров, брендов и категорий — signals.py) и строка запроса. Без
+    запросов к товарам: COUNT/MAX по всему набору здесь не нужны.
+    """
+    viewer = _viewer_state(request)
+    if viewer is None:
+        return None
+    return _etag('list', viewer, caching.catalogue_version(), request.GET.urlencode())
+
+
+def _similar_tag() -> str:
+    """Версия модели для ETag карточки (блок «похожие товары»)."""
+    try:
+        from shop.recommender import model_tag
+        return model_tag()
+    except ImportError:
+        return 'none'
+
+
+def _product_detail_etag(request, pk):
+    viewer = _viewer_state(request)
+    if viewer is None:
+        return None
+    row = Product.objects.filter(pk=pk) \
+        .values('updated_at', 'stock', 'brand_id', 'category_id').first()
+    if row is None:
+        return None
+    discount = get_product_discount(
+        Product(pk=pk, brand_id=row['brand_id'], category_id=row['category_id'])
+    )
+    # stock — отдельно: оформление заказа списывает остаток через
+    # queryset.update(), который не меняет updated_at
+    return _etag('detail', viewer, pk, row['updated_at'], row['stock'],
+                 caching.catalogue_version(),
+                 discount and (discount.pk, discount.value, discount.value_type),
+                 _similar_tag())
+
+
+def _async_condition(etag_func):
+    """
+    @condition для async-представлений: etag_func обращается к БД, поэтому
+    выполняется через sync_to_async, а не прямо в event loop.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
+@condition(etag_func=_product_list_etag)
 def product_list(request):
-    queryset = Product.objects.select_related('brand', 'category').order_by('brand__name', 'name')
+    queryset = Product.objects.select_related('brand', 'category').order_by('brand__name', 'name', 'id')
     product_filter = ProductFilter(request.GET, queryset=queryset)
-    paginator = Paginator(product_filter.qs, 25)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    filter_key = caching.filter_key(request.GET)
+    if getattr(settings, 'SHOP_KEYSET_PAGINATION', False) or 'cursor' in request.GET:
+        paginator = KeysetPaginator(product_filter.qs, PRODUCTS_PER_PAGE,
+                                    count_key=filter_key)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+        is_paginated = page_obj.has_other_pages()
+    else:
+        paginator = Paginator(product_filter.qs, PRODUCTS_PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        is_paginated = paginator.num_pages > 1
+    caching.annotate_card_versions(page_obj)
     return render(request, 'shop/product_list.html', {
         'products': page_obj,
         'filter': product_filter,
-        'is_paginated': paginator.num_pages > 1,
+        'is_paginated': is_paginated,
         'page_obj': page_obj,
+        'catalogue_version': caching.catalogue_version(),
+        'filter_key': filter_key,
     })
 
 
@@ -58,6 +168,15 @@ def _attach_ingredients_list(product):
     return product
 
 
+def _pair_products(pairs, products) -> list[dict]:
+    """Упорядочивает загруженные товары по [(pk, score), …] и переводит score в %."""
+    by_pk = {p.pk: p for p in products}
+    return [
+        {'product': by_pk[pk], 'score': round(score * 100, 1)}
+        for pk, score in pairs if pk in by_pk
+    ]
+
+
 def _pks_to_products(pairs: list[tuple[int, float]]) -> list[dict]:
     """
     Принимает [(pk, score), …], загружает Product объекты одним запросом.
@@ -65,87 +184,118 @@ def _pks_to_products(pairs: list[tuple[int, float]]) -> list[dict]:
     """
     if not pairs:
         return []
-    pk_list   = [pk for pk, _ in pairs]
-    score_map = {pk: round(s * 100, 1) for pk, s in pairs}
-    qs        = Product.objects.select_related('brand', 'category').filter(pk__in=pk_list)
-    by_pk     = {p.pk: p for p in qs}
-    return [
-        {'product': by_pk[pk], 'score': score_map[pk]}
-        for pk in pk_list if pk in by_pk
-    ]
+    qs = Product.objects.select_related('brand', 'category').filter(pk__in=[pk for pk, _ in pairs])
+    with metrics.timer('fetch'):
+        return _pair_products(pairs, qs)
 
 
-def _load_model_safe():
-    """Возвращает (model, error_str). model=None при любой проблеме."""
-    try:
-        from shop.recommender import load_model
-        model = load_model()
-        if model is None:
-            return None, (
-                'Модель не обучена или устарела. '
-                'Запустите: python manage.py train_recommender'
-            )
-        return model, None
-    except ImportError:
-        return None, 'Установите scikit-learn: pip install scikit-learn --timeout 120'
-    except Exception as e:
-        return None, f'Ошибка загрузки модели: {e}'
+async def _apks_to_products(pairs: list[tuple[int, float]]) -> list[dict]:
+    """Асинхронный вариант _pks_to_products (async ORM)."""
+    if not pairs:
+        return []
+    qs = Product.objects.select_related('brand', 'category').filter(pk__in=[pk for pk, _ in pairs])
+    with metrics.timer('fetch'):
+        return _pair_products(pairs, [p async for p in qs])
 
 
-def _load_similar_products(product_pk: int, top_n: int = 6) -> list:
-    model, _ = _load_model_safe()
-    if model is None:
-        return []
+# Подсчёт рекомендаций — CPU-работа (numpy освобождает GIL), её выносим
+# в пул потоков, чтобы не занимать event loop и поток с подключением к БД.
+_score_in_pool = sync_to_async(thread_sensitive=False)
+
+
+async def _aget_product(pk):
+    """(product, final_price); скидка берётся из снимка (discounts.py)."""
     try:
-        from shop.recommender import get_similar_pks
-        return _pks_to_products(get_similar_pks(product_pk, model, top_n=top_n))
-    except Exception:
-        return []
+        product = await Product.objects.select_related('brand', 'category').aget(pk=pk)
+    except Product.DoesNotExist:
+        raise Http404('No Product matches the given query.')
+    _attach_ingredients_list(product)
+    discount = await sync_to_async(get_product_discount)(product)
+    return product, discount_price(product.price, discount)
 
 
 # ─────────────────────────────────────────────────────
 # Views
 # ─────────────────────────────────────────────────────
 
-def product_detail(request, pk):
-    product = get_object_or_404(
-        Product.objects.select_related('brand', 'category'), pk=pk
+@metrics.server_timing
+@_async_condition(_product_detail_etag)
+async def product_detail(request, pk):
+    # Товар со скидкой и подбор похожих считаются одновременно:
+    # похожим нужен только pk, а не загруженный товар.
+    (product, final_price), pairs = await asyncio.gather(
+        _aget_product(pk),
+        _score_in_pool(recommendations.similar_pairs)(pk, 6),
     )
-    _attach_ingredients_list(product)
-    discount    = get_product_discount(product)
-    final_price = discount_price(product.price, discount)
-    similar     = _load_similar_products(product.pk, top_n=6)
+    similar = await _apks_to_products(pairs)
 
-    return render(request, 'shop/product_detail.html', {
+    return await sync_to_async(render)(request, 'shop/product_detail.html', {
         'product':     product,
         'final_price': final_price,
         'similar':     similar,
     })
 
 
-def recommend(request):
+@metrics.server_timing
+async def recommend(request):
     query   = request.GET.get('q', '').strip()
     results = []
     error   = None
 
     if query:
-        model, error = _load_model_safe()
-        if model is not None:
-            try:
-                from shop.recommender import get_pks_by_query
-                top_n   = min(int(request.GET.get('top_n', 12)), 50)
-                pairs   = get_pks_by_query(query, model, top_n=top_n)
-                results = _pks_to_products(pairs)
-            except Exception as e:
-                error = f'Ошибка поиска: {e}'
-
-    return render(request, 'shop/recommend.html', {
+        try:
+            top_n = min(int(request.GET.get('top_n', 12)), 50)
+            pairs, error = await _score_in_pool(recommendations.query_pairs)(query, top_n)
+            results = await _apks_to_products(pairs)
+        except Exception as e:
+            error = f'Ошибка поиска: {e}'
+
+    # render() обращается к request.user (сессия, группы) — это синхронный ORM
+    return await sync_to_async(render)(request, 'shop/recommend.html', {
         'query':   query,
         'results': results,
         'error':   error,
     })
 
 
+def metrics_view(request):
+    """
+    Метрики рекомендаций этого процесса в формате Prometheus.
+    Доступны только при SHOP_METRICS_ENABLED и только staff-пользователям
+    или адресам из SHOP_METRICS_ALLOWED_IPS; остальным — 404.
+    """
+    if not getattr(settings, 'SHOP_METRICS_ENABLED', False):
+        raise Http404
+    allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'SHOP_METRICS_ALLOWED_IPS', ())
+    if not (allowed or request.user.is_staff):
+        raise Http404
+    return HttpResponse(metrics.render_prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def recommend_autocomplete(request):
+    """JSON-подсказки для поля /recommend/: ?q=<префикс>&limit=<n>."""
+    from shop.autocomplete import suggest
+    query = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    return JsonResponse({'query': query, 'suggestions': suggest(query, limit)})
+
+
+def search(request):
+    query   = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        from shop.search import search_pks
+        results = _pks_to_products(search_pks(query, limit=SEARCH_LIMIT))
+    return render(request, 'shop/search.html', {
+        'query':   query,
+        'results': results,
+    })
+
+
 def add_to_cart(request, pk):
     product = get_object_or_404(Product, pk=pk)
     if product.stock < 1:
@@ -162,8 +312,14 @@ def cart(request):
     cart_session = request.session.get('cart', {})
     cart_items   = []
     total        = 0
-    for pk, qty in cart_session.items():
-        product = Product.objects.get(pk=pk)
+    products     = Product.objects.in_bulk([int(pk) for pk in cart_session])
+    for pk, qty in list(cart_session.items()):
+        product = products.get(int(pk))
+        if product is None:
+            # Товар удалён из каталога, пока лежал в корзине
+            del cart_session[pk]
+            request.session['cart'] = cart_session
+            continue
         if product.stock < qty:
             cart_session[str(pk)] = product.stock
             request.session['cart'] = cart_session
@@ -182,6 +338,7 @@ def cart(request):
             discount_val = apply_promo_code(promo_code, total, cart_items)
             if discount_val:
                 final_total -= discount_val
+                request.session['promo_code'] = promo_code
                 messages.success(request, f"Promo code {promo_code} applied!")
             else:
                 messages.error(request, "Invalid or expired promo code.")
@@ -189,32 +346,108 @@ def cart(request):
                   {'cart_items': cart_items, 'total': total, 'final_total': final_total})
 
 
+class _OutOfStock(Exception):
+    """Товара не хватает на складе — транзакция оформления откатывается."""
+
+    def __init__(self, name=None):
+        super().__init__(name)
+        self.name = name
+
+
+class _PromoUnavailable(Exception):
+    """Промокод исчерпан или истёк к моменту оформления заказа."""
+
+
+def _reserve_stock(quantities: dict[int, int], products: dict, attempts: int = 2):
+    """
+    Списывает остатки всех позиций одним условным UPDATE.
+
+    Если UPDATE не прошёл, а при повторном чтении нехватки уже нет (склад
+    пополнили между запросами), списание повторяется; после исчерпания
+    попыток — _OutOfStock без названия товара.
+    """
+    needed = Case(*[When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()],
+                  output_field=IntegerField())
+    for _ in range(attempts):
+        try:
+            # Точка сохранения: при нехватке частичное списание откатывается,
+            # и остатки ниже читаются в исходном виде
+            with transaction.atomic():
+                updated = Product.objects.filter(pk__in=list(quantities), stock__gte=needed) \
+                                         .update(stock=F('stock') - needed)
+                if updated < len(quantities):
+                    raise _OutOfStock()
+            return
+        except _OutOfStock:
+            stock = dict(Product.objects.filter(pk__in=list(quantities)).values_list('pk', 'stock'))
+            short = next((pk for pk, qty in quantities.items() if stock.get(pk, 0) < qty), None)
+            if short is not None:
+                raise _OutOfStock(products[short].name)
+    raise _OutOfStock()
+
+
+def _place_order(user, quantities: dict[int, int], promo_code=None):
+    """
+    Создаёт заказ в текущей транзакции.
+
+    Товары загружаются одним запросом, остатки списываются одним условным
+    UPDATE ... SET stock = stock - CASE id … END WHERE stock >= CASE id … END;
+    если обновилось меньше строк, чем позиций, — _OutOfStock (транзакция
+    checkout откатывается). Позиции заказа создаются через bulk_create.
+    Промокод погашается здесь же (discounts.redeem_promo); если он уже
+    недоступен — _PromoUnavailable.
+    """
+    products = Product.objects.in_bulk(list(quantities))
+    for pk in quantities:
+        if pk not in products:
+            raise _OutOfStock(f'#{pk}')
+    _reserve_stock(quantities, products)
+
+    order    = Order.objects.create(user=user, total_price=0)
+    items    = []
+    lines    = []
+    total    = 0
+    for pk, qty in quantities.items():
+        product = products[pk]
+        price  = discount_price(product.price, get_product_discount(product))
+        total += price * qty
+        items.append(OrderItem(order=order, product=product, quantity=qty, price=price))
+        lines.append({'product': product, 'quantity': qty, 'subtotal': price * qty})
+    OrderItem.objects.bulk_create(items)
+
+    order.total_price      = total
+    order.discount_applied = get_order_discount(order) or 0
+    order.promo_code       = None
+    if promo_code:
+        # Один и тот же объект скидки идёт и в расчёт, и в погашение
+        promo     = discounts.find_promo(promo_code)
+        promo_val = promo_discount_value(promo, total, lines)
+        if not promo_val or not discounts.redeem_promo(promo):
+            raise _PromoUnavailable(promo_code)
+        order.discount_applied += promo_val
+        order.promo_code        = promo_code
+    order.save(update_fields=['total_price', 'discount_applied', 'promo_code'])
+    return order
+
+
 @login_required
 def checkout(request):
     cart_session = request.session.get('cart', {})
     if not cart_session:
         messages.error(request, "Your cart is empty.")
         return redirect('product_list')
-    order = Order.objects.create(user=request.user, total_price=0)
-    total = 0
-    for pk, qty in cart_session.items():
-        product = Product.objects.get(pk=pk)
-        if product.stock < qty:
-            messages.error(request, f"Not enough stock for {product.name}.")
-            order.delete()
-            return redirect('cart')
-        discount = get_product_discount(product)
-        price    = discount_price(product.price, discount)
-        OrderItem.objects.create(order=order, product=product, quantity=qty, price=price)
-        product.stock -= qty
-        product.save()
-        total += price * qty
-    order_discount         = get_order_discount(order)
-    order.total_price      = total
-    order.discount_applied = order_discount or 0
-    if request.session.get('promo_code'):
-        order.promo_code = request.session['promo_code']
-    order.save()
+    quantities = {int(pk): qty for pk, qty in cart_session.items()}
+    try:
+        with transaction.atomic():
+            _place_order(request.user, quantities, request.session.get('promo_code'))
+    except _OutOfStock as e:
+        messages.error(request, f"Not enough stock for {e.name}." if e.name
+                                else "Not enough stock for some items.")
+        return redirect('cart')
+    except _PromoUnavailable as e:
+        request.session.pop('promo_code', None)
+        messages.error(request, f"Promo code {e} is no longer available.")
+        return redirect('cart')
     request.session['cart'] = {}
     request.session.pop('promo_code', None)
     messages.success(request, "Order placed successfully!")
@@ -226,22 +459,10 @@ def checkout(request):
 # ─────────────────────────────────────────────────────
 
 def get_product_discount(product):
-    now = timezone.now()
-    discounts = Discount.objects.filter(
-        discount_type='product', start_date__lte=now, end_date__gte=now,
-    ).filter(
-        Q(max_uses__isnull=True) | Q(uses__lt=F('max_uses'))
-    ).filter(
-        Q(products=product) | Q(categories=product.category) | Q(brands=product.brand)
-    )
-    return max(discounts, key=lambda d: d.value, default=None)
+    return discounts.best_product_discount(product)
 
 
 def get_order_discount(cart_items_or_order):
-    now = timezone.now()
-    discounts = Discount.objects.filter(
-        discount_type='order', start_date__lte=now, end_date__gte=now,
-    ).filter(Q(max_uses__isnull=True) | Q(uses__lt=F('max_uses')))
     if isinstance(cart_items_or_order, list):
         total       = sum(i['subtotal'] for i in cart_items_or_order)
         items_count = sum(i['quantity'] for i in cart_items_or_order)
@@ -249,9 +470,8 @@ def get_order_discount(cart_items_or_order):
         total       = cart_items_or_order.total_price
         items_count = cart_items_or_order.orderitem_set.count()
     best, max_val = None, 0
-    for d in discounts:
-        if (d.min_order_value and total < d.min_order_value) or \
-           (d.min_items and items_count < d.min_items):
+    for d in discounts.eligible_order_discounts(total):
+        if d.min_items and items_count < d.min_items:
             continue
         v = d.value if d.value_type == 'fixed' else total * d.value / 100
         if v > max_val:
@@ -260,24 +480,19 @@ def get_order_discount(cart_items_or_order):
 
 
 def apply_promo_code(code, total, cart_items):
-    now = timezone.now()
-    try:
-        d = Discount.objects.filter(
-            code=code, discount_type='promo',
-            start_date__lte=now, end_date__gte=now,
-        ).filter(Q(max_uses__isnull=True) | Q(uses__lt=F('max_uses'))).first()
-        if not d:
-            return None
-        items_count = sum(i['quantity'] for i in cart_items)
-        if (d.min_order_value and total < d.min_order_value) or \
-           (d.min_items and items_count < d.min_items):
-            return None
-        value = d.value if d.value_type == 'fixed' else total * d.value / 100
-        d.uses += 1
-        d.save()
-        return value
-    except Discount.DoesNotExist:
+    """Размер скидки по промокоду; использование учитывается только в checkout."""
+    return promo_discount_value(discounts.find_promo(code), total, cart_items)
+
+
+def promo_discount_value(d, total, cart_items):
+    """Размер скидки по уже найденному промокоду d (None — скидки нет)."""
+    if not d:
+        return None
+    items_count = sum(i['quantity'] for i in cart_items)
+    if (d.min_order_value and total < d.min_order_value) or \
+       (d.min_items and items_count < d.min_items):
         return None
+    return d.value if d.value_type == 'fixed' else total * d.value / 100
 
 
 def discount_price(price, discount):